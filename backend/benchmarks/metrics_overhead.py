@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Costo por request de MetricsMiddleware: la misma app ASGI con y sin el
+middleware, llamada directamente. Reporta la diferencia en microsegundos.
+
+Uso: python -m benchmarks.metrics_overhead [requests]
+"""
+import asyncio
+import sys
+import time
+
+from benchmarks.middleware_stack import endpoint, make_scope, make_channel
+from middleware.metrics import MetricsMiddleware, MetricsRegistry
+
+async def per_request_us(app, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        receive, send = make_channel()
+        await app(make_scope(), receive, send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+async def main(requests: int):
+    registry = MetricsRegistry()
+    apps = {"bare": endpoint, "metrics": MetricsMiddleware(endpoint, registry)}
+    # Best of several rounds, alternating, to keep noise out of the difference
+    best = {name: float("inf") for name in apps}
+    for _ in range(5):
+        for name, app in apps.items():
+            best[name] = min(best[name], await per_request_us(app, requests))
+
+    print(f"bare endpoint       {best['bare']:8.2f} us/request")
+    print(f"with metrics        {best['metrics']:8.2f} us/request")
+    print(f"overhead            {best['metrics'] - best['bare']:8.2f} us/request")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark del stack de middleware solo: BaseHTTPMiddleware (anterior)
+versus ASGI puro (middleware/security.py). Llama a la app ASGI
+directamente, sin red ni cliente HTTP, y reporta req/s y latencias.
+
+Uso: python -m benchmarks.middleware_stack [requests]
+"""
+import asyncio
+import logging
+import statistics
+import sys
+import time
+
+from benchmarks import legacy_middleware as old
+from middleware import security as new
+from middleware.rate_limit import RateLimitPolicy
+
+async def endpoint(scope, receive, send):
+    """Bare ASGI endpoint so only the middleware cost is measured"""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", b"2")]
+    })
+    await send({"type": "http.response.body", "body": b"{}"})
+
+def build_stack(module):
+    # Same order as main.py: the last one added is the outermost
+    app = module.SecurityHeadersMiddleware(endpoint)
+    app = module.RequestLoggingMiddleware(app)
+    app = module.InputValidationMiddleware(app)
+    if module is old:
+        return module.RateLimitMiddleware(app, calls=10 ** 9, period=3600)
+    # Never reject, so both stacks run the same code path
+    return module.RateLimitMiddleware(
+        app, policies=[RateLimitPolicy("default", r"", calls=10 ** 9, period=3600)]
+    )
+
+def make_scope():
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/duo-previa/products",
+        "raw_path": b"/api/duo-previa/products",
+        "root_path": "",
+        "query_string": b"category_id=64b7f0c2e4b0a1a2b3c4d5e6&popular_only=true",
+        "headers": [
+            (b"host", b"localhost"),
+            (b"user-agent", b"bench"),
+            (b"x-forwarded-for", b"10.0.0.1"),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 8000),
+    }
+
+def make_channel():
+    """receive/send pair that behaves like a server: disconnect only after the response"""
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+    response_complete = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            response_complete.set()
+
+    return receive, send
+
+async def run(app, requests: int):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        receive, send = make_channel()
+        t0 = time.perf_counter()
+        await app(make_scope(), receive, send)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50_us": statistics.median(latencies) * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+    }
+
+async def main(requests: int):
+    # Measure middleware work, not log handler I/O
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'stack':<24}{'req/s':>12}{'p50 us':>10}{'p99 us':>10}")
+    for name, module in (("BaseHTTPMiddleware", old), ("pure ASGI", new)):
+        app = build_stack(module)
+        await run(app, min(requests, 500))  # warm-up
+        result = await run(app, requests)
+        print(f"{name:<24}{result['rps']:>12.0f}{result['p50_us']:>10.1f}{result['p99_us']:>10.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
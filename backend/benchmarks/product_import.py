@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Importación masiva de un menú: tiempo de parseo, validación y armado de los
+bulk_write para un CSV y un JSON de N productos. La escritura se reemplaza
+por una colección en memoria; con MongoDB se suma un round trip por lote de
+IMPORT_BATCH_SIZE filas.
+
+Uso: python -m benchmarks.product_import [productos]
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch
+from bson import ObjectId
+
+from services.product_import import ProductImporter, parse_rows
+
+CATEGORIES = ["Pizzas", "Lomitos", "Hamburguesas", "Empanadas", "Bebidas", "Postres"]
+
+class MemoryCollection:
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+        self.round_trips = 0
+
+    def find(self, *args, **kwargs):
+        collection = self
+
+        class Cursor:
+            def sort(self, *args):
+                return self
+
+            def __aiter__(self):
+                return self._iterate()
+
+            async def _iterate(self):
+                for document in collection.documents:
+                    yield document
+
+        return Cursor()
+
+    async def insert_many(self, documents):
+        self.round_trips += 1
+        for document in documents:
+            document["_id"] = ObjectId()
+        self.documents.extend(documents)
+        return SimpleNamespace(inserted_ids=[document["_id"] for document in documents])
+
+    async def bulk_write(self, operations, ordered=True):
+        self.round_trips += 1
+        self.documents.extend(operation._doc for operation in operations)
+        return SimpleNamespace(inserted_count=len(operations))
+
+def rows(products: int):
+    rng = random.Random(42)
+    for i in range(products):
+        yield {
+            "name": f"Producto {i:05d}",
+            "description": "Ingredientes varios, receta de la casa",
+            "price": round(rng.uniform(500, 9000), 2),
+            "category": rng.choice(CATEGORIES),
+            "allergens": "gluten|lactosa" if i % 3 == 0 else "",
+            "is_popular": "true" if i % 10 == 0 else "false"
+        }
+
+def as_csv(products: int) -> bytes:
+    lines = ["name,description,price,category,allergens,is_popular"]
+    for row in rows(products):
+        lines.append(",".join(f'"{value}"' if "," in str(value) else str(value) for value in row.values()))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def as_json(products: int) -> bytes:
+    return json.dumps([
+        {**row, "allergens": row["allergens"].split("|") if row["allergens"] else [], "is_popular": row["is_popular"] == "true"}
+        for row in rows(products)
+    ]).encode("utf-8")
+
+async def chunks(data: bytes, size: int = 64 * 1024):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+async def run(import_format: str, data: bytes):
+    products, categories = MemoryCollection(), MemoryCollection()
+    with patch("services.product_import.get_collection",
+               side_effect=lambda name: products if name == "products" else categories):
+        importer = ProductImporter()
+    restaurant = SimpleNamespace(id=str(ObjectId()))
+    with patch("services.restaurants.restaurant_cache") as cache, patch("services.products.product_search"):
+        async def get(slug):
+            return restaurant
+        cache.get = get
+        started = time.perf_counter()
+        report = await importer.run("duo-previa", parse_rows(import_format, chunks(data)))
+        elapsed = time.perf_counter() - started
+    return report, elapsed, products.round_trips + categories.round_trips
+
+def main(products: int = 2000):
+    for import_format, data in (("csv", as_csv(products)), ("json", as_json(products))):
+        report, elapsed, round_trips = asyncio.run(run(import_format, data))
+        print(
+            f"{import_format}: {report['inserted']}/{products} productos en {elapsed * 1000:.0f} ms "
+            f"({len(data) / 1024:.0f} KiB, {round_trips} escrituras, {report['failed']} errores)"
+        )
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
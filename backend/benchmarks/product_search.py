@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Latencia de búsqueda en el índice en memoria de un tenant: p50/p99 por
+consulta (palabras completas y prefijos de type-ahead) y costo de armar el
+índice.
+
+Uso: python -m benchmarks.product_search [productos]
+"""
+import sys
+import time
+import random
+
+from services.products import SEARCH_FIELDS
+from utils.search import SearchIndex
+
+WORDS = (
+    "pizza muzzarella napolitana fugazza calabresa hamburguesa clásica doble cheddar bacon "
+    "lomito completo jamón queso huevo lechuga tomate papas fritas empanada árabe carne pollo "
+    "verdura humita cebolla ajo albahaca rúcula provolone champiñones palmitos morrón aceitunas"
+).split()
+QUERIES = ["pizza", "clasica", "ham", "lomito comp", "queso", "pap", "empanada arabe", "c", "rucula prov"]
+
+def product(rng: random.Random) -> dict:
+    return {
+        "name": " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(2, 3))),
+        "description": " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 12)))
+    }
+
+def main(products: int = 2000, rounds: int = 200):
+    rng = random.Random(42)
+    documents = [product(rng) for _ in range(products)]
+
+    started = time.perf_counter()
+    index = SearchIndex(SEARCH_FIELDS)
+    for doc_id, document in enumerate(documents):
+        index.add(str(doc_id), document)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    timings = []
+    for _ in range(rounds):
+        for query in QUERIES:
+            started = time.perf_counter()
+            index.search(query, 50)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    print(f"{products} productos, índice armado en {build_ms:.1f} ms")
+    print(f"p50 {timings[len(timings) // 2] * 1000:.3f} ms  p99 {timings[int(len(timings) * 0.99)] * 1000:.3f} ms")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import argparse
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+# Single source of truth for the indexes the services rely on. Names are the
+# pymongo defaults so existing deployments match by name and key.
+INDEX_MANIFEST: Dict[str, List[IndexModel]] = {
+    "restaurants": [
+        IndexModel([("slug", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("is_active", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "users": [
+        IndexModel([("username", ASCENDING), ("restaurant_slug", ASCENDING)], unique=True),
+        IndexModel([("restaurant_slug", ASCENDING)]),
+        IndexModel([("updated_at", ASCENDING)]),
+    ],
+    "products": [
+        # Menu listing: equality on slug/availability, sorted by the (name, _id) page key
+        IndexModel([("restaurant_slug", ASCENDING), ("is_available", ASCENDING), ("name", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([
+            ("restaurant_slug", ASCENDING), ("category_id", ASCENDING), ("is_available", ASCENDING),
+            ("name", ASCENDING), ("_id", ASCENDING)
+        ]),
+        IndexModel([("name", ASCENDING)]),
+    ],
+    "orders": [
+        IndexModel([("order_number", ASCENDING)], unique=True),
+        IndexModel([("restaurant_slug", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("restaurant_slug", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("customer.phone", ASCENDING)]),
+    ],
+    "categories": [
+        IndexModel([("restaurant_slug", ASCENDING), ("display_order", ASCENDING)]),
+    ],
+    "api_keys": [
+        IndexModel([("key_hash", ASCENDING)], unique=True),
+        IndexModel([("restaurant_slug", ASCENDING), ("key_prefix", ASCENDING)]),
+        IndexModel([("restaurant_slug", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    # RATE_LIMIT_BACKEND=mongo: drop drained keys
+    "rate_limits": [
+        IndexModel([("expire_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+# Options that make two indexes with the same key behave differently
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+META_COLLECTION = "schema_meta"
+META_ID = "indexes"
+
+def _key(spec: Dict[str, Any]) -> Tuple:
+    return tuple((field, direction) for field, direction in spec["key"].items())
+
+def _options(spec: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        option: spec[option] for option in INDEX_OPTIONS
+        if spec.get(option) is not None and spec.get(option) is not False
+    }
+
+def manifest_fingerprint(manifest: Dict[str, List[IndexModel]] = INDEX_MANIFEST) -> str:
+    """Stable hash of the manifest; stored after a successful reconciliation"""
+    documents = {
+        collection: sorted(json.dumps(model.document, sort_keys=True, default=str) for model in models)
+        for collection, models in manifest.items()
+    }
+    return hashlib.sha256(json.dumps(documents, sort_keys=True).encode("utf-8")).hexdigest()
+
+def find_redundant(specs: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Plain indexes whose key is a prefix of another index's key: the longer
+    index serves the same queries. Unique/TTL/partial indexes are never
+    reported, their options carry meaning on their own.
+    """
+    redundant = []
+    for spec in specs:
+        key = _key(spec)
+        if spec["name"] == "_id_" or _options(spec):
+            continue
+        for other in specs:
+            other_key = _key(other)
+            if other is not spec and len(other_key) > len(key) and other_key[:len(key)] == key:
+                redundant.append({"index": spec["name"], "covered_by": other["name"]})
+                break
+    return redundant
+
+async def _reconcile_collection(db, collection_name: str, models: List[IndexModel]) -> Dict[str, Any]:
+    collection = db[collection_name]
+    existing = [spec async for spec in collection.list_indexes()]
+    existing_by_key = {_key(spec): spec for spec in existing}
+    wanted_keys = set()
+
+    missing, conflicts = [], []
+    for model in models:
+        wanted = model.document
+        key = _key(wanted)
+        wanted_keys.add(key)
+        current = existing_by_key.get(key)
+        if current is None:
+            missing.append(model)
+        elif _options(current) != _options(wanted):
+            conflicts.append({
+                "index": current["name"],
+                "current": _options(current),
+                "manifest": _options(wanted)
+            })
+
+    created = []
+    if missing:
+        # One createIndexes command builds all missing indexes in a single pass
+        created = await collection.create_indexes(missing)
+
+    report = {
+        "created": created,
+        "conflicts": conflicts,
+        "unmanaged": [spec["name"] for spec in existing if spec["name"] != "_id_" and _key(spec) not in wanted_keys],
+        "redundant": find_redundant(existing + [model.document for model in missing]),
+        "unused": await _unused_indexes(collection)
+    }
+    return report
+
+async def _unused_indexes(collection) -> List[str]:
+    """Indexes with no recorded use since the server (or index) started"""
+    try:
+        stats = await collection.aggregate([{"$indexStats": {}}]).to_list(None)
+    except Exception as e:
+        logger.warning(f"$indexStats unavailable for {collection.name}: {e}")
+        return []
+    return sorted(
+        stat["name"] for stat in stats
+        if stat["name"] != "_id_" and stat.get("accesses", {}).get("ops", 0) == 0
+    )
+
+async def reconcile_indexes(db, manifest: Dict[str, List[IndexModel]] = INDEX_MANIFEST) -> Dict[str, Any]:
+    """
+    Diff the manifest against list_indexes() for every collection (in
+    parallel), create what is missing and record the manifest fingerprint.
+    Nothing is dropped: conflicts, unmanaged, redundant and unused indexes
+    are only reported.
+    """
+    collections = list(manifest)
+    results = await asyncio.gather(
+        *(_reconcile_collection(db, name, manifest[name]) for name in collections),
+        return_exceptions=True
+    )
+
+    report, failed = {}, False
+    for name, result in zip(collections, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error reconciling indexes for {name}: {result}")
+            report[name] = {"error": str(result)}
+            failed = True
+            continue
+        report[name] = result
+        if result["created"]:
+            logger.info(f"Created indexes on {name}: {result['created']}")
+        for key in ("conflicts", "unmanaged", "redundant"):
+            if result[key]:
+                logger.warning(f"Index {key} on {name}: {result[key]}")
+
+    if not failed:
+        await db[META_COLLECTION].update_one(
+            {"_id": META_ID},
+            {"$set": {"fingerprint": manifest_fingerprint(manifest), "applied_at": datetime.utcnow()}},
+            upsert=True
+        )
+    return report
+
+async def _create_missing(db, collection_name: str, models: List[IndexModel]) -> List[str]:
+    existing = {_key(spec) async for spec in db[collection_name].list_indexes()}
+    missing = [model for model in models if _key(model.document) not in existing]
+    return await db[collection_name].create_indexes(missing) if missing else []
+
+async def create_unique_indexes(db, manifest: Dict[str, List[IndexModel]] = INDEX_MANIFEST) -> List[str]:
+    """
+    Create the manifest's missing unique indexes, nothing else. They enforce
+    slug, email, username, order number and API key uniqueness, so no
+    worker serves without them even if the deploy step never ran.
+    """
+    unique = {
+        name: [model for model in models if model.document.get("unique")]
+        for name, models in manifest.items()
+    }
+    results = await asyncio.gather(*(_create_missing(db, name, models) for name, models in unique.items() if models))
+    return [index for created in results for index in created]
+
+async def indexes_up_to_date(db) -> bool:
+    """One read: has this manifest already been applied (by a deploy step)?"""
+    meta = await db[META_COLLECTION].find_one({"_id": META_ID})
+    return bool(meta) and meta.get("fingerprint") == manifest_fingerprint()
+
+async def ensure_indexes(db):
+    """
+    Startup hook. INDEX_RECONCILE=deploy (default) only checks the stored
+    fingerprint, so workers do no index work once `python -m db.indexes` has
+    run for this deployment; until then they create the unique indexes only.
+    INDEX_RECONCILE=startup reconciles when the manifest changed (local
+    development).
+    """
+    try:
+        if await indexes_up_to_date(db):
+            return
+        if os.getenv("INDEX_RECONCILE", "deploy") == "startup":
+            await reconcile_indexes(db)
+        else:
+            created = await create_unique_indexes(db)
+            if created:
+                logger.info(f"Created unique indexes: {created}")
+            logger.warning("Index manifest not applied to this database; run `python -m db.indexes`")
+    except Exception as e:
+        logger.error(f"Error checking indexes: {e}")
+
+async def _main(args) -> int:
+    from dotenv import load_dotenv
+    from db.mongo import database, init_db, close_db
+
+    load_dotenv()
+    await init_db(check_indexes=False)
+    try:
+        if not args.force and await indexes_up_to_date(database.database):
+            print("Index manifest already applied")
+            return 0
+        report = await reconcile_indexes(database.database)
+        print(json.dumps(report, indent=2, default=str))
+        return 1 if any("error" in result or result["conflicts"] for result in report.values()) else 0
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Apply the index manifest (run once per deployment)")
+    parser.add_argument("--force", action="store_true", help="Reconcile even if the manifest fingerprint matches")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
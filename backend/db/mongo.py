@@ -1,8 +1,10 @@
 import os
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from typing import Optional
 import logging
-from utils.converters import to_object_id # Importar to_object_id para create_indexes
+from db.profiler import query_profiler
+from db.indexes import ensure_indexes
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +17,7 @@ database = Database()
 async def get_database():
     return database.database
 
-async def init_db():
+async def init_db(check_indexes: bool = True):
     """Initialize database connection"""
     try:
         # MongoDB connection string
@@ -26,66 +28,35 @@ async def init_db():
         
         database_name = os.getenv("DATABASE_NAME", "food_delivery_multi")
         
+        # Command monitoring: per-collection latency, slow queries, N+1 detection
+        profiling = os.getenv("MONGO_PROFILER", "true").lower() == "true"
+        
         # Create client
         database.client = AsyncIOMotorClient(
             mongodb_url,
             maxPoolSize=10,
             minPoolSize=10,
             serverSelectionTimeoutMS=5000,
+            event_listeners=[query_profiler] if profiling else []
         )
         
         # Get database
         database.database = database.client[database_name]
+        if profiling:
+            query_profiler.attach(database.database, asyncio.get_running_loop())
         
         # Test connection
         await database.client.admin.command('ping')
         logger.info(f"Successfully connected to MongoDB: {database_name}")
         
-        # Create indexes
-        await create_indexes()
+        # Indexes come from db/indexes.py, applied once per deployment
+        if check_indexes:
+            await ensure_indexes(database.database)
         
     except Exception as e:
         logger.error(f"Error connecting to MongoDB: {e}")
         raise
 
-async def create_indexes():
-    """Create database indexes for better performance"""
-    db = database.database
-    
-    try:
-        # Restaurant indexes
-        await db.restaurants.create_index("slug", unique=True)
-        await db.restaurants.create_index("email", unique=True)
-        await db.restaurants.create_index([("is_active", 1), ("created_at", -1)])
-        
-        # User indexes
-        await db.users.create_index("username")
-        await db.users.create_index("restaurant_slug")
-        await db.users.create_index([("username", 1), ("restaurant_slug", 1)], unique=True)
-        
-        # Product indexes
-        await db.products.create_index("restaurant_slug")
-        await db.products.create_index("category_id")
-        await db.products.create_index([("restaurant_slug", 1), ("is_available", 1)])
-        await db.products.create_index([("restaurant_slug", 1), ("is_popular", 1)])
-        await db.products.create_index("name", background=True)  # Text search
-        
-        # Order indexes
-        await db.orders.create_index("restaurant_slug")
-        await db.orders.create_index("order_number", unique=True)
-        await db.orders.create_index([("restaurant_slug", 1), ("status", 1)])
-        await db.orders.create_index([("restaurant_slug", 1), ("created_at", -1)])
-        await db.orders.create_index("customer.phone")
-        
-        # Category indexes
-        await db.categories.create_index("restaurant_slug")
-        await db.categories.create_index([("restaurant_slug", 1), ("display_order", 1)])
-        
-        logger.info("Database indexes created successfully")
-        
-    except Exception as e:
-        logger.error(f"Error creating indexes: {e}")
-
 async def close_db():
     """Close database connection"""
     if database.client:
@@ -0,0 +1,256 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from pymongo import monitoring
+from middleware.metrics import LatencyHistogram, metrics
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Commands worth profiling; handshakes, heartbeats and our own explains are skipped
+PROFILED_COMMANDS = frozenset({
+    "find", "getMore", "aggregate", "count", "distinct",
+    "insert", "update", "delete", "findAndModify"
+})
+EXPLAINABLE_COMMANDS = frozenset({"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"})
+
+# Session/transport fields that cannot be sent inside an explain
+_NON_EXPLAIN_FIELDS = frozenset({
+    "lsid", "txnNumber", "autocommit", "startTransaction", "$clusterTime",
+    "$db", "$readPreference", "readConcern", "writeConcern"
+})
+
+slow_queries_total = metrics.counter(
+    "db_slow_queries_total", "MongoDB commands slower than MONGO_SLOW_QUERY_MS", ("collection", "command")
+)
+query_heavy_requests_total = metrics.counter(
+    "db_query_heavy_requests_total", "Requests flagged for too many or repeated queries", ("route",)
+)
+
+class RequestQueries:
+    """Queries issued while handling one HTTP request"""
+
+    __slots__ = ("correlation_id", "total", "by_operation")
+
+    def __init__(self, correlation_id: str):
+        self.correlation_id = correlation_id
+        self.total = 0
+        self.by_operation: Dict[str, int] = {}
+
+_current_request: ContextVar[Optional[RequestQueries]] = ContextVar("current_request_queries", default=None)
+
+def query_shape(value: Any) -> Any:
+    """Replace literal values with "?" so queries group by structure, not data"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return ["?"]
+    return "?"
+
+def command_shape(command_name: str, command: Dict) -> Dict:
+    if command_name == "find":
+        shape = {"filter": query_shape(command.get("filter", {}))}
+        if command.get("sort"):
+            shape["sort"] = dict(command["sort"])
+        return shape
+    if command_name == "aggregate":
+        return {"pipeline": query_shape(command.get("pipeline", []))}
+    if command_name in ("count", "distinct", "findAndModify"):
+        return {"filter": query_shape(command.get("query", {}))}
+    if command_name == "update":
+        return {"filter": [query_shape(statement.get("q", {})) for statement in command.get("updates", [])[:1]]}
+    if command_name == "delete":
+        return {"filter": [query_shape(statement.get("q", {})) for statement in command.get("deletes", [])[:1]]}
+    return {}
+
+def summarize_plan(explain: Dict) -> str:
+    """Winning plan as a stage chain, e.g. 'FETCH <- IXSCAN(restaurant_slug_1)'"""
+    planner = explain.get("queryPlanner")
+    if planner is None and explain.get("stages"):
+        planner = explain["stages"][0].get("$cursor", {}).get("queryPlanner")
+    plan = (planner or {}).get("winningPlan")
+    stages = []
+    while plan:
+        # Newer servers nest the classic plan under queryPlan
+        plan = plan.get("queryPlan", plan)
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(stages)
+
+class QueryProfiler(monitoring.CommandListener):
+    """
+    pymongo command listener: latency per (collection, command), queries per
+    HTTP request (attributed through a context variable that motor carries
+    into its executor threads), a slow-query log with the query shape and
+    its explain() plan, and flagging of requests that issue too many or
+    repeated queries (N+1 patterns).
+    """
+
+    def __init__(
+        self,
+        slow_ms: Optional[float] = None,
+        request_budget: Optional[int] = None,
+        repeat_threshold: Optional[int] = None,
+        history: int = 50
+    ):
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.getenv("MONGO_SLOW_QUERY_MS", "100"))
+        self.request_budget = request_budget or int(os.getenv("MONGO_REQUEST_QUERY_BUDGET", "10"))
+        self.repeat_threshold = repeat_threshold or int(os.getenv("MONGO_REPEATED_QUERY_THRESHOLD", "5"))
+        self.operations: Dict[tuple, Dict[str, Any]] = {}
+        self.slow_queries: deque = deque(maxlen=history)
+        self.flagged_requests: deque = deque(maxlen=history)
+        self.database = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[tuple, tuple] = {}
+        self._explained = TTLCache(maxsize=256, ttl=600)
+        self._explain_tasks: set = set()
+        self._lock = threading.Lock()
+
+    def attach(self, database, loop: asyncio.AbstractEventLoop):
+        """Database and loop used to run explain() for slow queries"""
+        self.database = database
+        self.loop = loop
+
+    # ---- per-request tracking ----
+
+    def begin_request(self, correlation_id: str) -> RequestQueries:
+        queries = RequestQueries(correlation_id)
+        _current_request.set(queries)
+        return queries
+
+    def end_request(self, queries: RequestQueries, method: str, route: str) -> bool:
+        """Flag the request if it went over budget or repeated an operation"""
+        repeated = {op: count for op, count in queries.by_operation.items() if count >= self.repeat_threshold}
+        if queries.total <= self.request_budget and not repeated:
+            return False
+
+        entry = {
+            "correlation_id": queries.correlation_id,
+            "route": f"{method} {route}",
+            "queries": queries.total,
+            "by_operation": dict(queries.by_operation)
+        }
+        self.flagged_requests.append(entry)
+        query_heavy_requests_total.inc(entry["route"])
+        logger.warning("Query-heavy request", extra=entry)
+        return True
+
+    # ---- CommandListener ----
+
+    def started(self, event):
+        if event.command_name not in PROFILED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self._pending[(event.connection_id, event.request_id)] = (
+            collection, event.command, _current_request.get()
+        )
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        collection, command, queries = pending
+        seconds = event.duration_micros / 1e6
+        key = (collection, event.command_name)
+
+        with self._lock:
+            stats = self.operations.get(key)
+            if stats is None:
+                stats = self.operations[key] = {"histogram": LatencyHistogram(), "errors": 0, "max_seconds": 0.0}
+            stats["histogram"].record(seconds)
+            if seconds > stats["max_seconds"]:
+                stats["max_seconds"] = seconds
+            if failed:
+                stats["errors"] += 1
+            if queries is not None:
+                queries.total += 1
+                operation = f"{event.command_name} {collection}"
+                queries.by_operation[operation] = queries.by_operation.get(operation, 0) + 1
+
+        if seconds * 1000 >= self.slow_ms:
+            self._record_slow(collection, event.command_name, command, seconds, queries)
+
+    def _record_slow(self, collection: str, command_name: str, command: Dict, seconds: float, queries):
+        shape = command_shape(command_name, command)
+        entry = {
+            "collection": collection,
+            "command": command_name,
+            "duration_ms": round(seconds * 1000, 2),
+            "shape": shape,
+            "correlation_id": queries.correlation_id if queries else None,
+            "plan": None
+        }
+        self.slow_queries.append(entry)
+        slow_queries_total.inc(collection, command_name)
+        logger.warning("Slow query", extra={key: value for key, value in entry.items() if key != "plan"})
+
+        # One explain per distinct shape every 10 minutes
+        shape_key = f"{collection}:{command_name}:{json.dumps(shape, sort_keys=True, default=str)}"
+        if command_name not in EXPLAINABLE_COMMANDS or self.loop is None or self.database is None:
+            return
+        with self._lock:
+            if self._explained.get(shape_key) is not None:
+                return
+            self._explained.set(shape_key, True)
+        explain_command = {k: v for k, v in command.items() if k not in _NON_EXPLAIN_FIELDS}
+        self.loop.call_soon_threadsafe(self._schedule_explain, entry, explain_command)
+
+    def _schedule_explain(self, entry: Dict, explain_command: Dict):
+        task = self.loop.create_task(self._explain(entry, explain_command))
+        self._explain_tasks.add(task)
+        task.add_done_callback(self._explain_tasks.discard)
+
+    async def _explain(self, entry: Dict, explain_command: Dict):
+        try:
+            result = await self.database.command("explain", explain_command, verbosity="queryPlanner")
+            entry["plan"] = summarize_plan(result)
+            logger.warning(
+                "Slow query plan",
+                extra={"collection": entry["collection"], "command": entry["command"], "plan": entry["plan"]}
+            )
+        except Exception as e:
+            logger.error(f"Error explaining slow query on {entry['collection']}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        operations = []
+        with self._lock:
+            for (collection, command_name), stats in self.operations.items():
+                histogram = stats["histogram"]
+                operations.append({
+                    "collection": collection,
+                    "command": command_name,
+                    "count": histogram.count,
+                    "errors": stats["errors"],
+                    "avg_ms": round(histogram.sum / histogram.count * 1000, 3) if histogram.count else 0.0,
+                    "p50_ms": round(histogram.percentile(0.5) * 1000, 3),
+                    "p99_ms": round(histogram.percentile(0.99) * 1000, 3),
+                    "max_ms": round(stats["max_seconds"] * 1000, 3)
+                })
+        operations.sort(key=lambda item: item["avg_ms"] * item["count"], reverse=True)
+        return {
+            "slow_ms": self.slow_ms,
+            "request_budget": self.request_budget,
+            "operations": operations,
+            "slow_queries": list(self.slow_queries),
+            "flagged_requests": list(self.flagged_requests)
+        }
+
+query_profiler = QueryProfiler()
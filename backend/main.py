@@ -1,39 +1,56 @@
 from fastapi import FastAPI, HTTPException, Depends, status, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, APIKeyHeader
 from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, Response
 from contextlib import asynccontextmanager
 import uvicorn
 from typing import Optional, List
 import os
+import hmac
+import asyncio
 import logging
+from datetime import datetime
 from dotenv import load_dotenv
+from pydantic import TypeAdapter
 
 # Import modules
 from db.mongo import database, init_db, close_db
+from db.profiler import query_profiler
 from models import (
     TokenResponse, LoginRequest, RefreshTokenRequest, RestaurantResponse, RestaurantUpdate,
     CategoryResponse, CategoryCreate, CategoryUpdate, ProductResponse, ProductCreate, ProductUpdate,
-    OrderResponse, OrderCreate, OrderStatusUpdate, RestaurantCreate
+    OrderResponse, OrderCreate, OrderStatusUpdate, RestaurantCreate,
+    APIKeyCreate, APIKeyCreated, APIKeyResponse, Page, CatalogBulkUpdate, CatalogBulkResult
 )
-from services.auth import AuthService
-from services.restaurants import RestaurantService
-from services.products import ProductService
+from services.auth import AuthService, principal_cache, password_hasher, token_epochs, refresh_flight
+from utils.hashing import HashingQueueFull
+from utils.throttle import LoginThrottle
+from utils.pagination import InvalidCursor
+from utils.fields import InvalidFields, parse_fields, list_adapter
+from services.restaurants import RestaurantService, restaurant_cache
+from services.products import ProductService, product_search
+from services.product_import import ProductImporter, ImportFormatError, RestaurantNotFound, detect_format, parse_rows
 from services.orders import OrderService
 from services.categories import CategoryService
+from services.api_keys import APIKeyService
+from services.container import (
+    services, get_auth_service, get_restaurant_service, get_product_service, get_product_importer,
+    get_order_service, get_category_service, get_api_key_service
+)
+from utils.structured_logging import configure_logging, request_sampler
 
 # Import security middleware
 from middleware.security import (
     RateLimitMiddleware, SecurityHeadersMiddleware, RequestLoggingMiddleware,
     InputValidationMiddleware, validation_exception_handler, http_exception_handler,
-    general_exception_handler
+    general_exception_handler, input_scan_metrics, get_client_ip
 )
+from middleware.metrics import MetricsMiddleware, metrics, auth_failures
+from middleware.compression import CompressionMiddleware, PrecompressedResponseCache
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (JSON lines written by a background thread)
+log_handler = configure_logging()
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -44,15 +61,15 @@ for var in required_vars:
     if not os.getenv(var):
         raise RuntimeError(f"Missing required environment variable: {var}")
 
-# Initialize services
-auth_service = AuthService()
-restaurant_service = RestaurantService()
-product_service = ProductService()
-order_service = OrderService()
-category_service = CategoryService()
-
 # Security
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+login_throttle = LoginThrottle()
+
+# Public menu responses, stored serialised and pre-compressed per restaurant
+menu_cache = PrecompressedResponseCache()
+category_list_adapter = TypeAdapter(List[CategoryResponse])
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -60,9 +77,27 @@ async def lifespan(app: FastAPI):
     logger.info("Starting DUO Previa API...")
     await init_db()
     logger.info("Database connection established")
+    # Services are built once, here, after the database is up
+    services.start()
+    await services.api_keys.refresh_index()
+    logger.info(f"Restaurant cache warmed with {await restaurant_cache.warm_up()} restaurants")
+    logger.info(f"Password hashing rounds: {password_hasher.rounds or 'passlib default'}")
+    epoch_task = None
+    if services.auth.verify_mode == "stateless":
+        users_collection = database.database["users"]
+        await token_epochs.refresh(users_collection)
+        epoch_task = asyncio.create_task(token_epochs.run(
+            users_collection,
+            float(os.getenv("TOKEN_EPOCH_REFRESH_SECONDS", "30"))
+        ))
+        logger.info("Stateless token verification enabled")
     yield
     # Shutdown
     logger.info("Shutting down DUO Previa API...")
+    if epoch_task:
+        epoch_task.cancel()
+    password_hasher.shutdown()
+    services.stop()
     await close_db()
     logger.info("Database connection closed")
 
@@ -75,6 +110,9 @@ app = FastAPI(
     redoc_url="/redoc" if os.getenv("ENVIRONMENT") == "development" else None,
 )
 
+# Response compression (gzip/brotli), innermost so it sees the raw body
+app.add_middleware(CompressionMiddleware)
+
 # Add security middleware (order matters!)
 app.add_middleware(SecurityHeadersMiddleware)
 app.add_middleware(RequestLoggingMiddleware)
@@ -85,6 +123,9 @@ rate_limit_calls = int(os.getenv("RATE_LIMIT_CALLS", "100"))
 rate_limit_period = int(os.getenv("RATE_LIMIT_PERIOD", "3600"))
 app.add_middleware(RateLimitMiddleware, calls=rate_limit_calls, period=rate_limit_period)
 
+# Latency histograms per route template, exposed on /metrics
+app.add_middleware(MetricsMiddleware)
+
 # CORS middleware
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 app.add_middleware(
@@ -93,6 +134,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Exception handlers
@@ -103,7 +145,8 @@ app.add_exception_handler(Exception, general_exception_handler)
 # Dependency to get current user with enhanced validation
 async def get_current_user(
     request: Request,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    auth_service: AuthService = Depends(get_auth_service)
 ):
     """Enhanced user authentication with logging"""
     correlation_id = getattr(request.state, 'correlation_id', 'unknown')
@@ -117,7 +160,7 @@ async def get_current_user(
                 "Invalid token used",
                 extra={
                     "correlation_id": correlation_id,
-                    "client_ip": request.headers.get("X-Forwarded-For", request.client.host)
+                    "client_ip": get_client_ip(request.scope)
                 }
             )
             raise HTTPException(
@@ -138,6 +181,7 @@ async def get_current_user(
         return user
         
     except Exception as e:
+        auth_failures.inc("invalid_token" if isinstance(e, HTTPException) else "error")
         logger.error(
             "Authentication error",
             extra={
@@ -150,6 +194,95 @@ async def get_current_user(
             detail="Authentication failed"
         )
 
+def get_user_or_api_client(permission: str):
+    """
+    Accept either a user bearer token or an X-API-Key with `permission`.
+    API keys are resolved from the in-memory index (no bcrypt, no DB call).
+    """
+    async def dependency(
+        request: Request,
+        api_key: Optional[str] = Depends(api_key_header),
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+        api_key_service: APIKeyService = Depends(get_api_key_service),
+        auth_service: AuthService = Depends(get_auth_service)
+    ):
+        if api_key:
+            client = await api_key_service.authenticate(api_key)
+            if not client:
+                auth_failures.inc("invalid_api_key")
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid API key"
+                )
+            if permission not in client["permissions"]:
+                auth_failures.inc("api_key_permission")
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="API key lacks permission"
+                )
+            return client
+        
+        if not credentials:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authenticated"
+            )
+        return await get_current_user(request, credentials, auth_service)
+    
+    return dependency
+
+def page_headers(page: Page) -> dict:
+    """Paginated listings keep a plain list body; the next page is announced in a header"""
+    return {"X-Next-Cursor": page.next_cursor} if page.next_cursor else {}
+
+async def cached_menu_response(request: Request, slug: str, key, adapter: TypeAdapter, load):
+    """
+    Serve a public menu list from menu_cache: on a hit the stored JSON (or its
+    gzip/brotli variant) is returned without serialising or compressing.
+    `load` returns a list or a Page.
+    """
+    cached = menu_cache.get(slug, key)
+    if cached is None:
+        # A write during load() bumps the generation and keeps this body out of the cache
+        generation = menu_cache.generation(slug)
+        result = await load()
+        page = result if isinstance(result, Page) else Page(items=result)
+        body = adapter.dump_json(adapter.validate_python(page.items))
+        if not page.items:
+            # Services return [] on query errors too; don't pin that in the cache
+            return Response(body, media_type="application/json")
+        cached = menu_cache.set(slug, key, body, page_headers(page), generation=generation)
+    return await menu_cache.response(cached, request.headers.get("accept-encoding", ""))
+
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+    """Malformed or foreign pagination cursors are a client error"""
+    return await http_exception_handler(
+        request, HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+    )
+
+app.add_exception_handler(InvalidCursor, invalid_cursor_handler)
+
+async def invalid_fields_handler(request: Request, exc: InvalidFields):
+    """Unknown names in ?fields="""
+    return await http_exception_handler(
+        request, HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Campos desconocidos: {', '.join(exc.unknown)}"
+        )
+    )
+
+app.add_exception_handler(InvalidFields, invalid_fields_handler)
+
+def sparse_response(result, model, fields, headers: Optional[dict] = None) -> Response:
+    """
+    ?fields= results skip response_model (it requires every field) and are
+    serialised with the trimmed model instead.
+    """
+    if isinstance(result, list):
+        body = list_adapter(model, fields).dump_json(result)
+    else:
+        body = result.model_dump_json().encode("utf-8")
+    return Response(body, media_type="application/json", headers=headers)
+
 # Health check with enhanced information
 @app.get("/health")
 async def health_check():
@@ -173,6 +306,16 @@ async def health_check():
             detail="Service temporarily unavailable"
         )
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Métricas en formato de texto de Prometheus"""
+    metrics_token = os.getenv("METRICS_TOKEN")
+    if metrics_token and not hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {metrics_token}"
+    ):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -184,27 +327,68 @@ async def root():
 
 # ===== AUTH ENDPOINTS =====
 @app.post("/auth/login", response_model=TokenResponse)
-async def login(request: Request, login_data: LoginRequest):
+async def login(
+    request: Request,
+    login_data: LoginRequest,
+    auth_service: AuthService = Depends(get_auth_service)
+):
     """Login with enhanced security logging"""
     correlation_id = getattr(request.state, 'correlation_id', 'unknown')
+    client_ip = get_client_ip(request.scope)
+    
+    # Reject throttled credentials/IPs before any DB lookup or bcrypt work; the
+    # attempt stays reserved until verified so concurrent bursts are counted
+    retry_after = login_throttle.acquire(login_data.restaurant_slug, login_data.username, client_ip)
+    if retry_after:
+        auth_failures.inc("login_throttled")
+        logger.warning(
+            "Login throttled",
+            extra={
+                "correlation_id": correlation_id,
+                "username": login_data.username,
+                "restaurant_slug": login_data.restaurant_slug,
+                "client_ip": client_ip
+            }
+        )
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiados intentos, intente más tarde",
+            headers={"Retry-After": str(int(retry_after) + 1)}
+        )
     
     logger.info(
         "Login attempt",
         extra={
+            "audit": True,
             "correlation_id": correlation_id,
             "username": login_data.username,
             "restaurant_slug": login_data.restaurant_slug,
-            "client_ip": request.headers.get("X-Forwarded-For", request.client.host)
+            "client_ip": client_ip
         }
     )
     
-    result = await auth_service.authenticate_user(
-        login_data.username, 
-        login_data.password, 
-        login_data.restaurant_slug
-    )
+    try:
+        result = await auth_service.authenticate_user(
+            login_data.username, 
+            login_data.password, 
+            login_data.restaurant_slug
+        )
+    except HashingQueueFull:
+        logger.warning(
+            "Login rejected, password hashing saturated",
+            extra={"correlation_id": correlation_id}
+        )
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio ocupado, intente nuevamente",
+            headers={"Retry-After": "1"}
+        )
+    finally:
+        login_throttle.release(login_data.restaurant_slug, login_data.username, client_ip)
     
     if not result:
+        login_throttle.record_failure(login_data.restaurant_slug, login_data.username, client_ip)
+        auth_failures.inc("login_failed")
         logger.warning(
             "Login failed",
             extra={
@@ -218,9 +402,11 @@ async def login(request: Request, login_data: LoginRequest):
             detail="Credenciales incorrectas"
         )
     
+    login_throttle.record_success(login_data.restaurant_slug, login_data.username)
     logger.info(
         "Login successful",
         extra={
+            "audit": True,
             "correlation_id": correlation_id,
             "user_id": result["user"]["id"],
             "username": result["user"]["username"]
@@ -230,13 +416,18 @@ async def login(request: Request, login_data: LoginRequest):
     return result
 
 @app.post("/auth/refresh", response_model=TokenResponse)
-async def refresh_token(request: Request, refresh_data: RefreshTokenRequest):
+async def refresh_token(
+    request: Request,
+    refresh_data: RefreshTokenRequest,
+    auth_service: AuthService = Depends(get_auth_service)
+):
     """Refresh token with logging"""
     correlation_id = getattr(request.state, 'correlation_id', 'unknown')
     
     result = await auth_service.refresh_access_token(refresh_data.refresh_token)
     
     if not result:
+        auth_failures.inc("refresh_failed")
         logger.warning(
             "Token refresh failed",
             extra={"correlation_id": correlation_id}
@@ -249,6 +440,7 @@ async def refresh_token(request: Request, refresh_data: RefreshTokenRequest):
     logger.info(
         "Token refreshed",
         extra={
+            "audit": True,
             "correlation_id": correlation_id,
             "user_id": result["user"]["id"]
         }
@@ -258,21 +450,29 @@ async def refresh_token(request: Request, refresh_data: RefreshTokenRequest):
 
 # ===== RESTAURANT ENDPOINTS =====
 @app.get("/api/restaurants/{slug}", response_model=RestaurantResponse)
-async def get_restaurant_by_slug(slug: str):
-    """Obtener información del restaurante por slug"""
-    restaurant = await restaurant_service.get_by_slug(slug)
+async def get_restaurant_by_slug(
+    slug: str,
+    fields: Optional[str] = None,
+    restaurant_service: RestaurantService = Depends(get_restaurant_service)
+):
+    """Obtener información del restaurante por slug (?fields=name,logo para una respuesta reducida)"""
+    selected = parse_fields(fields, RestaurantResponse)
+    restaurant = await restaurant_service.get_by_slug(slug, selected)
     if not restaurant:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Restaurante no encontrado"
         )
+    if selected:
+        return sparse_response(restaurant, RestaurantResponse, selected)
     return restaurant
 
 @app.put("/api/restaurants/{slug}")
 async def update_restaurant(
     slug: str,
     restaurant_data: RestaurantUpdate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    restaurant_service: RestaurantService = Depends(get_restaurant_service)
 ):
     """Actualizar configuración del restaurante"""
     if current_user["restaurant_slug"] != slug:
@@ -291,16 +491,23 @@ async def update_restaurant(
 
 # ===== CATEGORY ENDPOINTS =====
 @app.get("/api/{slug}/categories", response_model=List[CategoryResponse])
-async def get_categories(slug: str):
+async def get_categories(
+    request: Request,
+    slug: str,
+    category_service: CategoryService = Depends(get_category_service)
+):
     """Obtener categorías del restaurante"""
-    categories = await category_service.get_categories_by_restaurant(slug)
-    return categories
+    return await cached_menu_response(
+        request, slug, "categories", category_list_adapter,
+        lambda: category_service.get_categories_by_restaurant(slug)
+    )
 
 @app.post("/api/{slug}/categories", response_model=CategoryResponse)
 async def create_category(
     slug: str,
     category_data: CategoryCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    category_service: CategoryService = Depends(get_category_service)
 ):
     """Crear nueva categoría"""
     if current_user["restaurant_slug"] != slug:
@@ -310,6 +517,7 @@ async def create_category(
         )
     
     category = await category_service.create_category(slug, category_data)
+    menu_cache.invalidate(slug)
     return category
 
 @app.put("/api/{slug}/categories/{category_id}")
@@ -317,7 +525,8 @@ async def update_category(
     slug: str,
     category_id: str,
     category_data: CategoryUpdate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    category_service: CategoryService = Depends(get_category_service)
 ):
     """Actualizar categoría"""
     if current_user["restaurant_slug"] != slug:
@@ -326,13 +535,15 @@ async def update_category(
     updated = await category_service.update_category(category_id, category_data)
     if not updated:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    menu_cache.invalidate(slug)
     return {"message": "Categoría actualizada"}
 
 @app.delete("/api/{slug}/categories/{category_id}")
 async def delete_category(
     slug: str,
     category_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    category_service: CategoryService = Depends(get_category_service)
 ):
     """Eliminar categoría"""
     if current_user["restaurant_slug"] != slug:
@@ -341,38 +552,73 @@ async def delete_category(
     deleted = await category_service.delete_category(category_id)
     if not deleted:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    menu_cache.invalidate(slug)
     return {"message": "Categoría eliminada"}
 
 # ===== PRODUCT ENDPOINTS =====
 @app.get("/api/{slug}/products", response_model=List[ProductResponse])
 async def get_products(
+    request: Request,
+    response: Response,
     slug: str,
     category_id: Optional[str] = None,
     search: Optional[str] = None,
-    popular_only: bool = False
+    popular_only: bool = False,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    product_service: ProductService = Depends(get_product_service)
 ):
-    """Obtener productos del restaurante"""
-    products = await product_service.get_products_by_restaurant(
-        slug, category_id, search, popular_only
+    """
+    Obtener productos del restaurante ordenados por nombre. Con ?limit= o
+    ?cursor= se paginan (siguiente página en X-Next-Cursor).
+    ?fields=name,price devuelve solo esos campos.
+    """
+    selected = parse_fields(fields, ProductResponse)
+    # Only the whole menu and its default first page are cached: searches, later
+    # pages and custom page sizes are client-chosen keys that would churn the cache
+    if search or cursor or limit not in (None, product_service.page_size):
+        page = await product_service.get_products_by_restaurant(
+            slug, category_id, search, popular_only, limit, cursor, selected
+        )
+        if selected:
+            return sparse_response(page.items, ProductResponse, selected, page_headers(page))
+        response.headers.update(page_headers(page))
+        return page.items
+    
+    return await cached_menu_response(
+        request, slug, ("products", category_id, popular_only, limit, selected),
+        list_adapter(ProductResponse, selected),
+        lambda: product_service.get_products_by_restaurant(
+            slug, category_id, None, popular_only, limit, cursor, selected
+        )
     )
-    return products
 
 @app.get("/api/{slug}/products/{product_id}", response_model=ProductResponse)
-async def get_product(slug: str, product_id: str):
+async def get_product(
+    slug: str,
+    product_id: str,
+    fields: Optional[str] = None,
+    product_service: ProductService = Depends(get_product_service)
+):
     """Obtener producto específico"""
-    product = await product_service.get_product_by_id(product_id, slug)
+    selected = parse_fields(fields, ProductResponse)
+    product = await product_service.get_product_by_id(product_id, slug, selected)
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Producto no encontrado"
         )
+    if selected:
+        return sparse_response(product, ProductResponse, selected)
     return product
 
 @app.post("/api/{slug}/products", response_model=ProductResponse)
 async def create_product(
     slug: str,
     product_data: ProductCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    product_service: ProductService = Depends(get_product_service)
 ):
     """Crear nuevo producto"""
     if current_user["restaurant_slug"] != slug:
@@ -382,76 +628,162 @@ async def create_product(
         )
     
     product = await product_service.create_product(slug, product_data)
+    menu_cache.invalidate(slug)
     return product
 
+@app.post("/api/{slug}/products/import")
+async def import_products(
+    request: Request,
+    slug: str,
+    format: Optional[str] = None,
+    create_categories: bool = True,
+    current_user: dict = Depends(get_user_or_api_client("products:write")),
+    product_importer: ProductImporter = Depends(get_product_importer)
+):
+    """
+    Importar productos en bloque desde CSV o JSON (array o NDJSON).
+    El cuerpo se procesa a medida que llega; devuelve un reporte con los
+    errores por fila.
+    """
+    if current_user["restaurant_slug"] != slug:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        import_format = format or detect_format(request.headers.get("content-type"))
+        rows = parse_rows(import_format, request.stream())
+        report = await product_importer.run(slug, rows, create_categories=create_categories)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except RestaurantNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Restaurante no encontrado"
+        )
+    
+    if report["inserted"] or report["categories_created"]:
+        menu_cache.invalidate(slug)
+    if report.get("error") and not report["inserted"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=report["error"])
+    return report
+
+@app.post("/api/{slug}/catalog/bulk", response_model=CatalogBulkResult)
+async def bulk_update_catalog(
+    slug: str,
+    changes: CatalogBulkUpdate,
+    current_user: dict = Depends(get_user_or_api_client("products:write")),
+    product_service: ProductService = Depends(get_product_service),
+    category_service: CategoryService = Depends(get_category_service)
+):
+    """
+    Cambios masivos del catálogo en una sola petición: disponibilidad y
+    precio por producto, ajustes porcentuales de precio por categoría y
+    orden de categorías. Devuelve el resultado de cada ítem.
+    """
+    if current_user["restaurant_slug"] != slug:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    
+    product_results, category_results = await asyncio.gather(
+        product_service.bulk_update(slug, changes.products, changes.price_adjustments),
+        category_service.reorder_categories(slug, changes.category_order)
+    )
+    result = CatalogBulkResult(**product_results, category_order=category_results)
+    sections = (result.products, result.price_adjustments, result.category_order)
+    if any(item.status == "updated" for items in sections for item in items):
+        menu_cache.invalidate(slug)
+    return result
+
 @app.put("/api/{slug}/products/{product_id}")
 async def update_product(
     slug: str,
     product_id: str,
     product_data: ProductUpdate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_user_or_api_client("products:write")),
+    product_service: ProductService = Depends(get_product_service)
 ):
     """Actualizar producto"""
     if current_user["restaurant_slug"] != slug:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    updated = await product_service.update_product(product_id, product_data)
+    updated = await product_service.update_product(product_id, product_data, slug)
     if not updated:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Producto no encontrado"
         )
+    menu_cache.invalidate(slug)
     return {"message": "Producto actualizado exitosamente"}
 
 @app.delete("/api/{slug}/products/{product_id}")
 async def delete_product(
     slug: str,
     product_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    product_service: ProductService = Depends(get_product_service)
 ):
     """Eliminar producto"""
     if current_user["restaurant_slug"] != slug:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    deleted = await product_service.delete_product(product_id)
+    deleted = await product_service.delete_product(product_id, slug)
     if not deleted:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    menu_cache.invalidate(slug)
     return {"message": "Producto eliminado"}
 
 # ===== ORDER ENDPOINTS =====
 @app.post("/api/{slug}/orders", response_model=OrderResponse)
-async def create_order(slug: str, order_data: OrderCreate):
+async def create_order(
+    slug: str,
+    order_data: OrderCreate,
+    order_service: OrderService = Depends(get_order_service)
+):
     """Crear nuevo pedido"""
     order = await order_service.create_order(slug, order_data)
     return order
 
 @app.get("/api/{slug}/orders", response_model=List[OrderResponse])
 async def get_orders(
+    response: Response,
     slug: str,
     status_filter: Optional[str] = None,
-    limit: int = 50,
-    current_user: dict = Depends(get_current_user)
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_user_or_api_client("orders:read")),
+    order_service: OrderService = Depends(get_order_service)
 ):
-    """Obtener pedidos del restaurante"""
+    """
+    Obtener pedidos del restaurante (más recientes primero; siguiente página
+    en X-Next-Cursor). ?fields=order_number,status,items para la cocina.
+    """
     if current_user["restaurant_slug"] != slug:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    orders = await order_service.get_orders_by_restaurant(slug, status_filter, limit)
-    return orders
+    selected = parse_fields(fields, OrderResponse)
+    page = await order_service.get_orders_by_restaurant(slug, status_filter, limit, cursor, selected)
+    if selected:
+        return sparse_response(page.items, OrderResponse, selected, page_headers(page))
+    response.headers.update(page_headers(page))
+    return page.items
 
 @app.get("/api/{slug}/orders/{order_id}", response_model=OrderResponse)
 async def get_order(
     slug: str,
     order_id: str,
-    current_user: dict = Depends(get_current_user)
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_user_or_api_client("orders:read")),
+    order_service: OrderService = Depends(get_order_service)
 ):
     """Obtener pedido específico"""
     if current_user["restaurant_slug"] != slug:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    order = await order_service.get_order_by_id(order_id, slug)
+    selected = parse_fields(fields, OrderResponse)
+    order = await order_service.get_order_by_id(order_id, slug, selected)
     if not order:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if selected:
+        return sparse_response(order, OrderResponse, selected)
     return order
 
 @app.put("/api/{slug}/orders/{order_id}/status")
@@ -459,22 +791,66 @@ async def update_order_status(
     slug: str,
     order_id: str,
     status_data: OrderStatusUpdate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_user_or_api_client("orders:write")),
+    order_service: OrderService = Depends(get_order_service)
 ):
     """Actualizar estado del pedido"""
     if current_user["restaurant_slug"] != slug:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    updated = await order_service.update_order_status(order_id, status_data.status)
+    updated = await order_service.update_order_status(order_id, status_data.status, slug)
     if not updated:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
     return {"message": "Estado del pedido actualizado"}
 
+# ===== API KEY ENDPOINTS =====
+@app.post("/api/{slug}/api-keys", response_model=APIKeyCreated)
+async def create_api_key(
+    slug: str,
+    key_data: APIKeyCreate,
+    current_user: dict = Depends(get_current_user),
+    api_key_service: APIKeyService = Depends(get_api_key_service)
+):
+    """Crear API key para integraciones (POS); se muestra una sola vez"""
+    if current_user["restaurant_slug"] != slug:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    
+    return await api_key_service.create_api_key(slug, key_data)
+
+@app.get("/api/{slug}/api-keys", response_model=List[APIKeyResponse])
+async def get_api_keys(
+    slug: str,
+    current_user: dict = Depends(get_current_user),
+    api_key_service: APIKeyService = Depends(get_api_key_service)
+):
+    """Listar API keys del restaurante"""
+    if current_user["restaurant_slug"] != slug:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    
+    return await api_key_service.get_api_keys_by_restaurant(slug)
+
+@app.delete("/api/{slug}/api-keys/{key_prefix}")
+async def revoke_api_key(
+    slug: str,
+    key_prefix: str,
+    current_user: dict = Depends(get_current_user),
+    api_key_service: APIKeyService = Depends(get_api_key_service)
+):
+    """Revocar API key"""
+    if current_user["restaurant_slug"] != slug:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    
+    revoked = await api_key_service.revoke_api_key(slug, key_prefix)
+    if not revoked:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return {"message": "API key revocada"}
+
 # ===== ANALYTICS ENDPOINTS =====
 @app.get("/api/{slug}/analytics/dashboard")
 async def get_dashboard_analytics(
     slug: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    order_service: OrderService = Depends(get_order_service)
 ):
     """Obtener analíticas del dashboard"""
     if current_user["restaurant_slug"] != slug:
@@ -487,23 +863,67 @@ async def get_dashboard_analytics(
 @app.post("/superadmin/restaurants", response_model=RestaurantResponse)
 async def create_restaurant(
     restaurant_data: RestaurantCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    restaurant_service: RestaurantService = Depends(get_restaurant_service)
 ):
     """Crear nuevo restaurante (solo superadmin)"""
     if current_user["role"] != "superadmin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    restaurant = await restaurant_service.create_restaurant(restaurant_data)
+    try:
+        restaurant = await restaurant_service.create_restaurant(restaurant_data)
+    except HashingQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio ocupado, intente nuevamente",
+            headers={"Retry-After": "1"}
+        )
     return restaurant
 
 @app.get("/superadmin/restaurants", response_model=List[RestaurantResponse])
-async def get_all_restaurants(current_user: dict = Depends(get_current_user)):
-    """Obtener todos los restaurantes (solo superadmin)"""
+async def get_all_restaurants(
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    restaurant_service: RestaurantService = Depends(get_restaurant_service)
+):
+    """Obtener todos los restaurantes (solo superadmin; con ?limit= o ?cursor= se paginan, siguiente página en X-Next-Cursor)"""
     if current_user["role"] != "superadmin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    restaurants = await restaurant_service.get_all_restaurants()
-    return restaurants
+    selected = parse_fields(fields, RestaurantResponse)
+    page = await restaurant_service.get_all_restaurants(limit, cursor, selected)
+    if selected:
+        return sparse_response(page.items, RestaurantResponse, selected, page_headers(page))
+    response.headers.update(page_headers(page))
+    return page.items
+
+@app.get("/superadmin/stats")
+async def get_runtime_stats(
+    current_user: dict = Depends(get_current_user),
+    auth_service: AuthService = Depends(get_auth_service)
+):
+    """Estadísticas de cachés y pools en memoria (solo superadmin)"""
+    if current_user["role"] != "superadmin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    
+    return {
+        "auth_verify_mode": auth_service.verify_mode,
+        "principal_cache": principal_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "token_epochs": token_epochs.stats(),
+        "refresh_flight": refresh_flight.stats(),
+        "login_throttle": login_throttle.stats(),
+        "input_scan": input_scan_metrics.stats(),
+        "logging": {**log_handler.stats(), "sampling": request_sampler.stats()},
+        "routes": metrics.stats(),
+        "database": query_profiler.stats(),
+        "menu_cache": menu_cache.stats(),
+        "product_search": product_search.stats(),
+        "restaurant_cache": restaurant_cache.stats()
+    }
 
 if __name__ == "__main__":
     uvicorn.run(
@@ -0,0 +1,250 @@
+import os
+import zlib
+from typing import Dict, Hashable, Optional
+from fastapi import Response
+from starlette.concurrency import run_in_threadpool
+from utils.cache import TTLCache
+from utils.singleflight import SingleFlight
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    b"text/", b"application/json", b"application/javascript", b"application/xml", b"image/svg+xml"
+)
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Preferred encoding the client accepts: br (if available), then gzip"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(token.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 4) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # 31: gzip container
+    return compressor.compress(body) + compressor.flush()
+
+class _StreamCompressor:
+    """Incremental compressor that flushes after every chunk so clients see data as it is sent"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes, last: bool) -> bytes:
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if last else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    """
+    gzip/brotli response compression. Complete bodies under `minimum_size`
+    are sent as-is; streamed bodies are compressed chunk by chunk. Responses
+    that already carry a Content-Encoding (e.g. pre-compressed menu cache
+    hits) pass through untouched.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: Optional[int] = None,
+        gzip_level: Optional[int] = None,
+        brotli_quality: Optional[int] = None
+    ):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else int(
+            os.getenv("COMPRESSION_MIN_SIZE", "500")
+        )
+        self.gzip_level = gzip_level or int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+        self.brotli_quality = brotli_quality or int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_StreamCompressor] = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                content_type = b""
+                for key, value in headers:
+                    if key == b"content-encoding":
+                        passthrough = True
+                    elif key == b"content-type":
+                        content_type = value.lower()
+                if passthrough or message["status"] in (204, 304) or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                    return
+                # Hold the headers until the first body chunk tells us the size
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                start, start_message = start_message, None
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                headers = [
+                    (key, value) for key, value in start.get("headers", [])
+                    if key not in (b"content-length", b"vary")
+                ]
+                vary = [value for key, value in start.get("headers", []) if key == b"vary"]
+                headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+                headers.append((b"content-encoding", encoding.encode("latin-1")))
+
+                if not more_body:
+                    body = compress(body, encoding, self.gzip_level, self.brotli_quality)
+                    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+                compressor = _StreamCompressor(encoding, self.gzip_level, self.brotli_quality)
+                await send({**start, "headers": headers})
+
+            await send({
+                "type": "http.response.body",
+                "body": compressor.chunk(body, last=not more_body),
+                "more_body": more_body
+            })
+
+        await self.app(scope, receive, compressing_send)
+
+class CachedBody:
+    """Serialised response body plus its compressed variants, built on first use"""
+
+    __slots__ = ("body", "variants", "headers")
+
+    def __init__(self, body: bytes, headers: Optional[Dict[str, str]] = None):
+        self.body = body
+        self.variants: Dict[str, bytes] = {}
+        self.headers = headers or {}
+
+class PrecompressedResponseCache:
+    """
+    Per-tenant cache of serialised public responses (the menu). Each entry
+    keeps the JSON bytes and, once requested, the gzip/brotli bytes, so a hit
+    skips both serialisation and compression. Variants are compressed in the
+    threadpool, once per entry even for concurrent first hits. Invalidating a
+    tenant bumps its generation; old entries age out of the LRU.
+    """
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = None,
+        ttl: Optional[float] = None,
+        minimum_size: Optional[int] = None
+    ):
+        self._cache = TTLCache(
+            maxsize=maxsize or int(os.getenv("MENU_CACHE_SIZE", "1024")),
+            ttl=ttl if ttl is not None else float(os.getenv("MENU_CACHE_TTL", "30"))
+        )
+        self.minimum_size = minimum_size if minimum_size is not None else int(
+            os.getenv("COMPRESSION_MIN_SIZE", "500")
+        )
+        # Cached variants are compressed once, so spend more CPU on ratio
+        self.gzip_level = 9
+        self.brotli_quality = int(os.getenv("MENU_CACHE_BROTLI_QUALITY", "9"))
+        self._generations: Dict[str, int] = {}
+        self._compressing = SingleFlight()
+
+    def generation(self, tenant: str) -> int:
+        """Read before loading the data to cache, and pass it to set()"""
+        return self._generations.get(tenant, 0)
+
+    def get(self, tenant: str, key: Hashable) -> Optional[CachedBody]:
+        return self._cache.get((tenant, self.generation(tenant), key))
+
+    def set(
+        self,
+        tenant: str,
+        key: Hashable,
+        body: bytes,
+        headers: Optional[Dict[str, str]] = None,
+        generation: Optional[int] = None
+    ) -> CachedBody:
+        """
+        Store a body loaded during `generation` (default: the current one).
+        If the tenant was invalidated since, the body may predate the write,
+        so it is returned for this response but not cached.
+        """
+        entry = CachedBody(body, headers)
+        current = self.generation(tenant)
+        if generation is None or generation == current:
+            self._cache.set((tenant, current, key), entry)
+        return entry
+
+    def invalidate(self, tenant: str):
+        self._generations[tenant] = self._generations.get(tenant, 0) + 1
+
+    async def response(self, entry: CachedBody, accept_encoding: str) -> Response:
+        encoding = choose_encoding(accept_encoding) if len(entry.body) >= self.minimum_size else None
+        if encoding is None:
+            return Response(entry.body, media_type="application/json", headers={**entry.headers, "Vary": "Accept-Encoding"})
+
+        body = entry.variants.get(encoding)
+        if body is None:
+            body = await self._compressing.do((id(entry), encoding), lambda: self._compress(entry, encoding))
+        return Response(
+            body,
+            media_type="application/json",
+            headers={**entry.headers, "Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+        )
+
+    async def _compress(self, entry: CachedBody, encoding: str) -> bytes:
+        # A whole menu at these levels takes milliseconds; keep it off the event loop
+        body = await run_in_threadpool(compress, entry.body, encoding, self.gzip_level, self.brotli_quality)
+        entry.variants[encoding] = body
+        return body
+
+    def stats(self) -> Dict:
+        return self._cache.stats()
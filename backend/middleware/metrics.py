@@ -0,0 +1,245 @@
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+_perf_counter_ns = time.perf_counter_ns
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear histogram: each power-of-two octave of microseconds
+    is split into SUB equal sub-buckets (at most 12.5% relative error), so recording
+    is one bit_length and an index into a flat list of counters. Durations are
+    integer nanoseconds (perf_counter_ns) so the hot path does no float math.
+    """
+
+    SUB = 8
+    MIN_EXP = 4   # everything under 16us shares bucket 0
+    MAX_EXP = 26  # ~67s; slower requests go to the overflow bucket
+    BUCKETS = 2 + (MAX_EXP - MIN_EXP) * SUB
+
+    __slots__ = ("counts", "count", "sum_ns")
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.sum_ns = 0
+
+    @property
+    def sum(self) -> float:
+        return self.sum_ns / 1e9
+
+    def record(self, seconds: float):
+        self.record_ns(round(seconds * 1e9))
+
+    def record_ns(self, nanoseconds: int):
+        micros = nanoseconds // 1000
+        exponent = micros.bit_length()
+        if exponent <= _MIN_EXP:
+            index = 0
+        elif exponent > _MAX_EXP:
+            index = _OVERFLOW
+        else:
+            # 1 + (exponent - MIN_EXP - 1) * SUB + sub-bucket, folded into one expression;
+            # the top bits below the leading one pick the sub-bucket
+            index = exponent * _SUB + (micros >> (exponent - _SUB_SHIFT)) - _INDEX_OFFSET
+        self.counts[index] += 1
+        self.count += 1
+        self.sum_ns += nanoseconds
+
+    @classmethod
+    def upper_bound(cls, index: int) -> float:
+        """Upper edge of a bucket, in seconds"""
+        if index == 0:
+            return 2 ** cls.MIN_EXP / 1e6
+        if index >= cls.BUCKETS - 1:
+            return math.inf
+        exponent = cls.MIN_EXP + (index - 1) // cls.SUB
+        sub = (index - 1) % cls.SUB
+        return 2 ** exponent * (1 + (sub + 1) / cls.SUB) / 1e6
+
+    def percentile(self, q: float) -> float:
+        """Upper edge of the bucket holding the q-th quantile (0 < q <= 1)"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.upper_bound(index)
+        return math.inf
+
+    def octave_buckets(self) -> List[Tuple[float, int]]:
+        """Cumulative counts at power-of-two boundaries, for Prometheus `le`"""
+        buckets = []
+        cumulative = self.counts[0]
+        buckets.append((2 ** self.MIN_EXP / 1e6, cumulative))
+        for exponent in range(self.MIN_EXP + 1, self.MAX_EXP + 1):
+            start = 1 + (exponent - self.MIN_EXP - 1) * self.SUB
+            cumulative += sum(self.counts[start:start + self.SUB])
+            buckets.append((2 ** exponent / 1e6, cumulative))
+        return buckets
+
+# Module-level copies for the hot path (no attribute lookups in record)
+_SUB = LatencyHistogram.SUB
+_SUB_SHIFT = (2 * _SUB).bit_length() - 1
+_MIN_EXP = LatencyHistogram.MIN_EXP
+_MAX_EXP = LatencyHistogram.MAX_EXP
+_OVERFLOW = LatencyHistogram.BUCKETS - 1
+_INDEX_OFFSET = (_MIN_EXP + 2) * _SUB - 1
+
+class Counter:
+    """Monotonic counter with a fixed set of label names"""
+
+    def __init__(self, name: str, help: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class MetricsRegistry:
+    """
+    In-process request metrics, rendered in the Prometheus text format.
+    Each worker process keeps its own registry.
+    """
+
+    SERIES_LABELS = ("route", "method", "status")
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str, int], LatencyHistogram] = {}
+        self.counters: List[Counter] = []
+        self.in_flight = 0
+
+    def observe(self, route: str, method: str, status_code: int, seconds: float):
+        self.observe_ns(route, method, status_code, round(seconds * 1e9))
+
+    def observe_ns(self, route: str, method: str, status_code: int, nanoseconds: int):
+        key = (route, method, status_code)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        histogram.record_ns(nanoseconds)
+
+    def counter(self, name: str, help: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        counter = Counter(name, help, label_names)
+        self.counters.append(counter)
+        return counter
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route template, method and status",
+            "# TYPE http_request_duration_seconds histogram"
+        ]
+        for key, histogram in sorted(self.histograms.items()):
+            for bound, cumulative in histogram.octave_buckets():
+                labels = _labels(self.SERIES_LABELS, key, f'le="{bound:g}"')
+                lines.append(f"http_request_duration_seconds_bucket{labels} {cumulative}")
+            labels = _labels(self.SERIES_LABELS, key, 'le="+Inf"')
+            lines.append(f"http_request_duration_seconds_bucket{labels} {histogram.count}")
+            labels = _labels(self.SERIES_LABELS, key)
+            lines.append(f"http_request_duration_seconds_sum{labels} {histogram.sum:.6f}")
+            lines.append(f"http_request_duration_seconds_count{labels} {histogram.count}")
+
+        lines.append("# HELP http_requests_in_flight Requests currently being processed")
+        lines.append("# TYPE http_requests_in_flight gauge")
+        lines.append(f"http_requests_in_flight {self.in_flight}")
+
+        for counter in self.counters:
+            lines.append(f"# HELP {counter.name} {counter.help}")
+            lines.append(f"# TYPE {counter.name} counter")
+            if not counter.values and not counter.label_names:
+                lines.append(f"{counter.name} 0")
+            for labels, value in sorted(counter.values.items()):
+                lines.append(f"{counter.name}{_labels(counter.label_names, labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def stats(self, limit: int = 20) -> List[Dict]:
+        """Busiest series with p50/p99 in milliseconds"""
+        busiest = sorted(self.histograms.items(), key=lambda item: item[1].count, reverse=True)[:limit]
+        return [
+            {
+                "route": route,
+                "method": method,
+                "status": status_code,
+                "count": histogram.count,
+                "p50_ms": round(histogram.percentile(0.5) * 1000, 3),
+                "p99_ms": round(histogram.percentile(0.99) * 1000, 3)
+            }
+            for (route, method, status_code), histogram in busiest
+        ]
+
+metrics = MetricsRegistry()
+rate_limit_rejections = metrics.counter(
+    "rate_limit_rejections_total", "Requests rejected by the rate limiter", ("policy",)
+)
+auth_failures = metrics.counter(
+    "auth_failures_total", "Rejected authentication attempts", ("reason",)
+)
+
+class _StatusRecorder:
+    """
+    Forwards ASGI messages and keeps the response status. `forward` is bound
+    once and is a plain function returning the inner send's awaitable, so
+    wrapping adds no coroutine per message; instances are pooled per middleware.
+    """
+
+    __slots__ = ("send", "status", "forward")
+
+    def __init__(self):
+        self.send = None
+        self.status = 500
+        self.forward = self._forward
+
+    def _forward(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+        return self.send(message)
+
+class MetricsMiddleware:
+    """
+    Records latency per route template (e.g. /api/{slug}/orders, never the
+    raw URL) plus the in-flight gauge. Requests that never reach a route
+    (404s, rate limited, rejected input) are grouped under "unmatched".
+    """
+
+    def __init__(self, app, registry: Optional[MetricsRegistry] = None):
+        self.app = app
+        self.registry = registry or metrics
+        self._recorders: List[_StatusRecorder] = []
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        recorders = self._recorders
+        recorder = recorders.pop() if recorders else _StatusRecorder()
+        recorder.send = send
+
+        registry.in_flight += 1
+        started = _perf_counter_ns()
+        try:
+            await self.app(scope, receive, recorder.forward)
+        finally:
+            elapsed = _perf_counter_ns() - started
+            registry.in_flight -= 1
+            route = scope.get("route")
+            registry.observe_ns(
+                getattr(route, "path", "unmatched"), scope["method"], recorder.status, elapsed
+            )
+            recorder.send = None
+            recorder.status = 500
+            recorders.append(recorder)
@@ -0,0 +1,374 @@
+import os
+import re
+import json
+import mmap
+import time
+import errno
+import struct
+import hashlib
+import inspect
+import logging
+import tempfile
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: shared backend unavailable
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class RateLimit:
+    """calls per period, enforced with GCRA (burst of up to `calls`)"""
+
+    __slots__ = ("calls", "period", "emission_interval")
+
+    def __init__(self, calls: int, period: float):
+        self.calls = calls
+        self.period = period
+        self.emission_interval = period / calls
+
+class RateLimitPolicy:
+    """Limits for a group of routes, per client IP and optionally per tenant"""
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        calls: int,
+        period: float,
+        methods: Optional[List[str]] = None,
+        tenant_calls: Optional[int] = None,
+        tenant_period: Optional[float] = None
+    ):
+        self.name = name
+        self.path = re.compile(path)
+        self.methods = frozenset(m.upper() for m in methods) if methods else None
+        self.ip_limit = RateLimit(calls, period)
+        self.tenant_limit = RateLimit(tenant_calls, tenant_period or period) if tenant_calls else None
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        return self.path.match(path) is not None
+
+class InMemoryGCRAStore:
+    """
+    GCRA state: one float (theoretical arrival time) per key. A key whose
+    TAT is in the past carries no information and can be dropped.
+    """
+
+    def __init__(self):
+        self._tat: Dict[str, float] = {}
+
+    def hit(self, key: str, limit: RateLimit, now: float) -> float:
+        """Register a request; returns seconds to wait (0.0 if allowed)"""
+        tat = self._tat.get(key, now)
+        if tat < now:
+            tat = now
+        new_tat = tat + limit.emission_interval
+        allow_at = new_tat - limit.period
+        if now < allow_at:
+            return allow_at - now
+        self._tat[key] = new_tat
+        return 0.0
+
+    def refund(self, key: str, limit: RateLimit, now: float):
+        """Give back one allowed request (it was rejected by another key)"""
+        tat = self._tat.get(key)
+        if tat is not None:
+            self._tat[key] = max(now, tat - limit.emission_interval)
+
+    def evict_idle(self, now: float) -> int:
+        idle = [key for key, tat in self._tat.items() if tat <= now]
+        for key in idle:
+            del self._tat[key]
+        return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+class SharedMemoryGCRAStore:
+    """
+    GCRA state in an mmap-backed hash table shared by every worker process
+    on the host, so the limit holds regardless of which worker gets the
+    request. The table is split into stripes; each stripe is guarded by an
+    fcntl byte-range lock and keys only probe inside their own stripe.
+
+    The lock is taken on the event loop, so it is never waited on
+    indefinitely: holders only read up to max_probe slots and write one
+    (no I/O, no await), and a stripe that stays locked for lock_timeout
+    seconds (a holder descheduled mid-update) lets the request through.
+
+    Slot layout: 8-byte key fingerprint (0 = empty) + 8-byte double TAT.
+    """
+
+    SLOT = struct.Struct("<Qd")
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        stripes: int = 64,
+        slots_per_stripe: int = 1024,
+        max_probe: int = 16,
+        lock_timeout: float = 0.005
+    ):
+        if fcntl is None:
+            raise RuntimeError("Shared memory rate limiting requires fcntl (POSIX)")
+
+        shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        self.path = path or os.path.join(shm_dir, "duo-previa-ratelimit.bin")
+        self.stripes = stripes
+        self.slots_per_stripe = slots_per_stripe
+        self.max_probe = min(max_probe, slots_per_stripe)
+        self.stripe_size = slots_per_stripe * self.SLOT.size
+        self.lock_timeout = lock_timeout
+        self.lock_timeouts = 0
+        size = stripes * self.stripe_size
+
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._mm = mmap.mmap(self._fd, size)
+
+    def _locate(self, key: str):
+        fingerprint = int.from_bytes(
+            hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little"
+        ) or 1
+        stripe = fingerprint % self.stripes
+        start = (fingerprint >> 16) % self.slots_per_stripe
+        return fingerprint, stripe, start
+
+    def _lock(self, stripe: int) -> bool:
+        """Lock a stripe, polling without blocking for at most lock_timeout seconds"""
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                fcntl.lockf(
+                    self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB,
+                    self.stripe_size, stripe * self.stripe_size, os.SEEK_SET
+                )
+                return True
+            except OSError as e:
+                if e.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+            if time.monotonic() >= deadline:
+                self.lock_timeouts += 1
+                logger.warning(f"Rate limit stripe {stripe} still locked after {self.lock_timeout}s, allowing request")
+                return False
+            time.sleep(0.0001)
+
+    def _unlock(self, stripe: int):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, self.stripe_size, stripe * self.stripe_size, os.SEEK_SET)
+
+    def _probe(self, fingerprint: int, stripe: int, start: int, now: float):
+        """
+        (offset, tat) of the key's slot, else of the first free/drained slot,
+        else of the slot with the oldest TAT in the probe window. The stripe
+        must be locked; tat is None when the key has no slot.
+        """
+        base = stripe * self.stripe_size
+        free = oldest = None
+        oldest_tat = now
+        for probe in range(self.max_probe):
+            offset = base + ((start + probe) % self.slots_per_stripe) * self.SLOT.size
+            slot_key, slot_tat = self.SLOT.unpack_from(self._mm, offset)
+            if slot_key == fingerprint:
+                return offset, slot_tat
+            if slot_key == 0 or slot_tat <= now:
+                if free is None:
+                    free = offset
+            elif oldest is None or slot_tat < oldest_tat:
+                oldest, oldest_tat = offset, slot_tat
+        return (free if free is not None else oldest), None
+
+    def hit(self, key: str, limit: RateLimit, now: float) -> float:
+        """Register a request; returns seconds to wait (0.0 if allowed)"""
+        fingerprint, stripe, start = self._locate(key)
+        if not self._lock(stripe):
+            return 0.0
+        try:
+            target, tat = self._probe(fingerprint, stripe, start, now)
+            if tat is None or tat < now:
+                tat = now
+            new_tat = tat + limit.emission_interval
+            allow_at = new_tat - limit.period
+            if now < allow_at:
+                return allow_at - now
+            self.SLOT.pack_into(self._mm, target, fingerprint, new_tat)
+            return 0.0
+        finally:
+            self._unlock(stripe)
+
+    def refund(self, key: str, limit: RateLimit, now: float):
+        """Give back one allowed request (it was rejected by another key)"""
+        fingerprint, stripe, start = self._locate(key)
+        if not self._lock(stripe):
+            return
+        try:
+            target, tat = self._probe(fingerprint, stripe, start, now)
+            if tat is not None:
+                self.SLOT.pack_into(self._mm, target, fingerprint, max(now, tat - limit.emission_interval))
+        finally:
+            self._unlock(stripe)
+
+    def evict_idle(self, now: float) -> int:
+        # Fixed-size table: drained slots are reused in place by hit()
+        return 0
+
+    def __len__(self) -> int:
+        return sum(
+            1 for offset in range(0, len(self._mm), self.SLOT.size)
+            if self.SLOT.unpack_from(self._mm, offset)[0]
+        )
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+class MongoGCRAStore:
+    """
+    GCRA state in a Mongo collection for multi-host deployments. Each hit is
+    one atomic find_one_and_update with an update pipeline; a TTL index on
+    expire_at drops drained keys. If Mongo fails the request is allowed:
+    losing the limiter for a moment beats failing every request.
+    """
+
+    def __init__(self, collection_name: str = "rate_limits"):
+        self.collection_name = collection_name
+        self._collection = None
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            from db.mongo import get_collection
+            self._collection = get_collection(self.collection_name)
+        return self._collection
+
+    async def hit(self, key: str, limit: RateLimit, now: float) -> float:
+        from pymongo import ReturnDocument
+        from pymongo.errors import PyMongoError
+
+        prev_tat = {"$max": [{"$ifNull": ["$tat", now]}, now]}
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": key},
+                [
+                    {"$set": {"prev_tat": prev_tat}},
+                    {"$set": {"allowed": {"$lte": [
+                        {"$subtract": [{"$add": ["$prev_tat", limit.emission_interval]}, limit.period]},
+                        now
+                    ]}}},
+                    {"$set": {
+                        "tat": {"$cond": [
+                            "$allowed",
+                            {"$add": ["$prev_tat", limit.emission_interval]},
+                            {"$ifNull": ["$tat", now]}
+                        ]}
+                    }},
+                    {"$set": {"expire_at": {"$toDate": {"$multiply": ["$tat", 1000]}}}}
+                ],
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except PyMongoError as e:
+            logger.error(f"Rate limit store unavailable, allowing request: {e}")
+            return 0.0
+        if doc["allowed"]:
+            return 0.0
+        return max(0.0, doc["prev_tat"] + limit.emission_interval - limit.period - now)
+
+    async def refund(self, key: str, limit: RateLimit, now: float):
+        """Give back one allowed request (it was rejected by another key)"""
+        from pymongo.errors import PyMongoError
+
+        try:
+            await self.collection.update_one(
+                {"_id": key},
+                [{"$set": {"tat": {"$max": [now, {"$subtract": ["$tat", limit.emission_interval]}]}}}]
+            )
+        except PyMongoError as e:
+            logger.error(f"Rate limit store unavailable, refund skipped: {e}")
+
+    def evict_idle(self, now: float) -> int:
+        # Handled by the TTL index on expire_at
+        return 0
+
+class GCRALimiter:
+    """Generic cell rate limiter over a pluggable store"""
+
+    def __init__(self, store=None):
+        self.store = store or InMemoryGCRAStore()
+
+    async def hit(self, key: str, limit: RateLimit) -> float:
+        wait = self.store.hit(key, limit, time.time())
+        if inspect.isawaitable(wait):
+            wait = await wait
+        return wait
+
+    async def refund(self, key: str, limit: RateLimit):
+        result = self.store.refund(key, limit, time.time())
+        if inspect.isawaitable(result):
+            await result
+
+    def evict_idle(self) -> int:
+        return self.store.evict_idle(time.time())
+
+def create_limiter() -> GCRALimiter:
+    """
+    Backend from RATE_LIMIT_BACKEND: "memory" (per process), "shared"
+    (mmap table shared by the workers on this host) or "mongo" (multi-host).
+    """
+    backend = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    if backend == "shared":
+        try:
+            return GCRALimiter(SharedMemoryGCRAStore(os.getenv("RATE_LIMIT_SHM_PATH")))
+        except (RuntimeError, OSError) as e:
+            logger.error(f"Shared rate limit table unavailable, using in-process limiter: {e}")
+    elif backend == "mongo":
+        return GCRALimiter(MongoGCRAStore())
+    return GCRALimiter()
+
+# Tenant slug from /api/{slug}/... and /api/restaurants/{slug}
+TENANT_PATH = re.compile(r"^/api/(?:restaurants/)?(?P<slug>[a-z0-9-]+)(?:/|$)")
+
+def get_tenant_slug(path: str) -> Optional[str]:
+    match = TENANT_PATH.match(path)
+    return match.group("slug") if match else None
+
+def default_policies(calls: int, period: int) -> List[RateLimitPolicy]:
+    """
+    Route groups, first match wins. `calls`/`period` (RATE_LIMIT_CALLS /
+    RATE_LIMIT_PERIOD) remain the limit for anything not listed.
+    """
+    return [
+        RateLimitPolicy("auth", r"^/auth/", calls=20, period=60),
+        RateLimitPolicy("admin", r"^/superadmin/", calls=120, period=60),
+        RateLimitPolicy("metrics", r"^/metrics$", calls=60, period=60),
+        RateLimitPolicy(
+            "order_create", r"^/api/[^/]+/orders/?$", methods=["POST"],
+            calls=10, period=60, tenant_calls=600, tenant_period=60
+        ),
+        RateLimitPolicy(
+            "public_menu", r"^/api/", methods=["GET", "HEAD"],
+            calls=600, period=60, tenant_calls=20000, tenant_period=60
+        ),
+        RateLimitPolicy("api_write", r"^/api/", calls=300, period=60),
+        RateLimitPolicy("default", r"", calls=calls, period=period),
+    ]
+
+def load_policies(calls: int, period: int) -> List[RateLimitPolicy]:
+    """Policies from RATE_LIMIT_POLICIES (JSON list) or the defaults"""
+    raw = os.getenv("RATE_LIMIT_POLICIES")
+    if not raw:
+        return default_policies(calls, period)
+
+    try:
+        policies = [RateLimitPolicy(**policy) for policy in json.loads(raw)]
+    except (ValueError, TypeError) as e:
+        logger.error(f"Invalid RATE_LIMIT_POLICIES, using defaults: {e}")
+        return default_policies(calls, period)
+
+    if not any(policy.path.pattern == "" for policy in policies):
+        policies.append(RateLimitPolicy("default", r"", calls=calls, period=period))
+    return policies
@@ -1,130 +1,231 @@
+import os
+import re
 import time
+import math
 import logging
-from typing import Dict, Optional
-from fastapi import Request, Response, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from typing import Dict, List, Optional
+from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from collections import defaultdict, deque
+from fastapi.encoders import jsonable_encoder
+from urllib.parse import parse_qsl
+from utils.structured_logging import request_sampler
+from db.profiler import query_profiler
+from middleware.metrics import rate_limit_rejections
+from middleware.rate_limit import (
+    GCRALimiter, RateLimit, RateLimitPolicy, create_limiter, get_tenant_slug, load_policies
+)
 import asyncio
+import hashlib
 import uuid
 
 logger = logging.getLogger(__name__)
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """Rate limiting middleware to prevent API abuse"""
-    
-    def __init__(self, app, calls: int = 100, period: int = 3600):
-        super().__init__(app)
-        self.calls = calls  # max calls per period
-        self.period = period  # period in seconds
-        self.clients = defaultdict(lambda: deque())
-    
-    async def dispatch(self, request: Request, call_next):
-        # Get client IP
-        client_ip = self._get_client_ip(request)
-        
-        # Check rate limit
-        if self._is_rate_limited(client_ip):
-            return JSONResponse(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                content={
-                    "error": "Rate limit exceeded",
-                    "detail": f"Max {self.calls} requests per {self.period} seconds",
-                    "retry_after": self.period
-                }
-            )
-        
-        # Add request to client history
-        self._add_request(client_ip)
-        
-        response = await call_next(request)
-        return response
-    
-    def _get_client_ip(self, request: Request) -> str:
-        """Extract client IP from request"""
-        # Check for forwarded headers (when behind proxy)
-        forwarded_for = request.headers.get("X-Forwarded-For")
+def _get_header(scope, name: bytes) -> Optional[str]:
+    """Read a raw ASGI header (names are lower-case bytes)"""
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+# Number of reverse proxies in front of the app that append to X-Forwarded-For;
+# entries left of the ones they added are client-supplied and ignored
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+
+def get_client_ip(scope) -> str:
+    """Extract client IP from the ASGI scope"""
+    if TRUSTED_PROXY_COUNT:
+        forwarded_for = _get_header(scope, b"x-forwarded-for")
         if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
+            hops = [hop.strip() for hop in forwarded_for.split(",")]
+            return hops[-min(TRUSTED_PROXY_COUNT, len(hops))]
+    
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+class RateLimitMiddleware:
+    """
+    Rate limiting middleware to prevent API abuse. Uses GCRA (one float of
+    state per key) with per-route-group policies, limiting per client IP
+    and, for tenant routes, per restaurant slug.
+    """
+    
+    def __init__(
+        self,
+        app,
+        calls: int = 100,
+        period: int = 3600,
+        policies: Optional[List[RateLimitPolicy]] = None,
+        limiter: Optional[GCRALimiter] = None,
+        eviction_interval: float = 60.0
+    ):
+        self.app = app
+        self.calls = calls  # default max calls per period
+        self.period = period  # default period in seconds
+        self.policies = policies or load_policies(calls, period)
+        self.limiter = limiter or create_limiter()
+        self.eviction_interval = eviction_interval
+        self._eviction_task: Optional[asyncio.Task] = None
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
+        if self._eviction_task is None:
+            self._eviction_task = asyncio.create_task(self._evict_idle_keys())
         
-        return request.client.host
-    
-    def _is_rate_limited(self, client_ip: str) -> bool:
-        """Check if client has exceeded rate limit"""
-        now = time.time()
-        client_requests = self.clients[client_ip]
+        policy = self._match_policy(scope["method"], scope["path"])
+        checks = [(f"{policy.name}:ip:{get_client_ip(scope)}", policy.ip_limit)]
+        if policy.tenant_limit:
+            tenant_slug = get_tenant_slug(scope["path"])
+            if tenant_slug:
+                checks.append((f"{policy.name}:tenant:{tenant_slug}", policy.tenant_limit))
         
-        # Remove old requests outside the time window
-        while client_requests and client_requests[0] < now - self.period:
-            client_requests.popleft()
+        # Check rate limit
+        charged = []
+        for key, limit in checks:
+            retry_after = await self._is_rate_limited(key, limit)
+            if retry_after:
+                # A rejected request must not use up the keys checked before
+                for charged_key, charged_limit in charged:
+                    await self.limiter.refund(charged_key, charged_limit)
+                rate_limit_rejections.inc(policy.name)
+                retry_after = max(1, math.ceil(retry_after))
+                response = JSONResponse(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    content={
+                        "error": "Rate limit exceeded",
+                        "detail": f"Max {limit.calls} requests per {limit.period} seconds",
+                        "retry_after": retry_after
+                    },
+                    headers={"Retry-After": str(retry_after)}
+                )
+                await response(scope, receive, send)
+                return
+            charged.append((key, limit))
         
-        return len(client_requests) >= self.calls
+        await self.app(scope, receive, send)
     
-    def _add_request(self, client_ip: str):
-        """Add current request to client history"""
-        self.clients[client_ip].append(time.time())
+    def _match_policy(self, method: str, path: str) -> RateLimitPolicy:
+        for policy in self.policies:
+            if policy.matches(method, path):
+                return policy
+        return self.policies[-1]
+    
+    async def _is_rate_limited(self, key: str, limit: RateLimit) -> float:
+        """Register the request; seconds until allowed if limited, else 0"""
+        return await self.limiter.hit(key, limit)
+    
+    async def _evict_idle_keys(self):
+        """Drop keys whose GCRA state has fully drained"""
+        while True:
+            await asyncio.sleep(self.eviction_interval)
+            try:
+                self.limiter.evict_idle()
+            except Exception as e:
+                logger.error(f"Error evicting rate limit keys: {e}")
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+class SecurityHeadersMiddleware:
     """Add security headers to all responses"""
     
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
+    SECURITY_HEADERS = [
+        ("X-Content-Type-Options", "nosniff"),
+        ("X-Frame-Options", "DENY"),
+        ("X-XSS-Protection", "1; mode=block"),
+        ("Strict-Transport-Security", "max-age=31536000; includeSubDomains"),
+        ("Referrer-Policy", "strict-origin-when-cross-origin"),
+        ("Content-Security-Policy", "default-src 'self'"),
+    ]
+    
+    # Precomputed raw header pairs, appended as-is to every response
+    RAW_HEADERS = [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in SECURITY_HEADERS
+    ]
+    RAW_HEADER_NAMES = frozenset(name for name, _ in RAW_HEADERS)
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Add security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        response.headers["Content-Security-Policy"] = "default-src 'self'"
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                # Override any value set by the app, as before
+                headers = [
+                    header for header in message.get("headers", [])
+                    if header[0].lower() not in self.RAW_HEADER_NAMES
+                ]
+                headers.extend(self.RAW_HEADERS)
+                message["headers"] = headers
+            await send(message)
         
-        return response
+        await self.app(scope, receive, send_with_headers)
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class RequestLoggingMiddleware:
     """Structured logging for all requests"""
     
-    async def dispatch(self, request: Request, call_next):
-        # Generate correlation ID
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        # Generate correlation ID (visible as request.state.correlation_id)
         correlation_id = str(uuid.uuid4())
-        request.state.correlation_id = correlation_id
+        scope.setdefault("state", {})["correlation_id"] = correlation_id
+        raw_correlation_id = correlation_id.encode("latin-1")
         
         start_time = time.time()
+        request_sampler.start_request()
+        queries = query_profiler.begin_request(correlation_id)
         
-        # Log request
-        logger.info(
-            "Request started",
-            extra={
-                "correlation_id": correlation_id,
-                "method": request.method,
-                "url": str(request.url),
-                "client_ip": self._get_client_ip(request),
-                "user_agent": request.headers.get("user-agent", "")
-            }
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Request started",
+                extra={"correlation_id": correlation_id, "method": scope["method"], "path": scope["path"]}
+            )
+        
+        async def send_with_correlation_id(message):
+            if message["type"] == "http.response.start":
+                # One record per request with the request and response fields;
+                # successful fast requests are subject to sampling
+                process_time = time.time() - start_time
+                route = scope.get("route")
+                query_profiler.end_request(queries, scope["method"], getattr(route, "path", scope["path"]))
+                if request_sampler.finish_request(message["status"], process_time):
+                    logger.info(
+                        "Request completed",
+                        extra={
+                            "correlation_id": correlation_id,
+                            "method": scope["method"],
+                            "path": scope["path"],
+                            "query": scope.get("query_string", b"").decode("latin-1"),
+                            "client_ip": get_client_ip(scope),
+                            "user_agent": _get_header(scope, b"user-agent") or "",
+                            "status_code": message["status"],
+                            "process_time": round(process_time, 3),
+                            "db_queries": queries.total,
+                            "input_scan_us": scope["state"].get("input_scan_us")
+                        }
+                    )
+                
+                # Add correlation ID to response headers
+                headers = [
+                    header for header in message.get("headers", [])
+                    if header[0].lower() != b"x-correlation-id"
+                ]
+                headers.append((b"x-correlation-id", raw_correlation_id))
+                message["headers"] = headers
+            await send(message)
         
         try:
-            response = await call_next(request)
-            
-            # Log response
-            process_time = time.time() - start_time
-            logger.info(
-                "Request completed",
-                extra={
-                    "correlation_id": correlation_id,
-                    "status_code": response.status_code,
-                    "process_time": round(process_time, 3)
-                }
-            )
-            
-            # Add correlation ID to response headers
-            response.headers["X-Correlation-ID"] = correlation_id
-            
-            return response
+            await self.app(scope, receive, send_with_correlation_id)
             
         except Exception as e:
             # Log error
@@ -133,108 +234,223 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
                 "Request failed",
                 extra={
                     "correlation_id": correlation_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
                     "error": str(e),
                     "process_time": round(process_time, 3)
                 },
                 exc_info=True
             )
             raise
+
+class InputScanMetrics:
+    """Aggregate cost of InputValidationMiddleware scans"""
     
-    def _get_client_ip(self, request: Request) -> str:
-        """Extract client IP from request"""
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
-        
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
-        
-        return request.client.host
+    def __init__(self):
+        self.requests = 0
+        self.blocked = 0
+        self.bytes_scanned = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+    
+    def record(self, seconds: float, bytes_scanned: int, blocked: bool):
+        self.requests += 1
+        self.bytes_scanned += bytes_scanned
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        if blocked:
+            self.blocked += 1
+    
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "blocked": self.blocked,
+            "bytes_scanned": self.bytes_scanned,
+            "avg_scan_us": round(self.total_seconds / self.requests * 1e6, 2) if self.requests else 0.0,
+            "max_scan_us": round(self.max_seconds * 1e6, 2)
+        }
+
+input_scan_metrics = InputScanMetrics()
 
-class InputValidationMiddleware(BaseHTTPMiddleware):
-    """Additional input validation and sanitization"""
+class InputValidationMiddleware:
+    """
+    Additional input validation and sanitization. Query values and JSON/text
+    request bodies are checked against one precompiled alternation of the
+    suspicious patterns. Bodies are scanned chunk by chunk as the app reads
+    them (never buffered), up to `max_body_bytes`. The time spent is left in
+    request.state.input_scan_us for the request log line.
+    
+    Bodies of EXEMPT_BODY_PATHS are not scanned: a block halfway through a
+    bulk import would land after earlier batches were written, so the
+    importer checks each row itself and reports it.
+    """
     
     SUSPICIOUS_PATTERNS = [
         r'<script.*?>.*?</script>',  # XSS
         r'javascript:',  # XSS
-        r'on\w+\s*=',  # Event handlers
+        r'\bon\w+\s*=',  # Event handlers
         r'eval\s*\(',  # Code injection
         r'union\s+select',  # SQL injection
         r'drop\s+table',  # SQL injection
     ]
     
-    async def dispatch(self, request: Request, call_next):
+    SUSPICIOUS_RE = re.compile("|".join(f"(?:{p})" for p in SUSPICIOUS_PATTERNS), re.IGNORECASE)
+    SUSPICIOUS_BYTES_RE = re.compile(
+        b"|".join(b"(?:" + p.encode("ascii") + b")" for p in SUSPICIOUS_PATTERNS), re.IGNORECASE
+    )
+    
+    # Bytes carried over between chunks so matches spanning a boundary are found
+    CHUNK_OVERLAP = 256
+    SCANNED_CONTENT_TYPES = (b"application/json", b"text/")
+    EXEMPT_BODY_PATHS = re.compile(r"^/api/[^/]+/products/import/?$")
+    
+    def __init__(self, app, max_body_bytes: Optional[int] = None, metrics: Optional[InputScanMetrics] = None):
+        self.app = app
+        self.max_body_bytes = max_body_bytes if max_body_bytes is not None else int(
+            os.getenv("INPUT_SCAN_MAX_BYTES", "65536")
+        )
+        self.metrics = metrics or input_scan_metrics
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        
         # Check for suspicious patterns in query parameters
-        if request.query_params:
-            for key, value in request.query_params.items():
+        if scope.get("query_string"):
+            query_params = dict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+            for key, value in query_params.items():
                 if self._contains_suspicious_content(value):
-                    logger.warning(
-                        "Suspicious input detected",
-                        extra={
-                            "correlation_id": getattr(request.state, 'correlation_id', 'unknown'),
-                            "parameter": key,
-                            "value": value[:100],  # Log first 100 chars only
-                            "client_ip": self._get_client_ip(request)
-                        }
-                    )
-                    return JSONResponse(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        content={
-                            "error": "Invalid input detected",
-                            "detail": "Request contains suspicious content"
-                        }
-                    )
+                    self._log_suspicious(scope, key, value)
+                    self.metrics.record(time.perf_counter() - started, 0, True)
+                    await self._reject(scope, receive, send)
+                    return
         
-        return await call_next(request)
-    
-    def _contains_suspicious_content(self, content: str) -> bool:
-        """Check if content contains suspicious patterns"""
-        import re
-        content_lower = content.lower()
+        scan_seconds = time.perf_counter() - started
+        # Read by RequestLoggingMiddleware when the response starts
+        state = scope.setdefault("state", {})
+        state["input_scan_us"] = round(scan_seconds * 1e6, 1)
         
-        for pattern in self.SUSPICIOUS_PATTERNS:
-            if re.search(pattern, content_lower, re.IGNORECASE):
-                return True
+        content_type = (_get_header(scope, b"content-type") or "").encode("latin-1").lower()
+        if not content_type.startswith(self.SCANNED_CONTENT_TYPES) or self.EXEMPT_BODY_PATHS.match(scope["path"]):
+            self.metrics.record(scan_seconds, 0, False)
+            await self.app(scope, receive, send)
+            return
         
-        return False
-    
-    def _get_client_ip(self, request: Request) -> str:
-        """Extract client IP from request"""
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
+        scan = {"bytes": 0, "tail": b"", "seconds": scan_seconds, "blocked": False}
         
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
+        async def scanning_receive():
+            message = await receive()
+            if message["type"] != "http.request" or scan["blocked"]:
+                return message
+            
+            remaining = self.max_body_bytes - scan["bytes"]
+            chunk = message.get("body", b"")
+            if remaining <= 0 or not chunk:
+                return message
+            
+            chunk_started = time.perf_counter()
+            chunk = chunk[:remaining]
+            window = scan["tail"] + chunk
+            match = self.SUSPICIOUS_BYTES_RE.search(window)
+            scan["bytes"] += len(chunk)
+            scan["tail"] = window[-self.CHUNK_OVERLAP:]
+            scan["seconds"] += time.perf_counter() - chunk_started
+            state["input_scan_us"] = round(scan["seconds"] * 1e6, 1)
+            
+            if match:
+                scan["blocked"] = True
+                value = window[max(0, match.start() - 20):match.end() + 20].decode("utf-8", "replace")
+                self._log_suspicious(scope, "body", value)
+                await self._reject(scope, receive, send)
+                # Make the app stop reading; its response is dropped below
+                return {"type": "http.disconnect"}
+            
+            return message
         
-        return request.client.host
+        async def guarded_send(message):
+            if not scan["blocked"]:
+                await send(message)
+        
+        try:
+            await self.app(scope, scanning_receive, guarded_send)
+        except Exception:
+            if not scan["blocked"]:
+                raise
+        finally:
+            self.metrics.record(scan["seconds"], scan["bytes"], scan["blocked"])
+    
+    def _contains_suspicious_content(self, content: str) -> bool:
+        """Check if content contains suspicious patterns"""
+        return self.SUSPICIOUS_RE.search(content) is not None
+    
+    def _log_suspicious(self, scope, parameter: str, value: str):
+        logger.warning(
+            "Suspicious input detected",
+            extra={
+                "correlation_id": scope.get("state", {}).get("correlation_id", "unknown"),
+                "parameter": parameter,
+                "value": value[:100],  # Log first 100 chars only
+                "client_ip": get_client_ip(scope)
+            }
+        )
+    
+    async def _reject(self, scope, receive, send):
+        response = JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "error": "Invalid input detected",
+                "detail": "Request contains suspicious content"
+            }
+        )
+        await response(scope, receive, send)
 
 # API Key validation for additional security
 class APIKeyValidator:
-    """Validate API keys for sensitive endpoints"""
+    """
+    Resolve API keys against an in-memory index of SHA-256 key hashes.
+    Keys are high-entropy random strings, so a single fast hash is enough
+    and no bcrypt or database call is needed per request.
+    """
     
-    def __init__(self, valid_keys: Optional[Dict[str, str]] = None):
+    def __init__(self, valid_keys: Optional[Dict[str, dict]] = None):
+        # key hash -> client principal
         self.valid_keys = valid_keys or {}
     
-    def validate_api_key(self, api_key: str) -> Optional[str]:
-        """Validate API key and return associated user/client"""
-        if api_key in self.valid_keys:
-            return self.valid_keys[api_key]
-        return None
+    @staticmethod
+    def hash_key(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    
+    def load(self, valid_keys: Dict[str, dict]):
+        """Swap the whole index atomically"""
+        self.valid_keys = valid_keys
+    
+    def add(self, key_hash: str, client: dict):
+        self.valid_keys[key_hash] = client
+    
+    def remove(self, key_hash: str):
+        self.valid_keys.pop(key_hash, None)
+    
+    def validate_api_key(self, api_key: str) -> Optional[dict]:
+        """Validate API key and return associated client"""
+        return self.valid_keys.get(self.hash_key(api_key))
 
 # Enhanced error handler
 async def validation_exception_handler(request: Request, exc):
     """Handle Pydantic validation errors with structured response"""
     correlation_id = getattr(request.state, 'correlation_id', str(uuid.uuid4()))
+    # Validator errors carry the raised exception in "ctx"
+    errors = jsonable_encoder(exc.errors())
     
     logger.warning(
         "Validation error",
         extra={
             "correlation_id": correlation_id,
-            "errors": exc.errors(),
-            "client_ip": request.headers.get("X-Forwarded-For", request.client.host)
+            "errors": errors,
+            "client_ip": get_client_ip(request.scope)
         }
     )
     
@@ -244,7 +460,7 @@ async def validation_exception_handler(request: Request, exc):
             "error": "Validation failed",
             "detail": "The provided data is invalid",
             "correlation_id": correlation_id,
-            "errors": exc.errors()
+            "errors": errors
         }
     )
 
@@ -258,7 +474,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
             "correlation_id": correlation_id,
             "status_code": exc.status_code,
             "detail": exc.detail,
-            "client_ip": request.headers.get("X-Forwarded-For", request.client.host)
+            "client_ip": get_client_ip(request.scope)
         }
     )
     
@@ -268,7 +484,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
             "error": "Request failed",
             "detail": exc.detail,
             "correlation_id": correlation_id
-        }
+        },
+        headers=getattr(exc, "headers", None)
     )
 
 async def general_exception_handler(request: Request, exc: Exception):
@@ -280,7 +497,7 @@ async def general_exception_handler(request: Request, exc: Exception):
         extra={
             "correlation_id": correlation_id,
             "error": str(exc),
-            "client_ip": request.headers.get("X-Forwarded-For", request.client.host)
+            "client_ip": get_client_ip(request.scope)
         },
         exc_info=True
     )
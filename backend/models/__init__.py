@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr, validator
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Generic, TypeVar
 import datetime # Importar el módulo datetime completo
 from enum import Enum
 from bson import ObjectId
@@ -56,6 +56,13 @@ class BaseDocument(BaseModel):
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str}
 
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    """One page of a keyset-paginated listing"""
+    items: List[T]
+    next_cursor: Optional[str] = None
+
 # ===== RESTAURANT MODELS =====
 class RestaurantColors(BaseModel):
     primary: str = "#FF6B35"
@@ -251,6 +258,37 @@ class ProductResponse(BaseModel):
     rating: float
     rating_count: int
 
+# ===== BULK CATALOG MODELS =====
+BULK_CATALOG_MAX_ITEMS = 500
+
+class ProductPatch(BaseModel):
+    product_id: str
+    is_available: Optional[bool] = None
+    price: Optional[float] = Field(None, gt=0)
+
+class CategoryPriceAdjustment(BaseModel):
+    category_id: str
+    percent: float = Field(..., gt=-100, le=1000)  # 10 = +10%, -15 = -15%
+
+class CategoryOrder(BaseModel):
+    category_id: str
+    display_order: int
+
+class CatalogBulkUpdate(BaseModel):
+    products: List[ProductPatch] = Field([], max_length=BULK_CATALOG_MAX_ITEMS)
+    price_adjustments: List[CategoryPriceAdjustment] = Field([], max_length=BULK_CATALOG_MAX_ITEMS)
+    category_order: List[CategoryOrder] = Field([], max_length=BULK_CATALOG_MAX_ITEMS)
+
+class BulkItemResult(BaseModel):
+    id: str
+    status: str  # updated | not_found | invalid | failed
+    error: Optional[str] = None
+
+class CatalogBulkResult(BaseModel):
+    products: List[BulkItemResult] = []
+    price_adjustments: List[BulkItemResult] = []
+    category_order: List[BulkItemResult] = []
+
 # ===== ORDER MODELS =====
 class OrderItemCustomization(BaseModel):
     size: Optional[str] = None
@@ -340,6 +378,27 @@ class TokenResponse(BaseModel):
     expires_in: int
     user: dict
 
+class APIKeyPermission(str, Enum):
+    ORDERS_READ = "orders:read"
+    ORDERS_WRITE = "orders:write"
+    PRODUCTS_WRITE = "products:write"
+
+class APIKeyCreate(BaseModel):
+    name: str
+    permissions: List[APIKeyPermission] = [APIKeyPermission.ORDERS_READ]
+
+class APIKeyResponse(BaseModel):
+    id: str
+    name: str
+    key_prefix: str
+    restaurant_slug: str
+    permissions: List[APIKeyPermission]
+    is_active: bool
+    created_at: datetime.datetime
+
+class APIKeyCreated(APIKeyResponse):
+    api_key: str  # Solo se devuelve al crearla
+
 # ===== ANALYTICS MODELS =====
 class DashboardAnalytics(BaseModel):
     total_orders_today: int
@@ -357,12 +416,13 @@ class WebhookEvent(BaseModel):
     timestamp: datetime.datetime = Field(default_factory=datetime.datetime.utcnow) # Usar datetime.datetime
 
 __all__ = [
-    "PyObjectId", "OrderStatus", "UserRole", "PaymentMethod", "BaseDocument",
+    "PyObjectId", "OrderStatus", "UserRole", "PaymentMethod", "BaseDocument", "Page",
     "RestaurantColors", "DeliveryZone", "RestaurantSettings", "Restaurant", "RestaurantCreate", "RestaurantUpdate", "RestaurantResponse",
     "User", "UserCreate",
     "Category", "CategoryCreate", "CategoryUpdate", "CategoryResponse",
     "ProductSize", "ProductTopping", "Product", "ProductCreate", "ProductUpdate", "ProductResponse",
     "OrderItemCustomization", "OrderItem", "CustomerInfo", "Order", "OrderCreate", "OrderStatusUpdate", "OrderResponse",
     "LoginRequest", "RefreshTokenRequest", "TokenResponse",
+    "APIKeyPermission", "APIKeyCreate", "APIKeyResponse", "APIKeyCreated",
     "DashboardAnalytics", "WebhookEvent"
 ]
\ No newline at end of file
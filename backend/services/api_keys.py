@@ -0,0 +1,163 @@
+import os
+import time
+import asyncio
+import secrets
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+from db.mongo import get_collection
+from models import APIKeyCreate, APIKeyCreated, APIKeyResponse
+from middleware.security import APIKeyValidator
+from utils.singleflight import SingleFlight
+import logging
+
+logger = logging.getLogger(__name__)
+
+API_KEY_PREFIX = "dp"
+
+# Process-wide index of active keys, refreshed from Mongo every API_KEY_INDEX_TTL seconds
+api_key_validator = APIKeyValidator()
+_index_flight = SingleFlight()
+# key hash -> (when, client or None if revoked) for keys this worker created or
+# revoked; a refresh whose query may predate the change re-applies it on top
+_local_changes: Dict[str, Tuple[float, Optional[dict]]] = {}
+
+class APIKeyService:
+    def __init__(self):
+        self.collection = get_collection("api_keys")
+        self.validator = api_key_validator
+        self.index_ttl = float(os.getenv("API_KEY_INDEX_TTL", "60"))
+        self.loaded_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _to_client(key_doc: dict) -> dict:
+        """Principal shape compatible with get_current_user"""
+        return {
+            "id": key_doc["key_prefix"],
+            "username": f"api-key:{key_doc['name']}",
+            "role": "api_key",
+            "restaurant_slug": key_doc["restaurant_slug"],
+            "permissions": list(key_doc.get("permissions", []))
+        }
+
+    @staticmethod
+    def _to_response(key_doc: dict) -> dict:
+        return {
+            "id": str(key_doc["_id"]),
+            "name": key_doc["name"],
+            "key_prefix": key_doc["key_prefix"],
+            "restaurant_slug": key_doc["restaurant_slug"],
+            "permissions": key_doc.get("permissions", []),
+            "is_active": key_doc["is_active"],
+            "created_at": key_doc["created_at"]
+        }
+
+    def _record_change(self, key_hash: str, client: Optional[dict]):
+        """Apply a create/revoke to the index now and to any refresh already in flight"""
+        _local_changes[key_hash] = (time.monotonic(), client)
+        if client is None:
+            self.validator.remove(key_hash)
+        else:
+            self.validator.add(key_hash, client)
+
+    async def refresh_index(self):
+        """Reload every active key hash into the in-memory index"""
+        async def load():
+            started = time.monotonic()
+            index = {}
+            cursor = self.collection.find(
+                {"is_active": True},
+                {"key_hash": 1, "key_prefix": 1, "name": 1, "restaurant_slug": 1, "permissions": 1}
+            )
+            async for key_doc in cursor:
+                index[key_doc["key_hash"]] = self._to_client(key_doc)
+            for key_hash, (changed_at, client) in list(_local_changes.items()):
+                if changed_at < started:
+                    # Written before the query ran, so the query saw it
+                    del _local_changes[key_hash]
+                elif client is None:
+                    index.pop(key_hash, None)
+                else:
+                    index[key_hash] = client
+            self.validator.load(index)
+            self.loaded_at = time.monotonic()
+            return True
+
+        try:
+            await _index_flight.do("api_keys", load)
+        except Exception as e:
+            logger.error(f"Error refreshing API key index: {e}")
+
+    async def authenticate(self, api_key: str) -> Optional[dict]:
+        """Resolve an API key from the in-memory index"""
+        if self.loaded_at is None:
+            await self.refresh_index()
+        elif time.monotonic() - self.loaded_at > self.index_ttl:
+            # Stale-while-revalidate: answer from the current index
+            self.loaded_at = time.monotonic()
+            self._refresh_task = asyncio.create_task(self.refresh_index())
+
+        return self.validator.validate_api_key(api_key)
+
+    async def create_api_key(self, restaurant_slug: str, key_data: APIKeyCreate) -> APIKeyCreated:
+        """Create a key; the plaintext value is only returned here"""
+        try:
+            key_prefix = secrets.token_hex(6)
+            api_key = f"{API_KEY_PREFIX}_{key_prefix}_{secrets.token_urlsafe(32)}"
+
+            key_doc = {
+                "name": key_data.name,
+                "key_prefix": key_prefix,
+                "key_hash": APIKeyValidator.hash_key(api_key),
+                "restaurant_slug": restaurant_slug,
+                "permissions": [p.value for p in key_data.permissions],
+                "is_active": True,
+                "created_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
+            }
+
+            result = await self.collection.insert_one(key_doc)
+            key_doc["_id"] = result.inserted_id
+            self._record_change(key_doc["key_hash"], self._to_client(key_doc))
+
+            return APIKeyCreated(api_key=api_key, **self._to_response(key_doc))
+
+        except Exception as e:
+            logger.error(f"Error creating API key: {e}")
+            raise
+
+    async def get_api_keys_by_restaurant(self, restaurant_slug: str) -> List[APIKeyResponse]:
+        """List keys of a restaurant (never returns hashes)"""
+        try:
+            cursor = self.collection.find(
+                {"restaurant_slug": restaurant_slug},
+                {"key_hash": 0}
+            ).sort("created_at", -1)
+
+            keys = []
+            async for key_doc in cursor:
+                keys.append(APIKeyResponse(**self._to_response(key_doc)))
+
+            return keys
+
+        except Exception as e:
+            logger.error(f"Error getting API keys: {e}")
+            return []
+
+    async def revoke_api_key(self, restaurant_slug: str, key_prefix: str) -> bool:
+        """Deactivate a key and drop it from the local index"""
+        try:
+            key_doc = await self.collection.find_one_and_update(
+                {"restaurant_slug": restaurant_slug, "key_prefix": key_prefix, "is_active": True},
+                {"$set": {"is_active": False, "updated_at": datetime.utcnow()}},
+                projection={"key_hash": 1}
+            )
+            if not key_doc:
+                return False
+
+            self._record_change(key_doc["key_hash"], None)
+            return True
+
+        except Exception as e:
+            logger.error(f"Error revoking API key: {e}")
+            return False
@@ -1,21 +1,175 @@
 import os
+import time
+import asyncio
 from datetime import datetime, timedelta
-from typing import Optional, Dict
+from functools import lru_cache
+from typing import Optional, Dict, Tuple
 from passlib.context import CryptContext
-from jose import JWTError, jwt
+from jose import JWTError, jwt, jwk
+from pymongo import ReturnDocument
 from db.mongo import get_collection
 from utils.converters import to_object_id, to_string_id
+from utils.cache import TTLCache
+from utils.hashing import PasswordHasher, HashingQueueFull
+from utils.singleflight import SingleFlight
 import logging
 
 logger = logging.getLogger(__name__)
 
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Shared pool that keeps bcrypt off the event loop
+password_hasher = PasswordHasher(pwd_context)
+
+# Verified principals shared by every AuthService instance in the process,
+# keyed by (username, restaurant_slug)
+principal_cache = TTLCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+)
+
+# Bumped on every invalidation so a lookup racing a revoke/role change is not cached
+_principal_versions: Dict[Tuple[str, str], int] = {}
+
+def invalidate_principal(username: str, restaurant_slug: str):
+    """Drop a cached principal so the next request re-reads the user"""
+    key = (username, restaurant_slug)
+    _principal_versions[key] = _principal_versions.get(key, 0) + 1
+    principal_cache.invalidate(key)
+
+# Concurrent /auth/refresh calls with the same refresh token share one rotation
+refresh_flight = SingleFlight(grace=float(os.getenv("REFRESH_GRACE_SECONDS", "5")))
+
+class TokenCodec:
+    """
+    JWT encode/decode with a key prepared once per process and a small LRU
+    of already verified tokens, so a dashboard re-sending the same bearer
+    token pays the signature check only once per token lifetime.
+
+    Backends: "jose" (default, python-jose) and "pyjwt" when installed.
+    Both raise jose's JWTError so callers handle errors the same way.
+    """
+
+    def __init__(self, secret_key: str, algorithm: str, backend: Optional[str] = None, cache_size: Optional[int] = None):
+        self.algorithm = algorithm
+        self.backend = backend or os.getenv("JWT_BACKEND", "jose")
+        self._verified = TTLCache(
+            maxsize=cache_size if cache_size is not None else int(os.getenv("JWT_CACHE_SIZE", "4096")),
+            ttl=0
+        )
+
+        if self.backend == "pyjwt":
+            try:
+                import jwt as pyjwt
+                self._pyjwt = pyjwt
+                self._key = secret_key
+            except ImportError:
+                logger.warning("PyJWT not installed, falling back to python-jose")
+                self.backend = "jose"
+
+        if self.backend == "jose":
+            self._key = jwk.construct(secret_key, algorithm)
+
+    def encode(self, claims: dict) -> str:
+        if self.backend == "pyjwt":
+            return self._pyjwt.encode(claims, self._key, algorithm=self.algorithm)
+        return jwt.encode(claims, self._key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        """Verify signature and expiry, returning a copy of the claims"""
+        claims = self._verified.get(token)
+        if claims is not None:
+            return dict(claims)
+
+        if self.backend == "pyjwt":
+            try:
+                claims = self._pyjwt.decode(token, self._key, algorithms=[self.algorithm])
+            except self._pyjwt.PyJWTError as e:
+                raise JWTError(str(e))
+        else:
+            claims = jwt.decode(token, self._key, algorithms=[self.algorithm])
+
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            remaining = exp - time.time()
+            if remaining > 0:
+                self._verified.set(token, claims, ttl=remaining)
+
+        return dict(claims)
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend, **self._verified.stats()}
+
+@lru_cache(maxsize=None)
+def get_token_codec(secret_key: str, algorithm: str) -> TokenCodec:
+    """Shared codec per key/algorithm so every AuthService reuses the same cache"""
+    return TokenCodec(secret_key, algorithm)
+
+class TokenEpochTable:
+    """
+    In-memory map of user_id -> (token_epoch, is_active) used by the
+    stateless verification mode. Bumping a user's epoch revokes every
+    token issued before the bump without a per-request lookup.
+    """
+
+    def __init__(self):
+        self._epochs: Dict[str, tuple] = {}
+        self.last_refresh: Optional[datetime] = None
+
+    def set(self, user_id: str, epoch: int, is_active: bool = True):
+        self._epochs[user_id] = (epoch, is_active)
+
+    def check(self, user_id: str, epoch: int) -> Optional[bool]:
+        """True if the token epoch is current, False if revoked, None if unknown"""
+        entry = self._epochs.get(user_id)
+        if entry is None:
+            return None
+        current_epoch, is_active = entry
+        return is_active and epoch == current_epoch
+
+    async def refresh(self, users_collection):
+        """Load epochs changed since the last refresh (everything on first run)"""
+        started = datetime.utcnow()
+        query = {}
+        if self.last_refresh:
+            # Small overlap so writes racing the previous refresh are not missed
+            query = {"updated_at": {"$gte": self.last_refresh - timedelta(seconds=5)}}
+
+        cursor = users_collection.find(query, {"token_epoch": 1, "is_active": 1})
+        async for user in cursor:
+            self.set(str(user["_id"]), user.get("token_epoch", 0), user.get("is_active", True))
+
+        self.last_refresh = started
+
+    async def run(self, users_collection, interval: float):
+        """Refresh periodically until cancelled"""
+        while True:
+            try:
+                await self.refresh(users_collection)
+            except Exception as e:
+                logger.error(f"Error refreshing token epochs: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self._epochs),
+            "last_refresh": self.last_refresh.isoformat() + "Z" if self.last_refresh else None
+        }
+
+token_epochs = TokenEpochTable()
+
 class AuthService:
     def __init__(self):
         self.users_collection = get_collection("users")
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self.pwd_context = pwd_context
+        self.password_hasher = password_hasher
         self.secret_key = os.getenv("SECRET_KEY", "super-secret-key")
         self.algorithm = os.getenv("ALGORITHM", "HS256")
         self.access_token_expire_minutes = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+        self.token_codec = get_token_codec(self.secret_key, self.algorithm)
+        # "database" re-reads the user per token, "stateless" trusts the claims
+        # and checks revocation against the in-memory epoch table
+        self.verify_mode = os.getenv("AUTH_VERIFY_MODE", "database")
 
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify a password against its hash"""
@@ -25,6 +179,14 @@ class AuthService:
         """Hash a password"""
         return self.pwd_context.hash(password)
 
+    async def verify_password_async(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password on the hashing pool"""
+        return await self.password_hasher.verify(plain_password, hashed_password)
+
+    async def get_password_hash_async(self, password: str) -> str:
+        """Hash a password on the hashing pool"""
+        return await self.password_hasher.hash(password)
+
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None):
         """Create JWT access token"""
         to_encode = data.copy()
@@ -34,7 +196,7 @@ class AuthService:
             expire = datetime.utcnow() + timedelta(minutes=self.access_token_expire_minutes)
         
         to_encode.update({"exp": expire})
-        encoded_jwt = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
+        encoded_jwt = self.token_codec.encode(to_encode)
         return encoded_jwt
 
     def create_refresh_token(self, data: dict):
@@ -42,7 +204,7 @@ class AuthService:
         to_encode = data.copy()
         expire = datetime.utcnow() + timedelta(days=7)  # Refresh token lasts 7 days
         to_encode.update({"exp": expire, "type": "refresh"})
-        encoded_jwt = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
+        encoded_jwt = self.token_codec.encode(to_encode)
         return encoded_jwt
 
     async def create_user(self, username: str, password: str, restaurant_slug: str, role: str = "admin"):
@@ -59,21 +221,68 @@ class AuthService:
 
             user_doc = {
                 "username": username,
-                "password_hash": self.get_password_hash(password),
+                "password_hash": await self.get_password_hash_async(password),
                 "role": role,
                 "restaurant_slug": restaurant_slug,
                 "is_active": True,
+                "token_epoch": 0,
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
             }
 
             result = await self.users_collection.insert_one(user_doc)
+            invalidate_principal(username, restaurant_slug)
+            token_epochs.set(str(result.inserted_id), 0)
             return str(result.inserted_id)
 
         except Exception as e:
             logger.error(f"Error creating user: {e}")
             raise
 
+    async def _revoke_tokens(self, username: str, restaurant_slug: str, changes: dict) -> bool:
+        """Apply changes, bump the token epoch and drop cached state"""
+        changes["updated_at"] = datetime.utcnow()
+        user = await self.users_collection.find_one_and_update(
+            {"username": username, "restaurant_slug": restaurant_slug},
+            {"$set": changes, "$inc": {"token_epoch": 1}},
+            projection={"token_epoch": 1, "is_active": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        invalidate_principal(username, restaurant_slug)
+        if not user:
+            return False
+
+        token_epochs.set(str(user["_id"]), user.get("token_epoch", 0), user.get("is_active", True))
+        return True
+
+    async def deactivate_user(self, username: str, restaurant_slug: str) -> bool:
+        """Deactivate a user and revoke its tokens"""
+        try:
+            return await self._revoke_tokens(username, restaurant_slug, {"is_active": False})
+
+        except Exception as e:
+            logger.error(f"Error deactivating user: {e}")
+            return False
+
+    async def update_user_role(self, username: str, restaurant_slug: str, role: str) -> bool:
+        """Change a user's role and revoke its tokens"""
+        try:
+            return await self._revoke_tokens(username, restaurant_slug, {"role": role})
+
+        except Exception as e:
+            logger.error(f"Error updating user role: {e}")
+            return False
+
+    async def _store_rehashed_password(self, user_id, new_hash: str):
+        """Persist a hash upgraded to the current work factor (best effort)"""
+        try:
+            await self.users_collection.update_one(
+                {"_id": user_id},
+                {"$set": {"password_hash": new_hash, "updated_at": datetime.utcnow()}}
+            )
+        except Exception as e:
+            logger.error(f"Error storing rehashed password: {e}")
+
     async def authenticate_user(self, username: str, password: str, restaurant_slug: str) -> Optional[Dict]:
         """Authenticate user and return tokens"""
         try:
@@ -83,15 +292,23 @@ class AuthService:
                 "is_active": True
             })
 
-            if not user or not self.verify_password(password, user["password_hash"]):
+            if not user:
                 return None
 
+            valid, new_hash = await self.password_hasher.verify_and_update(password, user["password_hash"])
+            if not valid:
+                return None
+
+            if new_hash:
+                await self._store_rehashed_password(user["_id"], new_hash)
+
             # Create tokens
             token_data = {
                 "sub": user["username"],
                 "restaurant_slug": restaurant_slug,
                 "role": user["role"],
-                "user_id": str(user["_id"])
+                "user_id": str(user["_id"]),
+                "epoch": user.get("token_epoch", 0)
             }
 
             access_token = self.create_access_token(data=token_data)
@@ -110,14 +327,23 @@ class AuthService:
                 }
             }
 
+        except HashingQueueFull:
+            raise
         except Exception as e:
             logger.error(f"Error authenticating user: {e}")
             return None
 
     async def refresh_access_token(self, refresh_token: str) -> Optional[Dict]:
+        """Refresh access token, coalescing concurrent calls with the same token"""
+        return await refresh_flight.do(
+            refresh_token,
+            lambda: self._refresh_access_token(refresh_token)
+        )
+
+    async def _refresh_access_token(self, refresh_token: str) -> Optional[Dict]:
         """Refresh access token using refresh token"""
         try:
-            payload = jwt.decode(refresh_token, self.secret_key, algorithms=[self.algorithm])
+            payload = self.token_codec.decode(refresh_token)
             username = payload.get("sub")
             restaurant_slug = payload.get("restaurant_slug")
             token_type = payload.get("type")
@@ -135,12 +361,16 @@ class AuthService:
             if not user:
                 return None
 
+            if "epoch" in payload and payload["epoch"] != user.get("token_epoch", 0):
+                return None
+
             # Create new tokens
             token_data = {
                 "sub": user["username"],
                 "restaurant_slug": restaurant_slug,
                 "role": user["role"],
-                "user_id": str(user["_id"])
+                "user_id": str(user["_id"]),
+                "epoch": user.get("token_epoch", 0)
             }
 
             access_token = self.create_access_token(data=token_data)
@@ -169,13 +399,32 @@ class AuthService:
     async def verify_token(self, token: str) -> Optional[Dict]:
         """Verify JWT token and return user data"""
         try:
-            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            payload = self.token_codec.decode(token)
             username = payload.get("sub")
             restaurant_slug = payload.get("restaurant_slug")
 
             if not username or not restaurant_slug:
                 return None
 
+            if self.verify_mode == "stateless" and all(k in payload for k in ("user_id", "role", "epoch")):
+                current = token_epochs.check(payload["user_id"], payload["epoch"])
+                if current is False:
+                    return None
+                if current:
+                    return {
+                        "id": payload["user_id"],
+                        "username": username,
+                        "role": payload["role"],
+                        "restaurant_slug": restaurant_slug
+                    }
+                # Unknown user (table not loaded yet): fall back to the database
+
+            cache_key = (username, restaurant_slug)
+            principal = principal_cache.get(cache_key)
+            if principal is not None:
+                return dict(principal)
+
+            version = _principal_versions.get(cache_key, 0)
             # Get user to verify it still exists and is active
             user = await self.users_collection.find_one({
                 "username": username,
@@ -186,12 +435,16 @@ class AuthService:
             if not user:
                 return None
 
-            return {
+            principal = {
                 "id": str(user["_id"]),
                 "username": user["username"],
                 "role": user["role"],
                 "restaurant_slug": restaurant_slug
             }
+            if _principal_versions.get(cache_key, 0) == version:
+                principal_cache.set(cache_key, principal)
+
+            return dict(principal)
 
         except JWTError as e:
             logger.error(f"JWT Error: {e}")
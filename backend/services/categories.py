@@ -1,8 +1,11 @@
-from typing import List
+from typing import Iterable, List, Set
 from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
 from db.mongo import get_collection
+from utils.bulk import bulk_apply, item_results, mark_failed
 from utils.converters import to_object_id
-from models import CategoryCreate, CategoryUpdate, CategoryResponse
+from models import CategoryCreate, CategoryUpdate, CategoryResponse, CategoryOrder, BulkItemResult
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,9 +17,8 @@ class CategoryService:
     async def create_category(self, restaurant_slug: str, category_data: CategoryCreate) -> CategoryResponse:
         """Create new category"""
         try:
-            from services.restaurants import RestaurantService
-            restaurant_service = RestaurantService()
-            restaurant = await restaurant_service.get_by_slug(restaurant_slug)
+            from services.restaurants import restaurant_cache
+            restaurant = await restaurant_cache.get(restaurant_slug)
             if not restaurant:
                 raise ValueError("Restaurant not found")
             
@@ -92,4 +94,40 @@ class CategoryService:
             
         except Exception as e:
             logger.error(f"Error deleting category: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    async def tenant_category_ids(self, restaurant_slug: str, category_ids: Iterable[ObjectId]) -> Set[ObjectId]:
+        """The subset of `category_ids` that belongs to the restaurant"""
+        category_ids = list(category_ids)
+        if not category_ids:
+            return set()
+        cursor = self.collection.find(
+            {"_id": {"$in": category_ids}, "restaurant_slug": restaurant_slug}, {"_id": 1}
+        )
+        return {category["_id"] async for category in cursor}
+
+    async def reorder_categories(self, restaurant_slug: str, orders: List[CategoryOrder]) -> List[BulkItemResult]:
+        """Apply display_order changes with one bulk_write; one result per item"""
+        results, category_ids = item_results([order.category_id for order in orders])
+        try:
+            existing = await self.tenant_category_ids(restaurant_slug, filter(None, category_ids))
+        except Exception as e:
+            logger.error(f"Error reordering categories: {e}")
+            return mark_failed(results)
+
+        now = datetime.utcnow()
+        operations, written = [], []
+        for order, category_id, result in zip(orders, category_ids, results):
+            if category_id is None:
+                continue
+            if category_id not in existing:
+                result.status = "not_found"
+                continue
+            operations.append(UpdateOne(
+                {"_id": category_id, "restaurant_slug": restaurant_slug},
+                {"$set": {"display_order": order.display_order, "updated_at": now}}
+            ))
+            written.append(result)
+
+        await bulk_apply(self.collection, operations, written)
+        return results
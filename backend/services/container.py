@@ -0,0 +1,74 @@
+"""
+One instance of each service per process.
+
+`services.start()` runs in the app lifespan once init_db has connected, so
+importing the app never touches a collection. Endpoints receive the
+instances through the get_*_service dependencies; tests replace them with
+`app.dependency_overrides[get_product_service] = lambda: fake`.
+"""
+from typing import Optional
+from services.auth import AuthService
+from services.restaurants import RestaurantService
+from services.products import ProductService
+from services.product_import import ProductImporter
+from services.orders import OrderService
+from services.categories import CategoryService
+from services.api_keys import APIKeyService
+
+class ServiceContainer:
+    def __init__(self):
+        self.auth: Optional[AuthService] = None
+        self.restaurants: Optional[RestaurantService] = None
+        self.products: Optional[ProductService] = None
+        self.product_importer: Optional[ProductImporter] = None
+        self.orders: Optional[OrderService] = None
+        self.categories: Optional[CategoryService] = None
+        self.api_keys: Optional[APIKeyService] = None
+
+    @property
+    def started(self) -> bool:
+        return self.auth is not None
+
+    def start(self):
+        """Build every service once (the database must be initialised)"""
+        if self.started:
+            return
+        self.categories = CategoryService()
+        self.restaurants = RestaurantService(auth_service=AuthService())
+        self.products = ProductService(category_service=self.categories)
+        self.product_importer = ProductImporter()
+        self.orders = OrderService()
+        self.api_keys = APIKeyService()
+        # Set last: `started` means every service is there
+        self.auth = self.restaurants.auth_service
+
+    def stop(self):
+        self.__init__()
+
+    def require(self, service):
+        if service is None:
+            raise RuntimeError("Services are not started; they are built in the app lifespan after init_db")
+        return service
+
+services = ServiceContainer()
+
+def get_auth_service() -> AuthService:
+    return services.require(services.auth)
+
+def get_restaurant_service() -> RestaurantService:
+    return services.require(services.restaurants)
+
+def get_product_service() -> ProductService:
+    return services.require(services.products)
+
+def get_product_importer() -> ProductImporter:
+    return services.require(services.product_importer)
+
+def get_order_service() -> OrderService:
+    return services.require(services.orders)
+
+def get_category_service() -> CategoryService:
+    return services.require(services.categories)
+
+def get_api_key_service() -> APIKeyService:
+    return services.require(services.api_keys)
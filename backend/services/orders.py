@@ -1,16 +1,33 @@
-from typing import List, Optional
+import os
+from typing import Any, Dict, FrozenSet, Optional
 from datetime import datetime, timedelta
 from db.mongo import get_collection
 from utils.converters import to_object_id
-from models import OrderCreate, OrderResponse, OrderStatus, CustomerInfo, OrderItem, DashboardAnalytics
+from utils.fields import projection, sparse_model
+from utils.pagination import InvalidCursor, decode_cursor, keyset_filter, next_cursor, page_size
+from models import OrderCreate, OrderResponse, OrderStatus, CustomerInfo, OrderItem, DashboardAnalytics, Page
 import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Newest first; _id breaks ties between orders created in the same millisecond
+ORDER_SORT = (("created_at", -1), ("_id", -1))
+
+def _to_response(order: Dict[str, Any], model=OrderResponse) -> OrderResponse:
+    """Build the (possibly sparse) response from a projected document"""
+    order["id"] = str(order["_id"])
+    if "customer" in order:
+        order["customer"] = CustomerInfo(**order["customer"])
+    if "items" in order:
+        order["items"] = [OrderItem(**item) for item in order["items"]]
+    return model(**order)
+
 class OrderService:
     def __init__(self):
         self.collection = get_collection("orders")
+        self.page_size = int(os.getenv("ORDERS_PAGE_SIZE", "50"))
+        self.max_page_size = int(os.getenv("ORDERS_PAGE_MAX", "100"))
 
     def generate_order_number(self) -> str:
         """Generate unique order number"""
@@ -21,9 +38,8 @@ class OrderService:
     async def create_order(self, restaurant_slug: str, order_data: OrderCreate) -> OrderResponse:
         """Create new order"""
         try:
-            from services.restaurants import RestaurantService
-            restaurant_service = RestaurantService()
-            restaurant = await restaurant_service.get_by_slug(restaurant_slug)
+            from services.restaurants import restaurant_cache
+            restaurant = await restaurant_cache.get(restaurant_slug)
             if not restaurant:
                 raise ValueError("Restaurant not found")
             
@@ -50,6 +66,7 @@ class OrderService:
                 "payment_method": order_data.payment_method,
                 "is_delivery": order_data.is_delivery,
                 "estimated_delivery_time": estimated_delivery,
+                "actual_delivery_time": None,
                 "notes": order_data.notes,
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
@@ -71,63 +88,66 @@ class OrderService:
         self,
         restaurant_slug: str,
         status_filter: Optional[str] = None,
-        limit: int = 50
-    ) -> List[OrderResponse]:
-        """Get orders by restaurant"""
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[FrozenSet[str]] = None
+    ) -> Page[OrderResponse]:
+        """Get one page of a restaurant's orders, newest first; `fields` trims the projection"""
         try:
-            query = {
-                "restaurant_slug": restaurant_slug,
-                "is_active": True
-            }
+            size = page_size(limit, self.page_size, self.max_page_size)
+            query = {"restaurant_slug": restaurant_slug}
             if status_filter:
                 query["status"] = status_filter
+            if cursor:
+                query.update(keyset_filter(ORDER_SORT, decode_cursor("orders", cursor, ORDER_SORT)))
             
-            cursor = self.collection.find(query).sort("created_at", -1).limit(limit)
+            # One extra document tells whether there is a next page
+            documents = await self.collection.find(
+                query, projection(OrderResponse, fields, extra=("created_at",))
+            ).sort(list(ORDER_SORT)).limit(size + 1).to_list(length=size + 1)
             
-            orders = []
-            async for order in cursor:
-                order["id"] = str(order["_id"])
-                order["customer"] = CustomerInfo(**order["customer"])
-                order["items"] = [OrderItem(**item) for item in order["items"]]
-                orders.append(OrderResponse(**order))
-                
-            return orders
+            model = sparse_model(OrderResponse, fields)
+            orders = [_to_response(order, model) for order in documents[:size]]
             
+            return Page(items=orders, next_cursor=next_cursor("orders", ORDER_SORT, documents, size))
+            
+        except InvalidCursor:
+            raise
         except Exception as e:
             logger.error(f"Error getting orders: {e}")
-            return []
+            return Page(items=[])
 
-    async def get_order_by_id(self, order_id: str, restaurant_slug: str) -> Optional[OrderResponse]:
+    async def get_order_by_id(
+        self,
+        order_id: str,
+        restaurant_slug: str,
+        fields: Optional[FrozenSet[str]] = None
+    ) -> Optional[OrderResponse]:
         """Get specific order"""
         try:
             order = await self.collection.find_one({
                 "_id": to_object_id(order_id),
-                "restaurant_slug": restaurant_slug,
-                "is_active": True
-            })
+                "restaurant_slug": restaurant_slug
+            }, projection(OrderResponse, fields))
             
             if not order:
                 return None
-                
-            order["id"] = str(order["_id"])
-            order["customer"] = CustomerInfo(**order["customer"])
-            order["items"] = [OrderItem(**item) for item in order["items"]]
             
-            return OrderResponse(**order)
+            return _to_response(order, sparse_model(OrderResponse, fields))
             
         except Exception as e:
             logger.error(f"Error getting order: {e}")
             return None
 
-    async def update_order_status(self, order_id: str, new_status: str) -> bool:
-        """Update order status"""
+    async def update_order_status(self, order_id: str, new_status: str, restaurant_slug: str) -> bool:
+        """Update the status of an order of the given restaurant"""
         try:
             result = await self.collection.update_one(
-                {"_id": to_object_id(order_id)},
+                {"_id": to_object_id(order_id), "restaurant_slug": restaurant_slug},
                 {"$set": {"status": new_status, "updated_at": datetime.utcnow()}}
             )
             
-            return result.modified_count > 0
+            return result.matched_count > 0
             
         except Exception as e:
             logger.error(f"Error updating order status: {e}")
@@ -198,4 +218,17 @@ class OrderService:
                 }},
                 {"$sort": {"_id": 1}}
             ]
-            ]
\ No newline at end of file
+            hourly_orders = await self.collection.aggregate(hourly_orders_pipeline).to_list(length=None)
+            
+            return DashboardAnalytics(
+                total_orders_today=total_orders_today,
+                total_revenue_today=total_revenue_today,
+                pending_orders=pending_orders,
+                popular_products=popular_products,
+                recent_orders=recent_orders,
+                hourly_orders=hourly_orders
+            )
+            
+        except Exception as e:
+            logger.error(f"Error getting dashboard analytics: {e}")
+            raise
@@ -0,0 +1,412 @@
+"""
+Bulk menu import from CSV or JSON.
+
+Rows are parsed incrementally from the request (or file) stream, validated
+in batches against ProductCreate and written with unordered bulk_write, so
+a 2,000-item menu is a handful of round trips. Category names are resolved
+to ids once per import; missing categories are created in one insert.
+
+Usage: python -m services.product_import <restaurant-slug> <menu.csv|menu.json>
+"""
+import os
+import re
+import io
+import csv
+import sys
+import json
+import time
+import codecs
+import asyncio
+import argparse
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+from db.mongo import get_collection
+from middleware.security import InputValidationMiddleware
+from models import ProductCreate
+from utils.converters import to_object_id
+from utils.search import fold
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("csv", "json")
+# CSV cells holding lists, e.g. "gluten|lactosa"
+CSV_LIST_SEPARATOR = "|"
+# CSV cells holding nested JSON (sizes, toppings)
+CSV_JSON_COLUMNS = ("sizes", "toppings")
+# Required text that may legitimately be empty (an empty name is still an error)
+CSV_TEXT_COLUMNS = ("description",)
+# Characters of an unfinished JSON item / CSV record tolerated before giving up on the stream
+MAX_PENDING_JSON = 1024 * 1024
+MAX_PENDING_CSV = 1024 * 1024
+
+_JSON_SEPARATORS = re.compile(r"[\s,]*")
+_CSV_BOUNDARIES = re.compile(r'["\n]')
+
+class ImportFormatError(ValueError):
+    pass
+
+class RestaurantNotFound(LookupError):
+    pass
+
+class CSVRow(dict):
+    """A CSV record: every cell is text and needs converting"""
+
+def detect_format(content_type: Optional[str] = None, filename: Optional[str] = None) -> str:
+    """csv or json, from a content type or a file name"""
+    hint = (content_type or filename or "").lower()
+    if "csv" in hint:
+        return "csv"
+    if "json" in hint:
+        return "json"
+    raise ImportFormatError("Unsupported import format, use CSV or JSON")
+
+def _decode(decoder: codecs.IncrementalDecoder, chunk: bytes, final: bool = False) -> str:
+    try:
+        return decoder.decode(chunk, final)
+    except UnicodeDecodeError:
+        raise ImportFormatError("The file is not UTF-8 encoded; export it again as UTF-8")
+
+async def iter_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[CSVRow]:
+    """Rows of a CSV stream as {column: cell}, keyed by the lower-cased header"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    header: Optional[List[str]] = None
+    buffer = ""
+    # Each character is scanned once: `quoted` is the quote parity at `scanned`
+    scanned, quoted = 0, False
+
+    def records(text: str):
+        nonlocal header
+        for record in csv.reader(io.StringIO(text)):
+            if not any(cell.strip() for cell in record):
+                continue
+            if header is None:
+                header = [cell.strip().lower() for cell in record]
+                continue
+            yield CSVRow(zip(header, record))
+
+    async for chunk in chunks:
+        buffer += _decode(decoder, chunk)
+        # End of the last whole record (newlines inside quotes don't end one)
+        cut = 0
+        for boundary in _CSV_BOUNDARIES.finditer(buffer, scanned):
+            if boundary.group() == '"':
+                quoted = not quoted
+            elif not quoted:
+                cut = boundary.end()
+        scanned = len(buffer)
+        if cut:
+            for row in records(buffer[:cut]):
+                yield row
+            buffer = buffer[cut:]
+            scanned -= cut
+        if len(buffer) > MAX_PENDING_CSV:
+            raise ImportFormatError("CSV record too long (unterminated quoted field?)")
+
+    buffer += _decode(decoder, b"", final=True)
+    quoted ^= buffer.count('"', scanned) % 2 == 1
+    if quoted:
+        raise ImportFormatError("Unterminated quoted CSV field")
+    for row in records(buffer):
+        yield row
+
+async def iter_json(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Items of a JSON array, or of newline-delimited JSON, as they arrive"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    parser = json.JSONDecoder()
+    buffer = ""
+    array: Optional[bool] = None
+    closed = False
+
+    def drain(final: bool):
+        nonlocal buffer, array, closed
+        items, position = [], 0
+        while True:
+            position = _JSON_SEPARATORS.match(buffer, position).end()
+            if position >= len(buffer) or closed:
+                break
+            if array is None:
+                array = buffer[position] == "["
+                if array:
+                    position += 1
+                continue
+            if array and buffer[position] == "]":
+                closed = True
+                position += 1
+                break
+            try:
+                item, position = parser.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                # Incomplete item: wait for more input unless the stream ended
+                if final or len(buffer) - position > MAX_PENDING_JSON:
+                    raise ImportFormatError(f"Malformed JSON: {e.msg}")
+                break
+            items.append(item)
+        buffer = buffer[position:]
+        return items
+
+    async for chunk in chunks:
+        buffer += _decode(decoder, chunk)
+        for item in drain(final=False):
+            yield item
+
+    buffer += _decode(decoder, b"", final=True)
+    for item in drain(final=True):
+        yield item
+    if array and not closed:
+        raise ImportFormatError("Malformed JSON: unterminated array")
+    if buffer.strip():
+        raise ImportFormatError("Malformed JSON: trailing data")
+
+def parse_rows(import_format: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    if import_format not in IMPORT_FORMATS:
+        raise ImportFormatError("Unsupported import format, use CSV or JSON")
+    return iter_csv(chunks) if import_format == "csv" else iter_json(chunks)
+
+def _from_csv(row: Dict[str, str]) -> Dict[str, Any]:
+    """CSV cells -> ProductCreate input; empty optional cells fall back to the defaults"""
+    data: Dict[str, Any] = {}
+    for column, cell in row.items():
+        cell = (cell or "").strip()
+        if not cell and column not in CSV_TEXT_COLUMNS:
+            continue
+        if column == "allergens":
+            data[column] = [item.strip() for item in cell.split(CSV_LIST_SEPARATOR) if item.strip()]
+        elif column in CSV_JSON_COLUMNS:
+            try:
+                data[column] = json.loads(cell)
+            except ValueError:
+                raise ValueError(f"{column}: invalid JSON")
+        else:
+            data[column] = cell
+    return data
+
+def _suspicious(row: Dict[str, Any]) -> bool:
+    """
+    The request scanner's patterns, applied per row: imports are exempt from
+    the streamed body scan so a bad row cannot abort a half-written import
+    """
+    text = json.dumps(row, ensure_ascii=False, default=str)
+    return InputValidationMiddleware.SUSPICIOUS_RE.search(text) is not None
+
+def _error(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        )
+    return str(e)
+
+class ProductImporter:
+    """
+    Streams rows into a tenant's menu. Each batch of IMPORT_BATCH_SIZE rows
+    is validated, its new categories created with one insert_many, and its
+    products written with one unordered bulk_write; a bad row only costs
+    that row, reported with its 1-based position in the input.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, max_rows: Optional[int] = None,
+                 max_errors: Optional[int] = None):
+        self.products = get_collection("products")
+        self.categories = get_collection("categories")
+        self.batch_size = batch_size or int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+        self.max_rows = max_rows or int(os.getenv("IMPORT_MAX_ROWS", "10000"))
+        self.max_errors = max_errors or int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+
+    async def _load_categories(self, restaurant_slug: str) -> Tuple[Dict[str, Any], int]:
+        """Folded category name -> _id for the tenant, plus the next display_order"""
+        by_name: Dict[str, Any] = {}
+        next_order = 0
+        cursor = self.categories.find(
+            {"restaurant_slug": restaurant_slug}, {"name": 1, "display_order": 1}
+        ).sort("display_order", 1)
+        async for category in cursor:
+            by_name.setdefault(fold(category.get("name") or ""), category["_id"])
+            next_order = max(next_order, (category.get("display_order") or 0) + 1)
+        return by_name, next_order
+
+    async def run(self, restaurant_slug: str, rows: AsyncIterator[Any],
+                  create_categories: bool = True) -> Dict[str, Any]:
+        """Import `rows` (from parse_rows) and return the report"""
+        from services.restaurants import restaurant_cache
+
+        started = time.perf_counter()
+        restaurant = await restaurant_cache.get(restaurant_slug)
+        if not restaurant:
+            raise RestaurantNotFound(restaurant_slug)
+
+        categories, next_order = await self._load_categories(restaurant_slug)
+        state = {
+            "restaurant_id": to_object_id(restaurant.id),
+            "categories": categories,
+            "known_ids": set(categories.values()),
+            "next_order": next_order,
+            "create_categories": create_categories
+        }
+        report: Dict[str, Any] = {"rows": 0, "inserted": 0, "failed": 0, "categories_created": 0, "errors": []}
+
+        batch: List[Tuple[int, Any]] = []
+        try:
+            async for row in rows:
+                if report["rows"] >= self.max_rows:
+                    report["error"] = f"Import limited to {self.max_rows} rows"
+                    break
+                report["rows"] += 1
+                batch.append((report["rows"], row))
+                if len(batch) >= self.batch_size:
+                    await self._write_batch(restaurant_slug, batch, state, report)
+                    batch = []
+        except ImportFormatError as e:
+            # Rows parsed before the malformed part are still imported
+            report["error"] = str(e)
+        if batch:
+            await self._write_batch(restaurant_slug, batch, state, report)
+
+        if report["inserted"] or report["categories_created"]:
+            from services.products import product_search
+            product_search.invalidate(restaurant_slug)
+
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        logger.info(
+            f"Imported {report['inserted']}/{report['rows']} products into {restaurant_slug} "
+            f"in {report['seconds']}s"
+        )
+        return report
+
+    def _fail(self, report: Dict[str, Any], row: int, error: str):
+        report["failed"] += 1
+        if len(report["errors"]) < self.max_errors:
+            report["errors"].append({"row": row, "error": error})
+
+    async def _write_batch(self, restaurant_slug: str, batch: List[Tuple[int, Any]],
+                           state: Dict[str, Any], report: Dict[str, Any]):
+        validated: List[Tuple[int, ProductCreate, Optional[str]]] = []
+        for row_number, row in batch:
+            try:
+                if not isinstance(row, dict):
+                    raise ValueError("Row must be an object")
+                if _suspicious(row):
+                    raise ValueError("Row contains suspicious content")
+                data = _from_csv(row) if isinstance(row, CSVRow) else dict(row)
+                category_name = data.pop("category", None)
+                if not data.get("category_id"):
+                    if not category_name:
+                        raise ValueError("category or category_id is required")
+                    # Placeholder for validation, resolved to the id below
+                    data["category_id"] = str(category_name)
+                validated.append((row_number, ProductCreate(**data), category_name and str(category_name)))
+            except (ValidationError, ValueError) as e:
+                self._fail(report, row_number, _error(e))
+
+        await self._create_categories(
+            restaurant_slug,
+            [name for _, product, name in validated if name and fold(name) not in state["categories"]],
+            state, report
+        )
+
+        now = datetime.utcnow()
+        operations, row_numbers = [], []
+        for row_number, product, category_name in validated:
+            category_id = self._category_id(product, category_name, state)
+            if category_id is None:
+                self._fail(report, row_number, f"category_id: unknown category {category_name or product.category_id}")
+                continue
+            operations.append(InsertOne({
+                **product.model_dump(exclude={"category_id"}),
+                "category_id": category_id,
+                "restaurant_id": state["restaurant_id"],
+                "restaurant_slug": restaurant_slug,
+                "is_available": True,
+                "rating": 5.0,
+                "rating_count": 0,
+                "created_at": now,
+                "updated_at": now
+            }))
+            row_numbers.append(row_number)
+
+        if not operations:
+            return
+        try:
+            result = await self.products.bulk_write(operations, ordered=False)
+            report["inserted"] += result.inserted_count
+        except BulkWriteError as e:
+            details = e.details
+            report["inserted"] += details.get("nInserted", 0)
+            for error in details.get("writeErrors", []):
+                self._fail(report, row_numbers[error["index"]], error.get("errmsg", "write failed"))
+
+    def _category_id(self, product: ProductCreate, category_name: Optional[str], state: Dict[str, Any]):
+        if category_name:
+            return state["categories"].get(fold(category_name))
+        try:
+            category_id = to_object_id(product.category_id)
+        except Exception:
+            category_id = None
+        # Explicit ids must belong to this tenant
+        return category_id if category_id in state["known_ids"] else None
+
+    async def _create_categories(self, restaurant_slug: str, names: List[str],
+                                 state: Dict[str, Any], report: Dict[str, Any]):
+        if not names or not state["create_categories"]:
+            return
+        unique: Dict[str, str] = {}
+        for name in names:
+            unique.setdefault(fold(name), name.strip())
+
+        now = datetime.utcnow()
+        documents = []
+        for folded, name in unique.items():
+            documents.append({
+                "name": name,
+                "icon": "️",
+                "description": None,
+                "restaurant_id": state["restaurant_id"],
+                "restaurant_slug": restaurant_slug,
+                "display_order": state["next_order"],
+                "is_active": True,
+                "created_at": now,
+                "updated_at": now
+            })
+            state["next_order"] += 1
+        result = await self.categories.insert_many(documents)
+        for folded, category_id in zip(unique, result.inserted_ids):
+            state["categories"][folded] = category_id
+            state["known_ids"].add(category_id)
+        report["categories_created"] += len(result.inserted_ids)
+
+async def _file_chunks(path: str, size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    with open(path, "rb") as handle:
+        while True:
+            chunk = handle.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+async def _main(args) -> int:
+    from dotenv import load_dotenv
+    from db.mongo import init_db, close_db
+
+    load_dotenv()
+    await init_db(check_indexes=False)
+    try:
+        import_format = args.format or detect_format(filename=args.file)
+        report = await ProductImporter().run(
+            args.slug, parse_rows(import_format, _file_chunks(args.file)),
+            create_categories=not args.no_create_categories
+        )
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 1 if report.get("error") or report["failed"] else 0
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Bulk-import a restaurant menu from CSV or JSON")
+    parser.add_argument("slug", help="Restaurant slug")
+    parser.add_argument("file", help="CSV, JSON array or newline-delimited JSON file")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="Override detection by file extension")
+    parser.add_argument("--no-create-categories", action="store_true",
+                        help="Reject rows whose category does not exist instead of creating it")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
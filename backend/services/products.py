@@ -1,22 +1,141 @@
-from typing import List, Optional
+import os
+from typing import Any, Dict, FrozenSet, List, Optional
 from datetime import datetime
+from pymongo import UpdateMany, UpdateOne
 from db.mongo import get_collection
+from utils.bulk import bulk_apply, item_results, mark_failed
+from utils.cache import TTLCache
 from utils.converters import to_object_id
-from models import ProductCreate, ProductUpdate, ProductResponse, ProductSize, ProductTopping
+from utils.fields import projection, sparse_model
+from utils.pagination import InvalidCursor, decode_cursor, keyset_filter, next_cursor, page_size
+from utils.search import SearchIndex
+from utils.singleflight import SingleFlight
+from models import (
+    ProductCreate, ProductUpdate, ProductResponse, ProductSize, ProductTopping, Page,
+    ProductPatch, CategoryPriceAdjustment, BulkItemResult
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+PRODUCT_SORT = (("name", 1), ("_id", 1))
+
+SEARCH_FIELDS = {"name": 3.0, "description": 1.0}
+SEARCH_ATTRIBUTES = ("name", "description", "category_id", "is_popular")
+
+class ProductSearch:
+    """
+    Per-tenant in-memory product search. A tenant's index is built with one
+    indexed query on its first search, kept current by this worker's writes
+    and rebuilt every PRODUCT_SEARCH_TTL seconds to pick up other workers'.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, maxsize: Optional[int] = None, limit: Optional[int] = None):
+        self._indexes = TTLCache(
+            maxsize=maxsize or int(os.getenv("PRODUCT_SEARCH_TENANTS", "512")),
+            ttl=ttl if ttl is not None else float(os.getenv("PRODUCT_SEARCH_TTL", "300"))
+        )
+        self.limit = limit or int(os.getenv("PRODUCT_SEARCH_LIMIT", "50"))
+        self._flight = SingleFlight()
+        # Bumped on every write so a build racing a write is not cached
+        self._versions: Dict[str, int] = {}
+
+    @staticmethod
+    def _document(product: Dict[str, Any]) -> Dict[str, Any]:
+        document = {field: product.get(field) for field in SEARCH_ATTRIBUTES}
+        document["category_id"] = str(document["category_id"])
+        document["is_popular"] = bool(document["is_popular"])
+        return document
+
+    async def index_for(self, restaurant_slug: str, collection) -> SearchIndex:
+        index = self._indexes.get(restaurant_slug)
+        if index is not None:
+            return index
+
+        async def build():
+            version = self._versions.get(restaurant_slug, 0)
+            index = SearchIndex(SEARCH_FIELDS)
+            cursor = collection.find(
+                {"restaurant_slug": restaurant_slug, "is_available": True},
+                {field: 1 for field in SEARCH_ATTRIBUTES}
+            )
+            async for product in cursor:
+                index.add(str(product["_id"]), self._document(product))
+            if self._versions.get(restaurant_slug, 0) == version:
+                self._indexes.set(restaurant_slug, index)
+            return index
+
+        return await self._flight.do(restaurant_slug, build)
+
+    def _touch(self, restaurant_slug: str) -> Optional[SearchIndex]:
+        self._versions[restaurant_slug] = self._versions.get(restaurant_slug, 0) + 1
+        return self._indexes.get(restaurant_slug)
+
+    def add(self, restaurant_slug: str, product_id: str, product: Dict[str, Any]):
+        index = self._touch(restaurant_slug)
+        if index is not None:
+            index.add(product_id, self._document(product))
+
+    def update(self, restaurant_slug: str, product_id: str, changes: Dict[str, Any]):
+        index = self._touch(restaurant_slug)
+        if index is None:
+            return
+        if changes.get("is_available") is False:
+            index.remove(product_id)
+            return
+        document = index.document(product_id)
+        if document is None:
+            # Re-enabled product: its text is not at hand, rebuild on the next search
+            self._indexes.invalidate(restaurant_slug)
+            return
+        if any(field in changes for field in SEARCH_ATTRIBUTES):
+            index.add(product_id, self._document({**document, **changes}))
+
+    def remove(self, restaurant_slug: str, product_id: str):
+        index = self._touch(restaurant_slug)
+        if index is not None:
+            index.remove(product_id)
+
+    def invalidate(self, restaurant_slug: str):
+        """Drop the tenant's index after a bulk write; the next search rebuilds it"""
+        self._touch(restaurant_slug)
+        self._indexes.invalidate(restaurant_slug)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._indexes.stats()
+
+product_search = ProductSearch()
+
+def _to_response(product: Dict[str, Any], model=ProductResponse) -> ProductResponse:
+    """Build the (possibly sparse) response from a projected document"""
+    product["id"] = str(product["_id"])
+    if "category_id" in product:
+        product["category_id"] = str(product["category_id"])
+    product["sizes"] = [ProductSize(**size) for size in product.get("sizes", [])]
+    product["toppings"] = [ProductTopping(**topping) for topping in product.get("toppings", [])]
+    return model(**product)
+
 class ProductService:
-    def __init__(self):
+    def __init__(self, category_service=None):
         self.collection = get_collection("products")
+        self._category_service = category_service
+        # A whole menu normally fits in the default page
+        self.page_size = int(os.getenv("PRODUCTS_PAGE_SIZE", "200"))
+        self.max_page_size = int(os.getenv("PRODUCTS_PAGE_MAX", "200"))
+
+    @property
+    def category_service(self):
+        # Only bulk_update needs it
+        if self._category_service is None:
+            from services.categories import CategoryService
+            self._category_service = CategoryService()
+        return self._category_service
 
     async def create_product(self, restaurant_slug: str, product_data: ProductCreate) -> ProductResponse:
         """Create new product"""
         try:
-            from services.restaurants import RestaurantService
-            restaurant_service = RestaurantService()
-            restaurant = await restaurant_service.get_by_slug(restaurant_slug)
+            from services.restaurants import restaurant_cache
+            restaurant = await restaurant_cache.get(restaurant_slug)
             if not restaurant:
                 raise ValueError("Restaurant not found")
             
@@ -43,6 +162,7 @@ class ProductService:
             }
             
             result = await self.collection.insert_one(product_doc)
+            product_search.add(restaurant_slug, str(result.inserted_id), product_doc)
             
             product_doc["id"] = str(result.inserted_id)
             product_doc["category_id"] = str(product_doc["category_id"])
@@ -60,10 +180,21 @@ class ProductService:
         restaurant_slug: str,
         category_id: Optional[str] = None,
         search: Optional[str] = None,
-        popular_only: bool = False
-    ) -> List[ProductResponse]:
-        """Get products by restaurant with filters"""
+        popular_only: bool = False,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[FrozenSet[str]] = None
+    ) -> Page[ProductResponse]:
+        """
+        Get a restaurant's products by name: all of them, or one page when
+        `limit` or `cursor` is given. `search` results are ranked by
+        relevance and come in a single page of PRODUCT_SEARCH_LIMIT.
+        `fields` limits the projection and the response model.
+        """
         try:
+            if search:
+                return Page(items=await self._search(restaurant_slug, search, category_id, popular_only, fields))
+            
             query = {
                 "restaurant_slug": restaurant_slug,
                 "is_available": True
@@ -72,54 +203,97 @@ class ProductService:
             if category_id:
                 query["category_id"] = to_object_id(category_id)
                 
-            if search:
-                query["name"] = {"$regex": search, "$options": "i"}
-                
             if popular_only:
                 query["is_popular"] = True
             
-            cursor = self.collection.find(query).sort("name", 1)
+            if cursor:
+                query.update(keyset_filter(PRODUCT_SORT, decode_cursor("products", cursor, PRODUCT_SORT)))
             
-            products = []
-            async for product in cursor:
-                product["id"] = str(product["_id"])
-                product["category_id"] = str(product["category_id"])
-                product["sizes"] = [ProductSize(**size) for size in product.get("sizes", [])]
-                product["toppings"] = [ProductTopping(**topping) for topping in product.get("toppings", [])]
-                products.append(ProductResponse(**product))
-                
-            return products
+            model = sparse_model(ProductResponse, fields)
+            found = self.collection.find(
+                query, projection(ProductResponse, fields, extra=("name",))
+            ).sort(list(PRODUCT_SORT))
+            if limit is None and cursor is None:
+                # Clients that don't page (the menu frontend) get the whole menu
+                documents = await found.to_list(length=None)
+                return Page(items=[_to_response(product, model) for product in documents])
+            
+            size = page_size(limit, self.page_size, self.max_page_size)
+            documents = await found.limit(size + 1).to_list(length=size + 1)
+            return Page(
+                items=[_to_response(product, model) for product in documents[:size]],
+                next_cursor=next_cursor("products", PRODUCT_SORT, documents, size)
+            )
             
+        except InvalidCursor:
+            raise
         except Exception as e:
             logger.error(f"Error getting products: {e}")
+            return Page(items=[])
+
+    async def _search(
+        self,
+        restaurant_slug: str,
+        search: str,
+        category_id: Optional[str],
+        popular_only: bool,
+        fields: Optional[FrozenSet[str]] = None
+    ) -> List[ProductResponse]:
+        """Rank in the tenant's index, then fetch the hits by _id"""
+        index = await product_search.index_for(restaurant_slug, self.collection)
+        ranked = index.search(
+            search,
+            product_search.limit,
+            lambda product: (not category_id or product["category_id"] == category_id)
+            and (not popular_only or product["is_popular"])
+        )
+        if not ranked:
             return []
+        
+        cursor = self.collection.find({
+            "_id": {"$in": [to_object_id(product_id) for product_id, _ in ranked]},
+            "restaurant_slug": restaurant_slug,
+            "is_available": True
+        }, projection(ProductResponse, fields))
+        model = sparse_model(ProductResponse, fields)
+        found = {}
+        async for product in cursor:
+            found[str(product["_id"])] = _to_response(product, model)
+        
+        return [found[product_id] for product_id, _ in ranked if product_id in found]
 
-    async def get_product_by_id(self, product_id: str, restaurant_slug: str) -> Optional[ProductResponse]:
+    async def get_product_by_id(
+        self,
+        product_id: str,
+        restaurant_slug: str,
+        fields: Optional[FrozenSet[str]] = None
+    ) -> Optional[ProductResponse]:
         """Get product by ID"""
         try:
             product = await self.collection.find_one({
                 "_id": to_object_id(product_id),
                 "restaurant_slug": restaurant_slug,
                 "is_available": True
-            })
+            }, projection(ProductResponse, fields))
             
             if not product:
                 return None
-                
-            product["id"] = str(product["_id"])
-            product["category_id"] = str(product["category_id"])
-            product["sizes"] = [ProductSize(**size) for size in product.get("sizes", [])]
-            product["toppings"] = [ProductTopping(**topping) for topping in product.get("toppings", [])]
             
-            return ProductResponse(**product)
+            return _to_response(product, sparse_model(ProductResponse, fields))
             
         except Exception as e:
             logger.error(f"Error getting product: {e}")
             return None
 
-    async def update_product(self, product_id: str, update_data: ProductUpdate) -> bool:
-        """Update product"""
+    async def update_product(
+        self,
+        product_id: str,
+        update_data: ProductUpdate,
+        restaurant_slug: str
+    ) -> bool:
+        """Update a product of the given restaurant"""
         try:
+            product_filter = {"_id": to_object_id(product_id), "restaurant_slug": restaurant_slug}
             update_dict = {}
             
             for field, value in update_data.dict().items():
@@ -132,30 +306,103 @@ class ProductService:
                         update_dict[field] = value
             
             if not update_dict:
-                return True
+                return await self.collection.count_documents(product_filter, limit=1) > 0
                 
             update_dict["updated_at"] = datetime.utcnow()
             
-            result = await self.collection.update_one(
-                {"_id": to_object_id(product_id)},
-                {"$set": update_dict}
-            )
+            result = await self.collection.update_one(product_filter, {"$set": update_dict})
             
-            return result.modified_count > 0
+            if result.modified_count:
+                product_search.update(restaurant_slug, product_id, update_dict)
+            return result.matched_count > 0
             
         except Exception as e:
             logger.error(f"Error updating product: {e}")
             return False
 
-    async def delete_product(self, product_id: str) -> bool:
-        """Soft delete product"""
+    async def bulk_update(
+        self,
+        restaurant_slug: str,
+        patches: List[ProductPatch],
+        adjustments: List[CategoryPriceAdjustment]
+    ) -> Dict[str, List[BulkItemResult]]:
+        """
+        Availability/price patches and per-category percentage price changes
+        as one unordered bulk_write. Ids are checked against the tenant first
+        (one $in query per collection) so every item gets its own result.
+        """
+        product_results, product_ids = item_results([patch.product_id for patch in patches])
+        adjustment_results, category_ids = item_results([adjustment.category_id for adjustment in adjustments])
+        try:
+            existing_products = set()
+            if any(product_ids):
+                cursor = self.collection.find(
+                    {"_id": {"$in": [i for i in product_ids if i]}, "restaurant_slug": restaurant_slug}, {"_id": 1}
+                )
+                existing_products = {product["_id"] async for product in cursor}
+            existing_categories = await self.category_service.tenant_category_ids(
+                restaurant_slug, filter(None, category_ids)
+            )
+        except Exception as e:
+            logger.error(f"Error in bulk product update: {e}")
+            return {"products": mark_failed(product_results), "price_adjustments": mark_failed(adjustment_results)}
+
+        now = datetime.utcnow()
+        operations, written, changes = [], [], []
+        # Explicit prices win over a category adjustment in the same request
+        priced = [
+            product_id for patch, product_id in zip(patches, product_ids)
+            if patch.price is not None and product_id in existing_products
+        ]
+        for adjustment, category_id, result in zip(adjustments, category_ids, adjustment_results):
+            if category_id is None:
+                continue
+            if category_id not in existing_categories:
+                result.status = "not_found"
+                continue
+            query = {"restaurant_slug": restaurant_slug, "category_id": category_id}
+            if priced:
+                query["_id"] = {"$nin": priced}
+            factor = 1 + adjustment.percent / 100
+            operations.append(UpdateMany(query, [{"$set": {
+                "price": {"$round": [{"$multiply": ["$price", factor]}, 2]},
+                "updated_at": now
+            }}]))
+            written.append(result)
+            changes.append(None)
+
+        for patch, product_id, result in zip(patches, product_ids, product_results):
+            if product_id is None:
+                continue
+            if product_id not in existing_products:
+                result.status = "not_found"
+                continue
+            update = patch.model_dump(exclude={"product_id"}, exclude_none=True)
+            if not update:
+                result.status, result.error = "invalid", "Nothing to update"
+                continue
+            update["updated_at"] = now
+            operations.append(UpdateOne({"_id": product_id, "restaurant_slug": restaurant_slug}, {"$set": update}))
+            written.append(result)
+            changes.append((str(product_id), update))
+
+        await bulk_apply(self.collection, operations, written)
+        for result, change in zip(written, changes):
+            if change is not None and result.status == "updated":
+                product_search.update(restaurant_slug, *change)
+        return {"products": product_results, "price_adjustments": adjustment_results}
+
+    async def delete_product(self, product_id: str, restaurant_slug: str) -> bool:
+        """Soft delete a product of the given restaurant"""
         try:
             result = await self.collection.update_one(
-                {"_id": to_object_id(product_id)},
+                {"_id": to_object_id(product_id), "restaurant_slug": restaurant_slug},
                 {"$set": {"is_available": False, "updated_at": datetime.utcnow()}}
             )
             
-            return result.modified_count > 0
+            if result.modified_count:
+                product_search.remove(restaurant_slug, product_id)
+            return result.matched_count > 0
             
         except Exception as e:
             logger.error(f"Error deleting product: {e}")
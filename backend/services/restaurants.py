@@ -1,17 +1,128 @@
-from typing import List, Optional
+import os
+from typing import Any, Dict, FrozenSet, Optional
 from datetime import datetime
 from db.mongo import get_collection
+from utils.cache import TTLCache
+from utils.singleflight import SingleFlight
 from utils.converters import to_object_id, to_string_id
-from models import RestaurantCreate, RestaurantUpdate, RestaurantResponse, RestaurantSettings
+from utils.fields import projection, sparse_model
+from utils.pagination import InvalidCursor, decode_cursor, keyset_filter, next_cursor, page_size
+from models import RestaurantCreate, RestaurantUpdate, RestaurantResponse, RestaurantSettings, Page
 from services.auth import AuthService
 import logging
 
 logger = logging.getLogger(__name__)
 
+RESTAURANT_SORT = (("created_at", -1), ("_id", -1))
+
+def _to_response(restaurant: Dict[str, Any], model=RestaurantResponse) -> RestaurantResponse:
+    """Build the (possibly sparse) response from a projected document"""
+    restaurant["id"] = str(restaurant["_id"])
+    if "settings" in restaurant:
+        restaurant["settings"] = RestaurantSettings(**restaurant["settings"])
+    return model(**restaurant)
+
+class RestaurantCache:
+    """
+    Active restaurants by slug, shared by every service in the process.
+    Entries live RESTAURANT_CACHE_TTL seconds and are dropped by this
+    worker's updates; unknown slugs are remembered for
+    RESTAURANT_NEGATIVE_TTL so probing them does not reach Mongo, and
+    concurrent misses for one slug share a single query. Unknown slugs have
+    their own small LRU, so probing random slugs cannot evict restaurants.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, negative_ttl: Optional[float] = None,
+                 maxsize: Optional[int] = None, negative_maxsize: Optional[int] = None):
+        self._entries = TTLCache(
+            maxsize=maxsize or int(os.getenv("RESTAURANT_CACHE_SIZE", "1024")),
+            ttl=ttl if ttl is not None else float(os.getenv("RESTAURANT_CACHE_TTL", "60"))
+        )
+        self.negative_ttl = negative_ttl if negative_ttl is not None else float(
+            os.getenv("RESTAURANT_NEGATIVE_TTL", "10")
+        )
+        self._missing = TTLCache(
+            maxsize=negative_maxsize or int(os.getenv("RESTAURANT_NEGATIVE_SIZE", "256")),
+            ttl=self.negative_ttl
+        )
+        self._flight = SingleFlight()
+        # Bumped on every invalidation so a load racing an update is not cached
+        self._versions: Dict[str, int] = {}
+
+    async def _load(self, slug: str) -> Optional[RestaurantResponse]:
+        restaurant = await get_collection("restaurants").find_one(
+            {"slug": slug, "is_active": True},
+            projection(RestaurantResponse)
+        )
+        return _to_response(restaurant) if restaurant else None
+
+    def _store(self, slug: str, restaurant: Optional[RestaurantResponse]):
+        if restaurant is None:
+            if self.negative_ttl > 0:
+                self._missing.set(slug, True)
+        else:
+            self._missing.invalidate(slug)
+            self._entries.set(slug, restaurant)
+
+    async def get(self, slug: str) -> Optional[RestaurantResponse]:
+        """The active restaurant, or None; database errors propagate and are not cached"""
+        restaurant = self._entries.get(slug)
+        if restaurant is not None:
+            return restaurant
+        if self._missing.get(slug):
+            return None
+
+        async def load():
+            version = self._versions.get(slug, 0)
+            restaurant = await self._load(slug)
+            if self._versions.get(slug, 0) == version:
+                self._store(slug, restaurant)
+            return restaurant
+
+        return await self._flight.do(slug, load)
+
+    def invalidate(self, slug: str):
+        self._versions[slug] = self._versions.get(slug, 0) + 1
+        self._entries.invalidate(slug)
+        self._missing.invalidate(slug)
+
+    async def warm_up(self, limit: Optional[int] = None) -> int:
+        """Load the newest active restaurants with one query (at startup)"""
+        try:
+            cursor = get_collection("restaurants").find(
+                {"is_active": True}, projection(RestaurantResponse)
+            ).sort("created_at", -1).limit(limit or self._entries.maxsize)
+            loaded = 0
+            async for restaurant in cursor:
+                self._store(restaurant["slug"], _to_response(restaurant))
+                loaded += 1
+            return loaded
+        except Exception as e:
+            logger.error(f"Error warming restaurant cache: {e}")
+            return 0
+
+    def clear(self):
+        self._entries.clear()
+        self._missing.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._entries.stats(), "negative_ttl": self.negative_ttl, "negative": self._missing.stats()}
+
+restaurant_cache = RestaurantCache()
+
 class RestaurantService:
-    def __init__(self):
+    def __init__(self, auth_service: Optional[AuthService] = None):
         self.collection = get_collection("restaurants")
-        self.auth_service = AuthService()
+        self._auth_service = auth_service
+        self.page_size = int(os.getenv("RESTAURANTS_PAGE_SIZE", "50"))
+        self.max_page_size = int(os.getenv("RESTAURANTS_PAGE_MAX", "200"))
+
+    @property
+    def auth_service(self) -> AuthService:
+        # Only create_restaurant needs it
+        if self._auth_service is None:
+            self._auth_service = AuthService()
+        return self._auth_service
 
     async def create_restaurant(self, restaurant_data: RestaurantCreate) -> RestaurantResponse:
         """Create new restaurant with admin user"""
@@ -40,6 +151,8 @@ class RestaurantService:
             
             result = await self.collection.insert_one(restaurant_doc)
             restaurant_id = result.inserted_id
+            # Forget a cached "unknown slug"
+            restaurant_cache.invalidate(restaurant_data.slug)
             
             # Create admin user
             await self.auth_service.create_user(
@@ -59,17 +172,14 @@ class RestaurantService:
             logger.error(f"Error creating restaurant: {e}")
             raise
 
-    async def get_by_slug(self, slug: str) -> Optional[RestaurantResponse]:
-        """Get restaurant by slug"""
+    async def get_by_slug(self, slug: str, fields: Optional[FrozenSet[str]] = None) -> Optional[RestaurantResponse]:
+        """Get restaurant by slug (from the process-wide cache)"""
         try:
-            restaurant = await self.collection.find_one({"slug": slug, "is_active": True})
-            if not restaurant:
-                return None
-                
-            restaurant["id"] = str(restaurant["_id"])
-            restaurant["settings"] = RestaurantSettings(**restaurant["settings"])
+            restaurant = await restaurant_cache.get(slug)
+            if restaurant is None or fields is None:
+                return restaurant
             
-            return RestaurantResponse(**restaurant)
+            return sparse_model(RestaurantResponse, fields)(**restaurant.model_dump(include=fields))
             
         except Exception as e:
             logger.error(f"Error getting restaurant by slug: {e}")
@@ -88,6 +198,7 @@ class RestaurantService:
                 {"slug": slug},
                 {"$set": update_dict}
             )
+            restaurant_cache.invalidate(slug)
             
             return result.modified_count > 0
             
@@ -95,19 +206,37 @@ class RestaurantService:
             logger.error(f"Error updating restaurant: {e}")
             return False
 
-    async def get_all_restaurants(self) -> List[RestaurantResponse]:
-        """Get all restaurants (superadmin only)"""
+    async def get_all_restaurants(
+        self,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[FrozenSet[str]] = None
+    ) -> Page[RestaurantResponse]:
+        """
+        Get all restaurants, newest first (superadmin only), or one page when
+        `limit` or `cursor` is given
+        """
         try:
-            cursor = self.collection.find({}).sort("created_at", -1)
-            restaurants = []
+            query = {}
+            if cursor:
+                query = keyset_filter(RESTAURANT_SORT, decode_cursor("restaurants", cursor, RESTAURANT_SORT))
             
-            async for restaurant in cursor:
-                restaurant["id"] = str(restaurant["_id"])
-                restaurant["settings"] = RestaurantSettings(**restaurant["settings"])
-                restaurants.append(RestaurantResponse(**restaurant))
-                
-            return restaurants
+            model = sparse_model(RestaurantResponse, fields)
+            found = self.collection.find(
+                query, projection(RestaurantResponse, fields, extra=("created_at",))
+            ).sort(list(RESTAURANT_SORT))
+            if limit is None and cursor is None:
+                documents = await found.to_list(length=None)
+                return Page(items=[_to_response(restaurant, model) for restaurant in documents])
             
+            size = page_size(limit, self.page_size, self.max_page_size)
+            documents = await found.limit(size + 1).to_list(length=size + 1)
+            restaurants = [_to_response(restaurant, model) for restaurant in documents[:size]]
+            
+            return Page(items=restaurants, next_cursor=next_cursor("restaurants", RESTAURANT_SORT, documents, size))
+            
+        except InvalidCursor:
+            raise
         except Exception as e:
             logger.error(f"Error getting all restaurants: {e}")
-            return []
\ No newline at end of file
+            return Page(items=[])
\ No newline at end of file
@@ -1,47 +1,69 @@
+import os
 import pytest
 import asyncio
 from fastapi.testclient import TestClient
 from unittest.mock import AsyncMock, patch, MagicMock
-from main import app
+
+# main validates these at import; no database is contacted without the lifespan
+for name, value in (("MONGODB_URL", "mongodb://localhost:27017"), ("SECRET_KEY", "test-secret"), ("DATABASE_NAME", "test")):
+    os.environ.setdefault(name, value)
+
+from main import app, menu_cache
 from services.auth import AuthService
+from models import Page
+from services.container import (
+    get_auth_service, get_restaurant_service, get_product_service, get_product_importer,
+    get_order_service, get_category_service, get_api_key_service
+)
 
 class TestAPIEndpoints:
     """Test suite for API endpoints"""
     
+    @pytest.fixture(autouse=True)
+    def services(self):
+        """Replace every service dependency with a mock"""
+        mocks = {
+            dependency: MagicMock() for dependency in (
+                get_auth_service, get_restaurant_service, get_product_service, get_product_importer,
+                get_order_service, get_category_service, get_api_key_service
+            )
+        }
+        mocks[get_auth_service].verify_token = AsyncMock(return_value=None)
+        for dependency, mock in mocks.items():
+            app.dependency_overrides[dependency] = lambda mock=mock: mock
+        menu_cache.invalidate("test-restaurant")
+        yield mocks
+        app.dependency_overrides.clear()
+    
     @pytest.fixture
     def client(self):
         """Create test client"""
         return TestClient(app)
     
     @pytest.fixture
-    def mock_auth_service(self):
+    def mock_auth_service(self, services):
         """Mock authentication service"""
-        with patch('main.auth_service') as mock:
-            yield mock
+        return services[get_auth_service]
     
     @pytest.fixture
-    def mock_restaurant_service(self):
+    def mock_restaurant_service(self, services):
         """Mock restaurant service"""
-        with patch('main.restaurant_service') as mock:
-            yield mock
+        return services[get_restaurant_service]
     
     @pytest.fixture
-    def mock_product_service(self):
+    def mock_product_service(self, services):
         """Mock product service"""
-        with patch('main.product_service') as mock:
-            yield mock
+        return services[get_product_service]
     
     @pytest.fixture
-    def mock_category_service(self):
+    def mock_category_service(self, services):
         """Mock category service"""
-        with patch('main.category_service') as mock:
-            yield mock
+        return services[get_category_service]
     
     @pytest.fixture
-    def mock_order_service(self):
+    def mock_order_service(self, services):
         """Mock order service"""
-        with patch('main.order_service') as mock:
-            yield mock
+        return services[get_order_service]
     
     @pytest.fixture
     def valid_token(self):
@@ -246,6 +268,35 @@ class TestAPIEndpoints:
         assert data[0]["name"] == "Margherita Pizza"
         assert data[0]["price"] == 15.99
     
+    def test_product_pages_are_not_cached(self, client, mock_product_service):
+        """Test only the default first page is cached; later pages and custom sizes are not"""
+        product = {
+            "id": "prod_1", "name": "Margherita Pizza", "description": "Classic pizza",
+            "price": 15.99, "image": "", "category_id": "cat_1", "sizes": [], "toppings": [],
+            "is_available": True, "is_popular": True, "is_vegetarian": True, "is_vegan": False,
+            "allergens": [], "preparation_time": 20, "rating": 4.5, "rating_count": 100
+        }
+        mock_product_service.page_size = 200
+        # Overrides are deep-copied per request, so count loads through a shared list
+        loads = []
+        
+        async def load(*args):
+            loads.append(args)
+            return Page(items=[product], next_cursor="next")
+        
+        mock_product_service.get_products_by_restaurant = AsyncMock(side_effect=load)
+        
+        for _ in range(2):
+            first = client.get("/api/test-restaurant/products?limit=200")
+        assert len(loads) == 1
+        
+        for query in ("?cursor=abc", "?cursor=abc", "?limit=7", "?limit=7"):
+            response = client.get(f"/api/test-restaurant/products{query}")
+            assert response.headers["x-next-cursor"] == "next"
+        
+        assert first.headers["x-next-cursor"] == "next"
+        assert len(loads) == 5
+    
     def test_create_order_success(self, client, mock_order_service):
         """Test successful order creation"""
         mock_order_service.create_order = AsyncMock(return_value={
@@ -254,7 +305,7 @@ class TestAPIEndpoints:
             "customer": {
                 "name": "John Doe",
                 "phone": "+1234567890",
-                "email": "john @example.com",
+                "email": "john@example.com",
                 "address": "123 Main St",
                 "delivery_notes": "Ring doorbell"
             },
@@ -285,7 +336,7 @@ class TestAPIEndpoints:
             "customer": {
                 "name": "John Doe",
                 "phone": "+1234567890",
-                "email": "john @example.com",
+                "email": "john@example.com",
                 "address": "123 Main St",
                 "delivery_notes": "Ring doorbell"
             },
@@ -354,7 +405,10 @@ class TestAPIEndpoints:
     
     def test_cors_headers(self, client):
         """Test CORS headers are present"""
-        response = client.options("/api/restaurants/test-restaurant")
+        response = client.options("/api/restaurants/test-restaurant", headers={
+            "Origin": "http://localhost:3000",
+            "Access-Control-Request-Method": "GET"
+        })
         
         # Check for CORS headers
         assert "access-control-allow-origin" in response.headers
@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from models import APIKeyCreate
+from services.api_keys import APIKeyService, api_key_validator
+
+class TestAPIKeyService:
+    """Test suite for APIKeyService"""
+    
+    @pytest.fixture
+    def api_key_service(self):
+        """Create APIKeyService with a mocked collection and an empty index"""
+        api_key_validator.load({})
+        with patch('services.api_keys.get_collection') as mock_collection:
+            mock_collection.return_value = AsyncMock()
+            service = APIKeyService()
+        service.loaded_at = 0.0
+        service.index_ttl = float("inf")
+        return service
+    
+    @pytest.mark.asyncio
+    async def test_create_and_authenticate(self, api_key_service):
+        """Test a created key resolves from the index without hitting Mongo"""
+        api_key_service.collection.insert_one = AsyncMock(return_value=MagicMock(inserted_id="key_id_1"))
+        api_key_service.collection.find_one = AsyncMock()
+        
+        created = await api_key_service.create_api_key(
+            "test-restaurant",
+            APIKeyCreate(name="pos", permissions=["orders:read"])
+        )
+        stored = api_key_service.collection.insert_one.call_args[0][0]
+        
+        assert created.api_key.startswith(f"dp_{created.key_prefix}_")
+        assert created.api_key not in stored.values()
+        
+        client = await api_key_service.authenticate(created.api_key)
+        assert client["restaurant_slug"] == "test-restaurant"
+        assert client["permissions"] == ["orders:read"]
+        assert await api_key_service.authenticate(created.api_key + "x") is None
+        api_key_service.collection.find_one.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_revoke_removes_key_from_index(self, api_key_service):
+        """Test revoked keys stop authenticating immediately"""
+        api_key_service.collection.insert_one = AsyncMock(return_value=MagicMock(inserted_id="key_id_1"))
+        created = await api_key_service.create_api_key("test-restaurant", APIKeyCreate(name="pos"))
+        key_hash = api_key_service.collection.insert_one.call_args[0][0]["key_hash"]
+        api_key_service.collection.find_one_and_update = AsyncMock(return_value={"key_hash": key_hash})
+        
+        assert await api_key_service.revoke_api_key("test-restaurant", created.key_prefix)
+        assert await api_key_service.authenticate(created.api_key) is None
+    
+    @pytest.mark.asyncio
+    async def test_refresh_started_before_revoke_does_not_reinstate_key(self, api_key_service):
+        """Test a refresh whose query predates a revoke keeps the key revoked"""
+        api_key_service.collection.insert_one = AsyncMock(return_value=MagicMock(inserted_id="key_id_1"))
+        created = await api_key_service.create_api_key("test-restaurant", APIKeyCreate(name="pos"))
+        stored = dict(api_key_service.collection.insert_one.call_args[0][0], _id="key_id_1")
+        api_key_service.collection.find_one_and_update = AsyncMock(return_value={"key_hash": stored["key_hash"]})
+        query_done = asyncio.Event()
+        
+        async def snapshot():
+            # The active-key query already ran; its result arrives after the revoke
+            await query_done.wait()
+            yield stored
+        
+        api_key_service.collection.find = MagicMock(return_value=snapshot())
+        refresh = asyncio.create_task(api_key_service.refresh_index())
+        while not api_key_service.collection.find.called:
+            await asyncio.sleep(0)
+        assert await api_key_service.revoke_api_key("test-restaurant", created.key_prefix)
+        query_done.set()
+        await refresh
+        
+        assert await api_key_service.authenticate(created.api_key) is None
@@ -1,8 +1,11 @@
 import pytest
 import asyncio
 from unittest.mock import AsyncMock, patch
-from services.auth import AuthService
+from services.auth import AuthService, TokenCodec, principal_cache, token_epochs, refresh_flight, invalidate_principal
+from jose import JWTError, jwt
+from datetime import datetime, timedelta
 from passlib.context import CryptContext
+from utils.hashing import PasswordHasher, HashingQueueFull, calibrate_bcrypt_rounds
 
 class TestAuthService:
     """Test suite for AuthService"""
@@ -10,6 +13,8 @@ class TestAuthService:
     @pytest.fixture
     def auth_service(self):
         """Create AuthService instance for testing"""
+        principal_cache.clear()
+        refresh_flight.clear()
         with patch('services.auth.get_collection') as mock_collection:
             mock_collection.return_value = AsyncMock()
             return AuthService()
@@ -116,6 +121,56 @@ class TestAuthService:
         assert result["user"]["username"] == "testuser"
         assert result["user"]["role"] == "admin"
     
+    @pytest.mark.asyncio
+    async def test_authenticate_user_rehashes_outdated_cost(self, auth_service):
+        """Test a hash with a different work factor is upgraded on login"""
+        old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("testpass123")
+        mock_user = {
+            "_id": "user_id_123",
+            "username": "testuser",
+            "password_hash": old_hash,
+            "role": "admin",
+            "restaurant_slug": "test-restaurant",
+            "is_active": True
+        }
+        auth_service.users_collection.find_one = AsyncMock(return_value=mock_user)
+        auth_service.users_collection.update_one = AsyncMock()
+        auth_service.password_hasher = PasswordHasher(CryptContext(schemes=["bcrypt"]), max_workers=1)
+        auth_service.password_hasher.set_rounds(5)
+        
+        result = await auth_service.authenticate_user("testuser", "testpass123", "test-restaurant")
+        auth_service.password_hasher.shutdown()
+        
+        assert result is not None
+        auth_service.users_collection.update_one.assert_called_once()
+        new_hash = auth_service.users_collection.update_one.call_args[0][1]["$set"]["password_hash"]
+        assert new_hash.startswith("$2b$05$")
+    
+    @pytest.mark.asyncio
+    async def test_authenticate_user_keeps_stronger_hash(self, auth_service):
+        """Test a hash costlier than the configured work factor is not downgraded"""
+        strong_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=6).hash("testpass123")
+        mock_user = {
+            "_id": "user_id_123",
+            "username": "testuser",
+            "password_hash": strong_hash,
+            "role": "admin",
+            "restaurant_slug": "test-restaurant",
+            "is_active": True
+        }
+        auth_service.users_collection.find_one = AsyncMock(return_value=mock_user)
+        auth_service.users_collection.update_one = AsyncMock()
+        auth_service.password_hasher = PasswordHasher(CryptContext(schemes=["bcrypt"]), max_workers=1)
+        auth_service.password_hasher.set_rounds(5)
+        
+        result = await auth_service.authenticate_user("testuser", "testpass123", "test-restaurant")
+        new_hash = await auth_service.password_hasher.hash("other")
+        auth_service.password_hasher.shutdown()
+        
+        assert result is not None
+        auth_service.users_collection.update_one.assert_not_called()
+        assert new_hash.startswith("$2b$05$")
+    
     @pytest.mark.asyncio
     async def test_authenticate_user_wrong_password(self, auth_service):
         """Test authentication with wrong password"""
@@ -182,6 +237,115 @@ class TestAuthService:
         assert result["role"] == "admin"
         assert result["restaurant_slug"] == "test-restaurant"
     
+    @pytest.mark.asyncio
+    async def test_verify_token_uses_principal_cache(self, auth_service):
+        """Test repeated verification hits the principal cache instead of Mongo"""
+        token = auth_service.create_access_token({
+            "sub": "testuser",
+            "restaurant_slug": "test-restaurant",
+            "role": "admin",
+            "user_id": "user_id_123"
+        })
+        mock_user = {
+            "_id": "user_id_123",
+            "username": "testuser",
+            "role": "admin",
+            "restaurant_slug": "test-restaurant",
+            "is_active": True
+        }
+        auth_service.users_collection.find_one = AsyncMock(return_value=mock_user)
+        hits = principal_cache.hits
+        
+        first = await auth_service.verify_token(token)
+        second = await auth_service.verify_token(token)
+        
+        assert first == second
+        auth_service.users_collection.find_one.assert_called_once()
+        assert principal_cache.hits - hits == 1
+    
+    @pytest.mark.asyncio
+    async def test_role_change_invalidates_principal_cache(self, auth_service):
+        """Test role changes and deactivation evict the cached principal"""
+        token = auth_service.create_access_token({
+            "sub": "testuser",
+            "restaurant_slug": "test-restaurant"
+        })
+        mock_user = {
+            "_id": "user_id_123",
+            "username": "testuser",
+            "role": "admin",
+            "restaurant_slug": "test-restaurant",
+            "is_active": True
+        }
+        auth_service.users_collection.find_one = AsyncMock(return_value=mock_user)
+        auth_service.users_collection.find_one_and_update = AsyncMock(
+            return_value={"_id": "user_id_123", "token_epoch": 1, "is_active": True}
+        )
+        
+        await auth_service.verify_token(token)
+        assert await auth_service.update_user_role("testuser", "test-restaurant", "superadmin")
+        
+        mock_user["role"] = "superadmin"
+        result = await auth_service.verify_token(token)
+        assert result["role"] == "superadmin"
+        
+        assert await auth_service.deactivate_user("testuser", "test-restaurant")
+        auth_service.users_collection.find_one = AsyncMock(return_value=None)
+        assert await auth_service.verify_token(token) is None
+    
+    @pytest.mark.asyncio
+    async def test_invalidation_during_lookup_is_not_cached(self, auth_service):
+        """Test a principal read before a concurrent invalidation is not written back"""
+        token = auth_service.create_access_token({
+            "sub": "testuser",
+            "restaurant_slug": "test-restaurant"
+        })
+        mock_user = {
+            "_id": "user_id_123",
+            "username": "testuser",
+            "role": "admin",
+            "restaurant_slug": "test-restaurant",
+            "is_active": True
+        }
+        
+        async def racing_find_one(*args, **kwargs):
+            invalidate_principal("testuser", "test-restaurant")
+            return mock_user
+        
+        auth_service.users_collection.find_one = AsyncMock(side_effect=racing_find_one)
+        
+        result = await auth_service.verify_token(token)
+        
+        assert result["role"] == "admin"
+        assert principal_cache.get(("testuser", "test-restaurant")) is None
+    
+    @pytest.mark.asyncio
+    async def test_stateless_verify_token(self, auth_service):
+        """Test stateless mode trusts claims and honours epoch revocation"""
+        auth_service.verify_mode = "stateless"
+        token = auth_service.create_access_token({
+            "sub": "testuser",
+            "restaurant_slug": "test-restaurant",
+            "role": "admin",
+            "user_id": "user_id_stateless",
+            "epoch": 0
+        })
+        auth_service.users_collection.find_one = AsyncMock()
+        token_epochs.set("user_id_stateless", 0)
+        
+        result = await auth_service.verify_token(token)
+        
+        assert result == {
+            "id": "user_id_stateless",
+            "username": "testuser",
+            "role": "admin",
+            "restaurant_slug": "test-restaurant"
+        }
+        auth_service.users_collection.find_one.assert_not_called()
+        
+        token_epochs.set("user_id_stateless", 1)
+        assert await auth_service.verify_token(token) is None
+    
     @pytest.mark.asyncio
     async def test_verify_token_invalid(self, auth_service):
         """Test token verification with invalid token"""
@@ -218,12 +382,134 @@ class TestAuthService:
         assert result["refresh_token"]
         assert result["user"]["username"] == "testuser"
     
+    @pytest.mark.asyncio
+    async def test_concurrent_refresh_is_coalesced(self, auth_service):
+        """Test concurrent refreshes with one token share a single rotation"""
+        refresh_token = auth_service.create_refresh_token({
+            "sub": "testuser",
+            "restaurant_slug": "test-restaurant"
+        })
+        mock_user = {
+            "_id": "user_id_123",
+            "username": "testuser",
+            "role": "admin",
+            "restaurant_slug": "test-restaurant",
+            "is_active": True
+        }
+        
+        async def slow_find_one(*args, **kwargs):
+            await asyncio.sleep(0.01)
+            return mock_user
+        
+        auth_service.users_collection.find_one = AsyncMock(side_effect=slow_find_one)
+        
+        results = await asyncio.gather(*[
+            auth_service.refresh_access_token(refresh_token) for _ in range(5)
+        ])
+        late = await auth_service.refresh_access_token(refresh_token)
+        
+        auth_service.users_collection.find_one.assert_called_once()
+        assert all(r == results[0] for r in results)
+        assert late == results[0]
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_refresh_leader_does_not_fail_followers(self, auth_service):
+        """Test a disconnecting first caller leaves the shared refresh running"""
+        refresh_token = auth_service.create_refresh_token({
+            "sub": "testuser",
+            "restaurant_slug": "test-restaurant"
+        })
+        mock_user = {
+            "_id": "user_id_123",
+            "username": "testuser",
+            "role": "admin",
+            "restaurant_slug": "test-restaurant",
+            "is_active": True
+        }
+        
+        async def slow_find_one(*args, **kwargs):
+            await asyncio.sleep(0.01)
+            return mock_user
+        
+        auth_service.users_collection.find_one = AsyncMock(side_effect=slow_find_one)
+        
+        leader = asyncio.create_task(auth_service.refresh_access_token(refresh_token))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(auth_service.refresh_access_token(refresh_token)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        
+        assert leader.cancelled()
+        assert all(r is not None and r == results[0] for r in results)
+        auth_service.users_collection.find_one.assert_called_once()
+    
     @pytest.mark.asyncio
     async def test_refresh_access_token_invalid(self, auth_service):
         """Test token refresh with invalid token"""
         result = await auth_service.refresh_access_token("invalid_refresh_token")
         assert result is None
 
+class TestTokenCodec:
+    """Test suite for the JWT codec"""
+    
+    def test_decode_caches_verified_tokens(self):
+        """Test a verified token is served from the LRU on repeat"""
+        codec = TokenCodec("secret", "HS256", backend="jose")
+        token = codec.encode({"sub": "testuser", "exp": datetime.utcnow() + timedelta(minutes=5)})
+        
+        assert codec.decode(token)["sub"] == "testuser"
+        assert codec.decode(token)["sub"] == "testuser"
+        assert codec.stats()["hits"] == 1
+    
+    def test_decode_rejects_expired_and_tampered_tokens(self):
+        """Test expiry and signature are enforced"""
+        codec = TokenCodec("secret", "HS256", backend="jose")
+        expired = jwt.encode({"sub": "testuser", "exp": datetime.utcnow() - timedelta(minutes=1)}, "secret")
+        forged = jwt.encode({"sub": "testuser", "exp": datetime.utcnow() + timedelta(minutes=5)}, "other")
+        
+        with pytest.raises(JWTError):
+            codec.decode(expired)
+        with pytest.raises(JWTError):
+            codec.decode(forged)
+        assert codec.stats()["size"] == 0
+
+class TestPasswordHasher:
+    """Test suite for the off-loop password hasher"""
+    
+    @pytest.fixture
+    def hasher(self):
+        hasher = PasswordHasher(CryptContext(schemes=["bcrypt"], bcrypt__rounds=4), max_workers=2, max_queue=1)
+        yield hasher
+        hasher.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_hash_and_verify(self, hasher):
+        """Test hashing and verification run on the pool"""
+        hashed = await hasher.hash("secret")
+        
+        assert await hasher.verify("secret", hashed)
+        assert not await hasher.verify("other", hashed)
+        stats = hasher.stats()
+        assert stats["completed"] == 3
+        assert stats["in_flight"] == 0
+    
+    def test_calibration_reports_timings(self):
+        """Test calibration picks a work factor within the budget"""
+        result = calibrate_bcrypt_rounds(target_ms=10000, min_rounds=4, max_rounds=5, samples=1)
+        
+        assert result["rounds"] == 5
+        assert set(result["timings_ms"]) == {4, 5}
+    
+    @pytest.mark.asyncio
+    async def test_rejects_when_saturated(self, hasher):
+        """Test work beyond workers + queue fails fast"""
+        hasher.in_flight = hasher.max_workers + hasher.max_queue
+        
+        with pytest.raises(HashingQueueFull):
+            await hasher.hash("secret")
+        assert hasher.stats()["rejected"] == 1
+
 # Fixture for running async tests
 @pytest.fixture(scope="session")
 def event_loop():
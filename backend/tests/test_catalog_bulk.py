@@ -0,0 +1,152 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+from models import ProductPatch, CategoryPriceAdjustment, CategoryOrder
+from utils.bulk import bulk_apply, item_results
+
+def cursor_of(documents):
+    async def iterate():
+        for document in documents:
+            yield document
+    return iterate()
+
+class TestBulkHelpers:
+    """Test suite for per-item bulk results"""
+
+    def test_invalid_and_repeated_ids(self):
+        """Test bad or duplicated ids are rejected before any write"""
+        object_id = str(ObjectId())
+
+        results, object_ids = item_results([object_id, "nope", object_id])
+
+        assert [result.status for result in results] == ["pending", "invalid", "invalid"]
+        assert object_ids[1:] == [None, None]
+        assert results[2].error == "Repeated id"
+
+    async def test_write_errors_map_to_items(self):
+        """Test a BulkWriteError only fails the operations it names"""
+        results, _ = item_results([str(ObjectId()), str(ObjectId())])
+        collection = MagicMock()
+        collection.bulk_write = AsyncMock(side_effect=BulkWriteError(
+            {"writeErrors": [{"index": 1, "errmsg": "price must be numeric"}]}
+        ))
+
+        await bulk_apply(collection, [UpdateOne({}, {}), UpdateOne({}, {})], results)
+
+        assert [result.status for result in results] == ["updated", "failed"]
+        assert results[1].error == "price must be numeric"
+        assert collection.bulk_write.call_args.kwargs == {"ordered": False}
+
+class TestCatalogBulkUpdate:
+    """Test suite for bulk availability, price and category-order changes"""
+
+    @pytest.fixture
+    def services(self):
+        products, categories = MagicMock(), MagicMock()
+        products.bulk_write = AsyncMock()
+        categories.bulk_write = AsyncMock()
+        with patch("services.products.get_collection", return_value=products), \
+             patch("services.categories.get_collection", return_value=categories):
+            from services.products import ProductService
+            from services.categories import CategoryService
+            yield ProductService(), CategoryService(), products, categories
+
+    async def test_one_bulk_write_with_per_item_results(self, services):
+        """Test patches and adjustments share one write and foreign ids are not_found"""
+        product_service, _, products, categories = services
+        sold_out, repriced, foreign = ObjectId(), ObjectId(), ObjectId()
+        pizzas = ObjectId()
+        products.find = MagicMock(return_value=cursor_of([{"_id": sold_out}, {"_id": repriced}]))
+        categories.find = MagicMock(return_value=cursor_of([{"_id": pizzas}]))
+        patches = [
+            ProductPatch(product_id=str(sold_out), is_available=False),
+            ProductPatch(product_id=str(repriced), price=1500),
+            ProductPatch(product_id=str(foreign), is_available=False)
+        ]
+        adjustments = [
+            CategoryPriceAdjustment(category_id=str(pizzas), percent=10),
+            CategoryPriceAdjustment(category_id=str(ObjectId()), percent=10)
+        ]
+
+        with patch("services.products.product_search") as search:
+            results = await product_service.bulk_update("duo-previa", patches, adjustments)
+
+        assert [r.status for r in results["products"]] == ["updated", "updated", "not_found"]
+        assert [r.status for r in results["price_adjustments"]] == ["updated", "not_found"]
+        products.bulk_write.assert_called_once()
+        operations = products.bulk_write.call_args[0][0]
+        assert [type(operation) for operation in operations] == [UpdateMany, UpdateOne, UpdateOne]
+        adjustment = operations[0]._doc[0]["$set"]["price"]
+        assert adjustment == {"$round": [{"$multiply": ["$price", 1.1]}, 2]}
+        # An explicit price is not adjusted again by its category
+        assert operations[0]._filter == {
+            "restaurant_slug": "duo-previa", "category_id": pizzas, "_id": {"$nin": [repriced]}
+        }
+        assert all(operation._filter["restaurant_slug"] == "duo-previa" for operation in operations)
+        assert search.update.call_count == 2
+
+    async def test_reorder_categories(self, services):
+        """Test display_order changes are one tenant-scoped bulk_write"""
+        _, category_service, _, categories = services
+        first, second = ObjectId(), ObjectId()
+        categories.find = MagicMock(return_value=cursor_of([{"_id": first}, {"_id": second}]))
+
+        results = await category_service.reorder_categories("duo-previa", [
+            CategoryOrder(category_id=str(second), display_order=0),
+            CategoryOrder(category_id=str(first), display_order=1),
+            CategoryOrder(category_id="bad", display_order=2)
+        ])
+
+        assert [result.status for result in results] == ["updated", "updated", "invalid"]
+        operations = categories.bulk_write.call_args[0][0]
+        assert [operation._doc["$set"]["display_order"] for operation in operations] == [0, 1]
+        assert categories.find.call_args[0][0] == {"_id": {"$in": [second, first]}, "restaurant_slug": "duo-previa"}
+
+    async def test_lookup_failure_fails_items(self, services):
+        """Test a failed tenant lookup reports failures instead of raising"""
+        product_service, _, products, _ = services
+        products.find = MagicMock(side_effect=Exception("down"))
+
+        results = await product_service.bulk_update(
+            "duo-previa", [ProductPatch(product_id=str(ObjectId()), is_available=True)], []
+        )
+
+        assert results["products"][0].status == "failed"
+        products.bulk_write.assert_not_called()
+
+class TestTenantScopedWrites:
+    """Test suite for single-document writes staying inside the caller's restaurant"""
+
+    @pytest.fixture
+    def collection(self):
+        collection = MagicMock()
+        # Another restaurant's document: the tenant filter matches nothing
+        collection.update_one = AsyncMock(return_value=MagicMock(matched_count=0, modified_count=0))
+        collection.count_documents = AsyncMock(return_value=0)
+        with patch("services.products.get_collection", return_value=collection), \
+             patch("services.orders.get_collection", return_value=collection):
+            yield collection
+
+    async def test_foreign_product_is_not_found(self, collection):
+        """Test updating or deleting another tenant's product by id changes nothing"""
+        from models import ProductUpdate
+        from services.products import ProductService
+        product_id = str(ObjectId())
+
+        assert not await ProductService().update_product(product_id, ProductUpdate(price=1), "duo-previa")
+        assert not await ProductService().update_product(product_id, ProductUpdate(), "duo-previa")
+        assert not await ProductService().delete_product(product_id, "duo-previa")
+
+        for call in collection.update_one.call_args_list:
+            assert call[0][0] == {"_id": ObjectId(product_id), "restaurant_slug": "duo-previa"}
+        assert collection.count_documents.call_args[0][0]["restaurant_slug"] == "duo-previa"
+
+    async def test_foreign_order_status_is_not_found(self, collection):
+        """Test changing another tenant's order status changes nothing"""
+        from services.orders import OrderService
+        order_id = str(ObjectId())
+
+        assert not await OrderService().update_order_status(order_id, "confirmed", "duo-previa")
+        assert collection.update_one.call_args[0][0] == {"_id": ObjectId(order_id), "restaurant_slug": "duo-previa"}
@@ -0,0 +1,157 @@
+import gzip
+import asyncio
+import pytest
+from typing import List
+from unittest.mock import MagicMock, patch
+from pydantic import TypeAdapter
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from middleware import compression
+from middleware.compression import CompressionMiddleware, PrecompressedResponseCache, choose_encoding
+
+MENU = [{"name": f"Pizza {i}", "description": "Muzzarella, tomate y albahaca"} for i in range(50)]
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    
+    @app.get("/menu")
+    async def menu():
+        return MENU
+    
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+    
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"chunk-{i};" * 100
+        return StreamingResponse(chunks(), media_type="text/plain")
+    
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+    return app
+
+class TestCompressionMiddleware:
+    """Test suite for gzip/brotli response compression"""
+    
+    def test_large_body_is_gzipped(self):
+        """Test bodies over the threshold are compressed with a correct length"""
+        client = TestClient(build_app())
+        response = client.get("/menu", headers={"Accept-Encoding": "gzip"})
+        
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.json() == MENU
+        assert int(response.headers["content-length"]) < len(response.content)
+    
+    def test_small_body_and_no_accept_encoding_pass_through(self):
+        """Test small bodies and clients without gzip get identity responses"""
+        client = TestClient(build_app())
+        
+        assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+        assert "content-encoding" not in client.get("/menu", headers={"Accept-Encoding": "identity"}).headers
+        assert "content-encoding" not in client.get("/menu", headers={"Accept-Encoding": "gzip;q=0"}).headers
+    
+    def test_streaming_body_is_compressed_per_chunk(self):
+        """Test streamed bodies are compressed incrementally"""
+        client = TestClient(build_app())
+        response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert response.text == "".join(f"chunk-{i};" * 100 for i in range(3))
+    
+    def test_choose_encoding_prefers_brotli_when_available(self, monkeypatch):
+        """Test brotli is only chosen when the module is installed"""
+        monkeypatch.setattr(compression, "brotli", None)
+        assert choose_encoding("gzip, deflate, br") == "gzip"
+        
+        monkeypatch.setattr(compression, "brotli", object())
+        assert choose_encoding("gzip, deflate, br") == "br"
+        assert choose_encoding("br;q=0, gzip") == "gzip"
+
+class TestPrecompressedResponseCache:
+    """Test suite for the pre-compressed menu cache"""
+    
+    @pytest.mark.asyncio
+    async def test_compressed_variant_is_built_once(self, monkeypatch):
+        """Test hits reuse the stored compressed bytes"""
+        cache = PrecompressedResponseCache(maxsize=10, ttl=60, minimum_size=10)
+        entry = cache.set("duo-previa", "products", b'{"items": "' + b"x" * 1000 + b'"}')
+        calls = []
+        original = compression.compress
+        monkeypatch.setattr(compression, "compress", lambda *args: calls.append(args) or original(*args))
+        
+        first = await cache.response(entry, "gzip")
+        second = await cache.response(cache.get("duo-previa", "products"), "gzip")
+        
+        assert len(calls) == 1
+        assert first.body == second.body
+        assert first.headers["content-encoding"] == "gzip"
+        assert gzip.decompress(second.body) == entry.body
+        assert "content-encoding" not in (await cache.response(entry, "")).headers
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_first_hits_compress_once_in_threadpool(self, monkeypatch):
+        """Test the first compression runs in the threadpool and is shared by concurrent hits"""
+        cache = PrecompressedResponseCache(maxsize=10, ttl=60, minimum_size=10)
+        entry = cache.set("duo-previa", "products", b'{"items": "' + b"x" * 1000 + b'"}')
+        offloaded = []
+        
+        async def threadpool(func, *args):
+            offloaded.append(func)
+            return func(*args)
+        
+        monkeypatch.setattr(compression, "run_in_threadpool", threadpool)
+        first, second = await asyncio.gather(cache.response(entry, "gzip"), cache.response(entry, "gzip"))
+        
+        assert offloaded == [compression.compress]
+        assert first.body == second.body == entry.variants["gzip"]
+    
+    def test_invalidate_is_per_tenant(self):
+        """Test invalidating one restaurant keeps the others cached"""
+        cache = PrecompressedResponseCache(maxsize=10, ttl=60)
+        cache.set("duo-previa", "categories", b"[]")
+        cache.set("otro", "categories", b"[]")
+        
+        cache.invalidate("duo-previa")
+        
+        assert cache.get("duo-previa", "categories") is None
+        assert cache.get("otro", "categories") is not None
+    
+    def test_body_loaded_before_invalidation_is_not_cached(self):
+        """Test a body whose load raced a write is served once but not stored"""
+        cache = PrecompressedResponseCache(maxsize=10, ttl=60)
+        generation = cache.generation("duo-previa")
+        cache.invalidate("duo-previa")
+        
+        entry = cache.set("duo-previa", "products", b"[1]", generation=generation)
+        
+        assert entry.body == b"[1]"
+        assert cache.get("duo-previa", "products") is None
+    
+    @pytest.mark.asyncio
+    async def test_menu_write_during_load_is_not_served_stale(self):
+        """Test cached_menu_response reads the generation before awaiting the load"""
+        import main
+        
+        cache = PrecompressedResponseCache(maxsize=10, ttl=60)
+        request = MagicMock()
+        request.headers = {}
+        menus = [["Muzzarella"], ["Muzzarella", "Napolitana"]]
+        
+        async def load():
+            menu = menus.pop(0)
+            # A product write lands while the first load is awaiting Mongo
+            cache.invalidate("duo-previa")
+            return menu
+        
+        with patch.object(main, "menu_cache", cache):
+            adapter = TypeAdapter(List[str])
+            first = await main.cached_menu_response(request, "duo-previa", "products", adapter, load)
+            second = await main.cached_menu_response(request, "duo-previa", "products", adapter, load)
+        
+        assert first.body == b'["Muzzarella"]'
+        assert second.body == b'["Muzzarella","Napolitana"]'
@@ -0,0 +1,39 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from services.container import ServiceContainer, get_product_service, services
+
+class TestServiceContainer:
+    """Test suite for lifespan-built service singletons"""
+
+    def test_dependencies_fail_before_start(self):
+        """Test nothing is built implicitly before the lifespan runs"""
+        assert not services.started
+        with pytest.raises(RuntimeError):
+            get_product_service()
+
+    def test_start_builds_each_service_once(self):
+        """Test services are shared singletons wired to each other"""
+        container = ServiceContainer()
+
+        with patch("db.mongo.database") as database:
+            database.database = MagicMock()
+            container.start()
+            products = container.products
+            lookups = database.database.__getitem__.call_count
+            container.start()
+
+        assert container.started and container.products is products
+        assert container.products.category_service is container.categories
+        assert container.restaurants.auth_service is container.auth
+        assert database.database.__getitem__.call_count == lookups
+
+    def test_stop_releases_services(self):
+        """Test a stopped container can be started again (e.g. by another TestClient)"""
+        container = ServiceContainer()
+
+        with patch("db.mongo.database") as database:
+            database.database = MagicMock()
+            container.start()
+            container.stop()
+
+        assert not container.started and container.orders is None
@@ -0,0 +1,110 @@
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+from models import ProductResponse, OrderResponse, RestaurantResponse
+from utils.fields import InvalidFields, list_adapter, parse_fields, projection, sparse_model
+
+class TestFieldSelection:
+    """Test suite for ?fields= parsing and projections"""
+
+    def test_parse_always_includes_id(self):
+        """Test the id is always returned"""
+        assert parse_fields("name, price", ProductResponse) == {"id", "name", "price"}
+        assert parse_fields(None, ProductResponse) is None
+        assert parse_fields("", ProductResponse) is None
+
+    def test_unknown_fields_are_rejected(self):
+        """Test names outside the response model raise InvalidFields"""
+        with pytest.raises(InvalidFields) as exc:
+            parse_fields("name,restaurant_slug,password", ProductResponse)
+
+        assert exc.value.unknown == ["password", "restaurant_slug"]
+        with pytest.raises(InvalidFields):
+            parse_fields(",", ProductResponse)
+
+    def test_projection_maps_id_and_adds_extra(self):
+        """Test response names map to document fields plus service-needed extras"""
+        fields = parse_fields("price", ProductResponse)
+
+        assert projection(ProductResponse, fields, extra=("name",)) == {"_id": 1, "name": 1, "price": 1}
+
+    def test_default_projection_drops_internal_fields(self):
+        """Test the full-model projection leaves out fields no response uses"""
+        restaurant = projection(RestaurantResponse)
+        product = projection(ProductResponse)
+        order = projection(OrderResponse)
+
+        assert "email" not in restaurant and "updated_at" not in restaurant
+        assert "restaurant_id" not in product and "restaurant_slug" not in product
+        assert "restaurant_slug" not in order
+
+    def test_sparse_model_is_cached_and_trimmed(self):
+        """Test the trimmed model only serialises the selected fields"""
+        fields = parse_fields("name,price", ProductResponse)
+        model = sparse_model(ProductResponse, fields)
+
+        assert sparse_model(ProductResponse, fields) is model
+        assert sparse_model(ProductResponse, None) is ProductResponse
+        body = list_adapter(ProductResponse, fields).dump_json([model(id="1", name="Pizza", price=10.0, image="x")])
+        assert body == b'[{"id":"1","name":"Pizza","price":10.0}]'
+
+class TestServiceProjections:
+    """Test suite for projection push-down in the services"""
+
+    async def test_product_page_with_fields(self):
+        """Test the product query is projected and the items are sparse"""
+        from services.products import ProductService
+
+        documents = [{"_id": ObjectId(), "name": "Pizza", "price": 10.0}]
+        cursor = MagicMock()
+        cursor.sort.return_value = cursor
+        cursor.limit.return_value = cursor
+        cursor.to_list = AsyncMock(return_value=documents)
+        collection = MagicMock()
+        collection.find = MagicMock(return_value=cursor)
+        fields = parse_fields("name,price", ProductResponse)
+
+        with patch("services.products.get_collection", return_value=collection):
+            page = await ProductService().get_products_by_restaurant("duo-previa", fields=fields)
+
+        assert collection.find.call_args[0][1] == {"_id": 1, "name": 1, "price": 1}
+        assert page.items[0].model_dump() == {"id": str(documents[0]["_id"]), "name": "Pizza", "price": 10.0}
+
+    async def test_order_detail_with_fields(self):
+        """Test a kitchen view fetches only status and items"""
+        from services.orders import OrderService
+
+        order_id = ObjectId()
+        collection = MagicMock()
+        collection.find_one = AsyncMock(return_value={
+            "_id": order_id, "status": "preparing",
+            "items": [{"product_id": "p1", "product_name": "Pizza", "quantity": 2, "unit_price": 5.0, "total_price": 10.0}]
+        })
+        fields = parse_fields("status,items", OrderResponse)
+
+        with patch("services.orders.get_collection", return_value=collection):
+            order = await OrderService().get_order_by_id(str(order_id), "duo-previa", fields)
+
+        assert collection.find_one.call_args[0][1] == {"_id": 1, "items": 1, "status": 1}
+        assert set(order.model_dump()) == {"id", "status", "items"}
+        assert order.items[0].quantity == 2
+
+    async def test_restaurant_full_response_uses_default_projection(self):
+        """Test the full response still works with the default projection"""
+        from services.restaurants import RestaurantService, RestaurantCache
+
+        collection = MagicMock()
+        collection.find_one = AsyncMock(return_value={
+            "_id": ObjectId(), "name": "Duo", "slug": "duo-previa", "description": None, "logo": "",
+            "phone": "351", "address": "Calle 1", "city": "Córdoba", "settings": {},
+            "is_active": True, "created_at": datetime(2024, 1, 1)
+        })
+
+        with patch("services.restaurants.get_collection", return_value=collection), \
+             patch("services.restaurants.restaurant_cache", RestaurantCache()), \
+             patch("services.restaurants.AuthService"):
+            restaurant = await RestaurantService().get_by_slug("duo-previa")
+
+        assert isinstance(restaurant, RestaurantResponse)
+        assert collection.find_one.call_args[0][1] == projection(RestaurantResponse)
@@ -0,0 +1,128 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+from pymongo import IndexModel
+from db.indexes import (
+    INDEX_MANIFEST, ensure_indexes, find_redundant, manifest_fingerprint, reconcile_indexes, indexes_up_to_date
+)
+
+def spec(name, key, **options):
+    return {"name": name, "key": dict(key), **options}
+
+class FakeCollection:
+    def __init__(self, name, indexes, index_stats=None):
+        self.name = name
+        self.indexes = indexes
+        self.create_indexes = AsyncMock(side_effect=lambda models: [m.document["name"] for m in models])
+        self.update_one = AsyncMock()
+        self.find_one = AsyncMock(return_value=None)
+        cursor = MagicMock()
+        cursor.to_list = AsyncMock(return_value=index_stats or [])
+        self.aggregate = MagicMock(return_value=cursor)
+    
+    async def list_indexes(self):
+        for index in self.indexes:
+            yield index
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection(name, [spec("_id_", [("_id", 1)])])
+        return self[name]
+
+class TestIndexManifest:
+    """Test suite for the declarative index manifest"""
+    
+    def test_manifest_has_no_redundant_indexes(self):
+        """Test no manifest index is a prefix of another one"""
+        for collection, models in INDEX_MANIFEST.items():
+            assert find_redundant([model.document for model in models]) == [], collection
+    
+    def test_prefix_indexes_are_reported(self):
+        """Test single-field indexes covered by a compound index are redundant"""
+        specs = [
+            spec("restaurant_slug_1", [("restaurant_slug", 1)]),
+            spec("restaurant_slug_1_status_1", [("restaurant_slug", 1), ("status", 1)]),
+            spec("order_number_1", [("order_number", 1)], unique=True),
+        ]
+        
+        assert find_redundant(specs) == [
+            {"index": "restaurant_slug_1", "covered_by": "restaurant_slug_1_status_1"}
+        ]
+    
+    def test_fingerprint_changes_with_manifest(self):
+        """Test the fingerprint tracks manifest contents"""
+        changed = {**INDEX_MANIFEST, "extra": [IndexModel([("field", 1)])]}
+        
+        assert manifest_fingerprint() == manifest_fingerprint(dict(INDEX_MANIFEST))
+        assert manifest_fingerprint(changed) != manifest_fingerprint()
+
+class TestReconcileIndexes:
+    """Test suite for diff-based index reconciliation"""
+    
+    async def test_only_missing_indexes_are_created_in_one_call(self):
+        """Test existing indexes are skipped and missing ones batched"""
+        db = FakeDatabase()
+        db["orders"] = FakeCollection("orders", [
+            spec("_id_", [("_id", 1)]),
+            spec("restaurant_slug_1", [("restaurant_slug", 1)]),
+            spec("order_number_1", [("order_number", 1)], unique=True),
+            spec("customer.phone_1", [("customer.phone", 1)]),
+        ], index_stats=[{"name": "restaurant_slug_1", "accesses": {"ops": 0}}])
+        manifest = {"orders": INDEX_MANIFEST["orders"]}
+        
+        report = await reconcile_indexes(db, manifest)
+        
+        db["orders"].create_indexes.assert_awaited_once()
+        assert report["orders"]["created"] == [
+            "restaurant_slug_1_status_1_created_at_-1__id_-1", "restaurant_slug_1_created_at_-1__id_-1"
+        ]
+        assert report["orders"]["unmanaged"] == ["restaurant_slug_1"]
+        assert report["orders"]["redundant"][0]["index"] == "restaurant_slug_1"
+        assert report["orders"]["unused"] == ["restaurant_slug_1"]
+        db["schema_meta"].update_one.assert_awaited_once()
+    
+    async def test_option_mismatch_is_a_conflict(self):
+        """Test an index with the same key but other options is reported, not recreated"""
+        db = FakeDatabase()
+        db["api_keys"] = FakeCollection("api_keys", [
+            spec("key_hash_1", [("key_hash", 1)]),
+            spec("restaurant_slug_1_key_prefix_1", [("restaurant_slug", 1), ("key_prefix", 1)]),
+        ])
+        
+        manifest = {"api_keys": [
+            IndexModel([("key_hash", 1)], unique=True),
+            IndexModel([("restaurant_slug", 1), ("key_prefix", 1)]),
+        ]}
+        
+        report = await reconcile_indexes(db, manifest)
+        
+        assert report["api_keys"]["created"] == []
+        assert report["api_keys"]["conflicts"] == [
+            {"index": "key_hash_1", "current": {}, "manifest": {"unique": True}}
+        ]
+    
+    async def test_up_to_date_check_is_a_single_read(self):
+        """Test workers only compare the stored fingerprint"""
+        db = FakeDatabase()
+        db["schema_meta"].find_one.return_value = {"_id": "indexes", "fingerprint": manifest_fingerprint()}
+        
+        assert await indexes_up_to_date(db)
+        db["schema_meta"].find_one.return_value = {"_id": "indexes", "fingerprint": "old"}
+        assert not await indexes_up_to_date(db)
+    
+    async def test_fresh_database_gets_unique_indexes_in_deploy_mode(self):
+        """Test workers create the unique indexes when the deploy step has not run"""
+        db = FakeDatabase()
+        
+        with patch.dict("os.environ", {"INDEX_RECONCILE": "deploy"}), patch("db.indexes.logger"):
+            await ensure_indexes(db)
+        
+        created = {
+            name: [model.document["name"] for call in collection.create_indexes.await_args_list for model in call.args[0]]
+            for name, collection in db.items() if collection.create_indexes.await_count
+        }
+        assert created == {
+            "restaurants": ["slug_1", "email_1"],
+            "users": ["username_1_restaurant_slug_1"],
+            "orders": ["order_number_1"],
+            "api_keys": ["key_hash_1"],
+        }
+        db["schema_meta"].update_one.assert_not_awaited()
@@ -0,0 +1,88 @@
+import io
+import sys
+import json
+import logging
+from utils.structured_logging import JSONFormatter, RequestSampler, BatchingQueueHandler
+
+def make_record(msg="Request completed", level=logging.INFO, **extra):
+    record = logging.LogRecord("test", level, __file__, 1, msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+class TestJSONFormatter:
+    """Test suite for the JSON log formatter"""
+    
+    def test_extra_fields_are_serialised(self):
+        """Test fields passed with extra= end up in the JSON object"""
+        line = JSONFormatter().format(make_record(correlation_id="abc", status_code=200))
+        entry = json.loads(line)
+        
+        assert entry["message"] == "Request completed"
+        assert entry["level"] == "INFO"
+        assert entry["correlation_id"] == "abc"
+        assert entry["status_code"] == 200
+        assert "msg" not in entry and "args" not in entry
+    
+    def test_exception_and_unserialisable_values(self):
+        """Test tracebacks are included and odd values fall back to str"""
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = make_record(level=logging.ERROR, exc_info=sys.exc_info(), value=object())
+        
+        entry = json.loads(JSONFormatter().format(record))
+        assert "ValueError: boom" in entry["exception"]
+        assert entry["value"].startswith("<object")
+
+class TestRequestSampler:
+    """Test suite for success sampling"""
+    
+    def test_unsampled_request_drops_info_only(self):
+        """Test unsampled successful requests keep only warnings and audit records"""
+        sampler = RequestSampler(rate=0.0)
+        sampler.start_request()
+        
+        assert not sampler.filter(make_record())
+        assert sampler.filter(make_record(level=logging.WARNING))
+        assert sampler.filter(make_record("Login successful", audit=True))
+        assert not sampler.finish_request(200, 0.01)
+    
+    def test_errors_and_slow_requests_are_kept(self):
+        """Test errored and slow requests are always logged"""
+        sampler = RequestSampler(rate=0.0, slow_ms=500)
+        
+        sampler.start_request()
+        assert sampler.finish_request(500, 0.01)
+        assert sampler.filter(make_record())
+        
+        sampler.start_request()
+        assert sampler.finish_request(200, 0.8)
+
+class TestBatchingQueueHandler:
+    """Test suite for the background log writer"""
+    
+    def test_records_are_written_on_close(self):
+        """Test queued records are formatted by the writer and flushed on close"""
+        stream = io.StringIO()
+        handler = BatchingQueueHandler(stream=stream, batch_size=10, flush_interval=0.05)
+        handler.setFormatter(JSONFormatter())
+        
+        for i in range(25):
+            handler.handle(make_record("item", i=i))
+        handler.close()
+        
+        lines = stream.getvalue().splitlines()
+        assert len(lines) == 25
+        assert json.loads(lines[3])["i"] == 3
+        assert handler.stats()["written"] == 25
+        assert handler.stats()["batches"] >= 3
+    
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test records beyond the queue size are counted as dropped"""
+        handler = BatchingQueueHandler(stream=io.StringIO(), queue_size=1)
+        for _ in range(50):
+            handler.emit(make_record())
+        handler.close()
+        
+        assert handler.stats()["dropped"] + handler.stats()["written"] == 50
+        assert handler.stats()["dropped"] > 0
@@ -0,0 +1,95 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from middleware.metrics import LatencyHistogram, MetricsRegistry, MetricsMiddleware
+
+class TestLatencyHistogram:
+    """Test suite for the log-linear latency histogram"""
+    
+    def test_percentiles_within_bucket_error(self):
+        """Test percentiles land within one sub-bucket of the true value"""
+        histogram = LatencyHistogram()
+        for ms in range(1, 101):
+            histogram.record(ms / 1000)
+        
+        assert histogram.count == 100
+        assert 0.050 <= histogram.percentile(0.5) <= 0.050 * 1.125
+        assert 0.099 <= histogram.percentile(0.99) <= 0.099 * 1.125
+    
+    def test_extremes_and_octave_buckets(self):
+        """Test tiny and huge values and cumulative Prometheus buckets"""
+        histogram = LatencyHistogram()
+        histogram.record(0.0)
+        histogram.record(0.001)
+        histogram.record(500.0)
+        
+        assert histogram.counts[0] == 1
+        assert histogram.counts[-1] == 1
+        buckets = dict(histogram.octave_buckets())
+        assert buckets[2 ** 4 / 1e6] == 1
+        assert buckets[2 ** 10 / 1e6] == 2  # 1ms < 1.024ms
+        assert max(count for _, count in buckets.items()) == 2
+
+    def test_integer_recording_matches_bucket_edges(self):
+        """Test every microsecond value lands in the bucket whose edges contain it"""
+        for micros in range(0, 70000, 7):
+            histogram = LatencyHistogram()
+            histogram.record_ns(micros * 1000 + 999)
+            index = histogram.counts.index(1)
+            
+            assert micros / 1e6 < LatencyHistogram.upper_bound(index)
+            assert index == 0 or micros / 1e6 >= LatencyHistogram.upper_bound(index - 1)
+
+def build_app(registry: MetricsRegistry) -> FastAPI:
+    app = FastAPI()
+    
+    @app.get("/api/{slug}/products/{product_id}")
+    async def product(slug: str, product_id: str):
+        return {"id": product_id}
+    
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+    
+    app.add_middleware(MetricsMiddleware, registry=registry)
+    return app
+
+class TestMetricsMiddleware:
+    """Test suite for per-route request metrics"""
+    
+    def test_series_keyed_by_route_template(self):
+        """Test raw URLs collapse to the route template"""
+        registry = MetricsRegistry()
+        client = TestClient(build_app(registry))
+        
+        client.get("/api/duo-previa/products/1")
+        client.get("/api/otro/products/2")
+        client.get("/nope")
+        
+        assert registry.histograms[("/api/{slug}/products/{product_id}", "GET", 200)].count == 2
+        assert registry.histograms[("unmatched", "GET", 404)].count == 1
+        assert registry.in_flight == 0
+    
+    def test_unhandled_error_counts_as_500(self):
+        """Test exceptions are recorded with status 500"""
+        registry = MetricsRegistry()
+        client = TestClient(build_app(registry), raise_server_exceptions=False)
+        
+        client.get("/boom")
+        
+        assert registry.histograms[("/boom", "GET", 500)].count == 1
+    
+    def test_prometheus_rendering(self):
+        """Test text exposition of histograms, gauge and counters"""
+        registry = MetricsRegistry()
+        failures = registry.counter("auth_failures_total", "Rejected logins", ("reason",))
+        failures.inc("login_failed")
+        failures.inc("login_failed")
+        registry.observe("/api/{slug}/orders", "POST", 201, 0.002)
+        
+        text = registry.render()
+        
+        assert "# TYPE http_request_duration_seconds histogram" in text
+        assert 'http_request_duration_seconds_bucket{route="/api/{slug}/orders",method="POST",status="201",le="+Inf"} 1' in text
+        assert 'http_request_duration_seconds_count{route="/api/{slug}/orders",method="POST",status="201"} 1' in text
+        assert "http_requests_in_flight 0" in text
+        assert 'auth_failures_total{reason="login_failed"} 2' in text
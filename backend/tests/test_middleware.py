@@ -0,0 +1,189 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from middleware.security import (
+    RateLimitMiddleware, SecurityHeadersMiddleware, RequestLoggingMiddleware,
+    InputValidationMiddleware, InputScanMetrics
+)
+from middleware.rate_limit import RateLimitPolicy
+
+def build_app(calls: int = 100) -> FastAPI:
+    app = FastAPI()
+    
+    @app.get("/echo")
+    async def echo(request: Request, q: str = ""):
+        return {"q": q, "correlation_id": request.state.correlation_id}
+    
+    @app.post("/notes")
+    async def notes(request: Request):
+        body = await request.body()
+        return {"size": len(body)}
+    
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"chunk-{i};"
+        return StreamingResponse(chunks(), media_type="text/plain")
+    
+    # Same order as main.py
+    app.add_middleware(SecurityHeadersMiddleware)
+    app.add_middleware(RequestLoggingMiddleware)
+    app.add_middleware(InputValidationMiddleware)
+    app.add_middleware(RateLimitMiddleware, calls=calls, period=3600)
+    return app
+
+class TestSecurityMiddleware:
+    """Test suite for the ASGI security middleware stack"""
+    
+    def test_security_and_correlation_headers(self):
+        """Test security headers and correlation ID are added"""
+        client = TestClient(build_app())
+        response = client.get("/echo")
+        
+        assert response.status_code == 200
+        assert response.headers["x-content-type-options"] == "nosniff"
+        assert response.headers["x-frame-options"] == "DENY"
+        assert response.headers["content-security-policy"] == "default-src 'self'"
+        assert response.headers["x-correlation-id"] == response.json()["correlation_id"]
+    
+    def test_streaming_response_passes_through(self):
+        """Test streaming bodies are forwarded chunk by chunk with headers"""
+        client = TestClient(build_app())
+        response = client.get("/stream")
+        
+        assert response.text == "chunk-0;chunk-1;chunk-2;"
+        assert response.headers["x-frame-options"] == "DENY"
+    
+    def test_suspicious_query_is_rejected(self):
+        """Test suspicious query parameters get a 400"""
+        client = TestClient(build_app())
+        response = client.get("/echo", params={"q": "<script>alert(1)</script>"})
+        
+        assert response.status_code == 400
+        assert response.json()["error"] == "Invalid input detected"
+        assert client.get("/echo", params={"q": "pizza"}).status_code == 200
+    
+    def test_rate_limit(self):
+        """Test requests beyond the limit get a 429"""
+        client = TestClient(build_app(calls=2))
+        
+        assert client.get("/echo").status_code == 200
+        assert client.get("/echo").status_code == 200
+        response = client.get("/echo")
+        assert response.status_code == 429
+        assert "Rate limit exceeded" in response.json()["error"]
+    
+    def test_tenant_rejection_does_not_use_ip_budget(self):
+        """Test a request rejected by the tenant limit gives back the client's IP allowance"""
+        app = FastAPI()
+        
+        @app.get("/api/{slug}/products")
+        async def products(slug: str):
+            return []
+        
+        app.add_middleware(RateLimitMiddleware, policies=[
+            RateLimitPolicy("menu", r"^/api/", calls=2, period=3600, tenant_calls=1),
+            RateLimitPolicy("default", r"", calls=100, period=3600)
+        ])
+        client = TestClient(app)
+        
+        assert client.get("/api/a/products").status_code == 200
+        assert client.get("/api/a/products").status_code == 429
+        assert client.get("/api/b/products").status_code == 200
+        assert client.get("/api/c/products").status_code == 429
+    
+    def test_suspicious_body_is_rejected(self):
+        """Test JSON bodies are scanned and normal ones pass through"""
+        client = TestClient(build_app())
+        
+        response = client.post("/notes", json={"notes": "<script>alert(1)</script>"})
+        assert response.status_code == 400
+        assert response.json()["error"] == "Invalid input detected"
+        
+        response = client.post("/notes", json={"notes": "sin condimento=extra, sin cebolla"})
+        assert response.status_code == 200
+
+@pytest.mark.asyncio
+class TestInputScanner:
+    """Test suite for the streamed body scanner"""
+    
+    async def run(self, middleware, chunks, content_type=b"application/json", path="/", state=None):
+        messages = [
+            {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+            for i, chunk in enumerate(chunks)
+        ]
+        sent = []
+        received = []
+        
+        async def app(scope, receive, send):
+            while True:
+                message = await receive()
+                if message["type"] != "http.request":
+                    raise RuntimeError("client disconnected")
+                received.append(message["body"])
+                if not message["more_body"]:
+                    break
+            if state is not None:
+                # What RequestLoggingMiddleware sees when the response starts
+                state.update(scope["state"])
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+        
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+        
+        async def send(message):
+            sent.append(message)
+        
+        scope = {
+            "type": "http", "method": "POST", "path": path, "query_string": b"",
+            "headers": [(b"content-type", content_type)], "client": ("127.0.0.1", 1)
+        }
+        await middleware(app)(scope, receive, send)
+        return sent[0]["status"], received
+    
+    async def test_pattern_split_across_chunks(self):
+        """Test a match spanning two chunks is detected"""
+        metrics = InputScanMetrics()
+        middleware = lambda app: InputValidationMiddleware(app, metrics=metrics)
+        
+        status, _ = await self.run(middleware, [b'{"a": "<scr', b'ipt>x</script>"}'])
+        
+        assert status == 400
+        assert metrics.stats()["blocked"] == 1
+    
+    async def test_byte_limit_and_binary_bodies(self):
+        """Test scanning stops at the byte limit and skips non-text bodies"""
+        metrics = InputScanMetrics()
+        middleware = lambda app: InputValidationMiddleware(app, max_body_bytes=16, metrics=metrics)
+        
+        status, received = await self.run(middleware, [b"x" * 16, b"<script>x</script>"])
+        assert status == 200
+        assert received == [b"x" * 16, b"<script>x</script>"]
+        assert metrics.stats()["bytes_scanned"] == 16
+        
+        status, _ = await self.run(middleware, [b"<script>x</script>"], b"application/octet-stream")
+        assert status == 200
+    
+    async def test_scan_time_is_visible_to_inner_middleware(self):
+        """Test input_scan_us is set while the app runs, in time for the request log line"""
+        middleware = lambda app: InputValidationMiddleware(app, metrics=InputScanMetrics())
+        state = {}
+        
+        status, _ = await self.run(middleware, [b'{"a": 1}', b'{"b": 2}'], state=state)
+        
+        assert status == 200
+        assert state["input_scan_us"] > 0
+    
+    async def test_import_body_is_not_scanned(self):
+        """Test bulk imports are left to the importer's per-row check"""
+        metrics = InputScanMetrics()
+        middleware = lambda app: InputValidationMiddleware(app, metrics=metrics)
+        chunks = [b"name,description\n", b"A,<script>x</script>\n"]
+        
+        status, received = await self.run(middleware, chunks, b"text/csv", path="/api/duo-previa/products/import")
+        
+        assert status == 200 and received == chunks
+        assert metrics.stats()["bytes_scanned"] == 0
@@ -0,0 +1,239 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+from utils.pagination import (
+    InvalidCursor, decode_cursor, encode_cursor, keyset_filter, next_cursor, page_size
+)
+
+ORDER_SORT = (("created_at", -1), ("_id", -1))
+NAME_SORT = (("name", 1), ("_id", 1))
+
+def matches(document, query):
+    """Minimal evaluator for the operators keyset_filter emits"""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(document, branch) for branch in condition):
+                return False
+            continue
+        value = document[field]
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for op, bound in condition.items():
+            if not {"$gt": value > bound, "$gte": value >= bound, "$lt": value < bound, "$lte": value <= bound}[op]:
+                return False
+    return True
+
+def paginate(documents, sort, size, kind="test"):
+    """Walk every page the way a client following next_cursor would"""
+    def key(document):
+        return tuple(document[field] if direction == 1 else _Reverse(document[field]) for field, direction in sort)
+
+    ordered = sorted(documents, key=key)
+    pages, cursor = [], None
+    while True:
+        candidates = ordered
+        if cursor:
+            query = keyset_filter(sort, decode_cursor(kind, cursor, sort))
+            candidates = [document for document in ordered if matches(document, query)]
+        fetched = candidates[:size + 1]
+        pages.append(fetched[:size])
+        cursor = next_cursor(kind, sort, fetched, size)
+        if cursor is None:
+            return ordered, pages
+
+class _Reverse:
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+class TestCursor:
+    """Test suite for opaque keyset cursors"""
+
+    def test_round_trip_keeps_types(self):
+        """Test datetimes and ObjectIds survive encoding"""
+        created_at = datetime(2024, 5, 1, 12, 30, 15, 123000)
+        object_id = ObjectId()
+
+        cursor = encode_cursor("orders", [created_at, object_id])
+
+        assert "=" not in cursor
+        assert decode_cursor("orders", cursor, ORDER_SORT) == [created_at, object_id]
+
+    def test_foreign_or_malformed_cursor_is_rejected(self):
+        """Test cursors from another listing or garbage raise InvalidCursor"""
+        cursor = encode_cursor("products", ["Pizza", ObjectId()])
+
+        with pytest.raises(InvalidCursor):
+            decode_cursor("orders", cursor, ORDER_SORT)
+        with pytest.raises(InvalidCursor):
+            decode_cursor("orders", "not-a-cursor!", ORDER_SORT)
+        with pytest.raises(InvalidCursor):
+            decode_cursor("orders", encode_cursor("orders", [1]), ORDER_SORT)
+
+    def test_operator_values_are_rejected(self):
+        """Test decoded values that are not plain sort keys never reach the filter"""
+        for values in (
+            [{"$ne": None}, ObjectId()],
+            [datetime(2024, 5, 1), {"$gt": ""}],
+            [["a"], ObjectId()],
+            [True, ObjectId()],
+            [datetime(2024, 5, 1), "not-an-object-id"],
+        ):
+            with pytest.raises(InvalidCursor):
+                decode_cursor("orders", encode_cursor("orders", values), ORDER_SORT)
+
+        object_id = ObjectId()
+        assert decode_cursor("products", encode_cursor("products", [None, str(object_id)]), NAME_SORT) == [None, object_id]
+
+    def test_page_size_is_capped(self):
+        """Test requested sizes are clamped to 1..maximum"""
+        assert page_size(None, 50, 100) == 50
+        assert page_size(1000, 50, 100) == 100
+        assert page_size(0, 50, 100) == 1
+
+class TestKeysetFilter:
+    """Test suite for keyset page boundaries"""
+
+    def test_filter_has_seekable_leading_bound(self):
+        """Test the leading sort field gets a plain range bound besides the $or"""
+        created_at, object_id = datetime(2024, 1, 1), ObjectId()
+
+        query = keyset_filter(ORDER_SORT, [created_at, object_id])
+
+        assert query["created_at"] == {"$lte": created_at}
+        assert query["$or"] == [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": object_id}}
+        ]
+
+    def test_descending_pages_cover_everything_once(self):
+        """Test ties on created_at are split by _id without gaps or repeats"""
+        base = datetime(2024, 1, 1)
+        # Several orders per timestamp to exercise the tie-breaker
+        orders = [{"created_at": base + timedelta(minutes=i // 3), "_id": ObjectId()} for i in range(47)]
+
+        ordered, pages = paginate(orders, ORDER_SORT, 10)
+
+        assert [len(page) for page in pages] == [10, 10, 10, 10, 7]
+        assert [document["_id"] for page in pages for document in page] == [document["_id"] for document in ordered]
+
+    def test_ascending_pages_by_name(self):
+        """Test (name, _id) pages with duplicate names"""
+        products = [{"name": f"Pizza {i % 4}", "_id": ObjectId()} for i in range(12)]
+
+        ordered, pages = paginate(products, NAME_SORT, 5)
+
+        assert [len(page) for page in pages] == [5, 5, 2]
+        assert [document["_id"] for page in pages for document in page] == [document["_id"] for document in ordered]
+
+    def test_exact_page_has_no_next_cursor(self):
+        """Test a final page that is exactly full does not announce another"""
+        products = [{"name": f"Pizza {i}", "_id": ObjectId()} for i in range(10)]
+
+        _, pages = paginate(products, NAME_SORT, 5)
+
+        assert [len(page) for page in pages] == [5, 5]
+
+class TestOrderPages:
+    """Test suite for paginated order listings"""
+
+    def order(self, minutes):
+        return {
+            "_id": ObjectId(), "order_number": f"ORD-{minutes}", "restaurant_slug": "duo-previa",
+            "customer": {"name": "Ana", "phone": "3510000000"}, "items": [],
+            "subtotal": 10.0, "delivery_fee": 0.0, "total": 10.0, "status": "pending",
+            "payment_method": "cash", "is_delivery": False, "estimated_delivery_time": None,
+            "actual_delivery_time": None, "notes": None,
+            "created_at": datetime(2024, 1, 1) + timedelta(minutes=minutes),
+            "updated_at": datetime(2024, 1, 1)
+        }
+
+    async def test_page_query_and_cursor(self):
+        """Test the service fetches size + 1, sorts by the keyset and returns a cursor"""
+        from services.orders import OrderService
+
+        documents = [self.order(minutes) for minutes in (5, 4, 3)]
+        cursor = MagicMock()
+        cursor.sort.return_value = cursor
+        cursor.limit.return_value = cursor
+        cursor.to_list = AsyncMock(return_value=documents)
+        collection = MagicMock()
+        collection.find = MagicMock(return_value=cursor)
+
+        with patch("services.orders.get_collection", return_value=collection):
+            service = OrderService()
+            page = await service.get_orders_by_restaurant("duo-previa", limit=2)
+            assert [order.order_number for order in page.items] == ["ORD-5", "ORD-4"]
+            assert decode_cursor("orders", page.next_cursor, ORDER_SORT) == [documents[1]["created_at"], documents[1]["_id"]]
+            cursor.sort.assert_called_with([("created_at", -1), ("_id", -1)])
+            cursor.limit.assert_called_with(3)
+
+            await service.get_orders_by_restaurant("duo-previa", limit=2, cursor=page.next_cursor)
+            query = collection.find.call_args[0][0]
+            assert query["restaurant_slug"] == "duo-previa"
+            assert query["created_at"] == {"$lte": documents[1]["created_at"]}
+
+    async def test_invalid_cursor_propagates(self):
+        """Test a bad cursor is not swallowed as an empty page"""
+        from services.orders import OrderService
+
+        with patch("services.orders.get_collection", return_value=MagicMock()):
+            service = OrderService()
+            with pytest.raises(InvalidCursor):
+                await service.get_orders_by_restaurant("duo-previa", cursor="garbage")
+
+class TestUnpagedListings:
+    """Test suite for listings whose clients don't follow X-Next-Cursor"""
+
+    def collection(self, documents):
+        cursor = MagicMock()
+        cursor.sort.return_value = cursor
+        cursor.limit.return_value = cursor
+        cursor.to_list = AsyncMock(return_value=documents)
+        collection = MagicMock()
+        collection.find = MagicMock(return_value=cursor)
+        return collection, cursor
+
+    async def test_menu_without_limit_returns_every_product(self):
+        """Test a menu larger than PRODUCTS_PAGE_MAX is not cut at the first page"""
+        from services.products import ProductService
+
+        documents = [
+            {"_id": ObjectId(), "name": f"Producto {i:04d}", "price": 10.0, "category_id": ObjectId()}
+            for i in range(2000)
+        ]
+        collection, cursor = self.collection(documents)
+        fields = frozenset({"id", "name"})
+
+        with patch("services.products.get_collection", return_value=collection):
+            service = ProductService()
+            page = await service.get_products_by_restaurant("duo-previa", fields=fields)
+            assert len(page.items) == 2000 and page.next_cursor is None
+            cursor.limit.assert_not_called()
+            cursor.to_list.assert_awaited_with(length=None)
+
+            cursor.to_list.return_value = documents[:3]
+            page = await service.get_products_by_restaurant("duo-previa", limit=2, fields=fields)
+            assert len(page.items) == 2 and page.next_cursor
+            cursor.limit.assert_called_with(3)
+
+    async def test_superadmin_list_without_limit_returns_every_restaurant(self):
+        """Test the restaurant list is only paged when asked to"""
+        from services.restaurants import RestaurantService
+
+        documents = [{"_id": ObjectId(), "name": f"R{i}", "created_at": datetime(2024, 1, 1)} for i in range(60)]
+        collection, cursor = self.collection(documents)
+
+        with patch("services.restaurants.get_collection", return_value=collection):
+            page = await RestaurantService().get_all_restaurants(fields=frozenset({"id", "name"}))
+
+        assert len(page.items) == 60 and page.next_cursor is None
+        cursor.limit.assert_not_called()
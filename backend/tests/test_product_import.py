@@ -0,0 +1,209 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from services.product_import import (
+    ImportFormatError, ProductImporter, RestaurantNotFound, detect_format, parse_rows
+)
+
+async def stream(data: bytes, size: int = 7):
+    """Deliver `data` in small chunks to exercise records split across reads"""
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+async def collect(rows):
+    return [row async for row in rows]
+
+CSV = (
+    "name,description,price,category,allergens,is_vegan\n"
+    "Muzzarella,\"Salsa, queso\ny orégano\",1200,Pizzas,gluten|lactosa,\n"
+    "Ñoquis,Caseros,950.5,Pastas,,true\n"
+).encode("utf-8")
+
+class TestParsers:
+    """Test suite for streaming CSV/JSON parsing"""
+
+    async def test_csv_rows_across_chunks(self):
+        """Test quoted commas and newlines survive chunk boundaries and UTF-8 is decoded"""
+        rows = await collect(parse_rows("csv", stream(b"\xef\xbb\xbf" + CSV)))
+
+        assert [row["name"] for row in rows] == ["Muzzarella", "Ñoquis"]
+        assert rows[0]["description"] == "Salsa, queso\ny orégano"
+        assert rows[1]["price"] == "950.5"
+
+    async def test_json_array_and_ndjson(self):
+        """Test both JSON layouts yield one item per product"""
+        array = b'[{"name": "A", "price": 1}, {"name": "B", "price": 2}]'
+        ndjson = b'{"name": "A", "price": 1}\n{"name": "B", "price": 2}\n'
+
+        assert [item["name"] for item in await collect(parse_rows("json", stream(array)))] == ["A", "B"]
+        assert [item["name"] for item in await collect(parse_rows("json", stream(ndjson)))] == ["A", "B"]
+
+    async def test_malformed_input_raises_after_good_rows(self):
+        """Test rows before the malformed part are yielded before the error"""
+        rows = parse_rows("json", stream(b'[{"name": "A"}, {"name": '))
+
+        assert (await rows.__anext__())["name"] == "A"
+        with pytest.raises(ImportFormatError):
+            await rows.__anext__()
+        with pytest.raises(ImportFormatError):
+            await collect(parse_rows("csv", stream(b'name\n"unterminated\n')))
+
+    async def test_non_utf8_input_is_a_format_error(self):
+        """Test a Latin-1 export fails as a format error after the rows decoded so far"""
+        utf8 = "name,price\nMuzza,1\n".encode("utf-8")
+        rows = parse_rows("csv", stream(utf8 + "Ñoquis,2\n".encode("latin-1"), size=len(utf8)))
+
+        assert (await rows.__anext__())["name"] == "Muzza"
+        with pytest.raises(ImportFormatError):
+            await rows.__anext__()
+        with pytest.raises(ImportFormatError):
+            await collect(parse_rows("json", stream('[{"name": "Ñoquis"}]'.encode("latin-1"))))
+
+    async def test_unterminated_csv_quote_is_bounded(self):
+        """Test an open quote stops the import once the pending record exceeds the cap"""
+        async def endless():
+            yield b'name,description\nA,"open\n'
+            while True:
+                yield b"x" * 65536 + b"\n"
+
+        with pytest.raises(ImportFormatError):
+            await collect(parse_rows("csv", endless()))
+
+    async def test_csv_records_split_anywhere(self):
+        """Test quote parity carries across chunks of every size"""
+        for size in (1, 2, 3, 5, 64):
+            rows = await collect(parse_rows("csv", stream(CSV + b'"Fug""azza",\"x\ny\",1,P,,\n', size)))
+            assert [row["name"] for row in rows] == ["Muzzarella", "Ñoquis", 'Fug"azza']
+            assert rows[2]["description"] == "x\ny"
+
+    def test_format_detection(self):
+        """Test the format comes from the content type or file name"""
+        assert detect_format("text/csv; charset=utf-8") == "csv"
+        assert detect_format("application/x-ndjson") == "json"
+        assert detect_format(filename="menu.JSON") == "json"
+        with pytest.raises(ImportFormatError):
+            detect_format("application/xml")
+
+class TestProductImporter:
+    """Test suite for batched product imports"""
+
+    def importer(self, categories=(), bulk_write=None, batch_size=500):
+        products, category_collection = MagicMock(), MagicMock()
+        products.bulk_write = bulk_write or AsyncMock(
+            side_effect=lambda operations, ordered: SimpleNamespace(inserted_count=len(operations))
+        )
+
+        async def existing():
+            for category in categories:
+                yield category
+
+        cursor = MagicMock()
+        cursor.sort.return_value = existing()
+        category_collection.find = MagicMock(return_value=cursor)
+        category_collection.insert_many = AsyncMock(
+            side_effect=lambda documents: SimpleNamespace(inserted_ids=[ObjectId() for _ in documents])
+        )
+        with patch("services.product_import.get_collection",
+                   side_effect=lambda name: products if name == "products" else category_collection):
+            importer = ProductImporter(batch_size=batch_size)
+        return importer, products, category_collection
+
+    async def run(self, importer, rows, **kwargs):
+        restaurant = SimpleNamespace(id=str(ObjectId()))
+        with patch("services.restaurants.restaurant_cache") as cache, \
+             patch("services.products.product_search") as search:
+            cache.get = AsyncMock(return_value=restaurant)
+            report = await importer.run("duo-previa", rows, **kwargs)
+        return report, search
+
+    async def test_categories_resolved_once_and_created(self):
+        """Test names match existing categories ignoring accents/case and new ones are inserted together"""
+        pizzas = ObjectId()
+        importer, products, categories = self.importer(
+            categories=[{"_id": pizzas, "name": "Pizzas", "display_order": 3}]
+        )
+
+        report, search = await self.run(importer, parse_rows("csv", stream(CSV)))
+
+        assert report["inserted"] == 2 and report["failed"] == 0
+        assert report["categories_created"] == 1
+        categories.find.assert_called_once()
+        created = categories.insert_many.call_args[0][0]
+        assert [(doc["name"], doc["display_order"]) for doc in created] == [("Pastas", 4)]
+        operations = products.bulk_write.call_args[0][0]
+        first, second = (operation._doc for operation in operations)
+        assert first["category_id"] == pizzas and first["allergens"] == ["gluten", "lactosa"]
+        assert second["is_vegan"] is True and second["restaurant_slug"] == "duo-previa"
+        assert products.bulk_write.call_args.kwargs == {"ordered": False}
+        search.invalidate.assert_called_once_with("duo-previa")
+
+    async def test_rows_are_written_in_batches(self):
+        """Test one unordered bulk_write per batch"""
+        category_id = ObjectId()
+        importer, products, _ = self.importer(
+            categories=[{"_id": category_id, "name": "Pizzas", "display_order": 0}], batch_size=2
+        )
+        rows = stream(b"".join(
+            b'{"name": "P%d", "description": "", "price": 10, "category_id": "%s"}\n' % (i, str(category_id).encode())
+            for i in range(5)
+        ))
+
+        report, _ = await self.run(importer, parse_rows("json", rows))
+
+        assert report["inserted"] == 5
+        assert [len(call.args[0]) for call in products.bulk_write.call_args_list] == [2, 2, 1]
+
+    async def test_per_row_errors(self):
+        """Test invalid rows, foreign category ids and write errors are reported by row"""
+        error = BulkWriteError({"nInserted": 1, "writeErrors": [{"index": 1, "errmsg": "duplicate"}]})
+        importer, _, categories = self.importer(bulk_write=AsyncMock(side_effect=error))
+        rows = stream(
+            b'[{"name": "A", "description": "", "price": "abc", "category": "Pizzas"},'
+            b' {"name": "B", "description": "", "price": 1, "category_id": "%s"},'
+            b' {"name": "C", "description": "", "price": 1, "category": "Pizzas"},'
+            b' {"name": "D", "description": "", "price": 1, "category": "pizzas"}]' % str(ObjectId()).encode()
+        )
+
+        report, _ = await self.run(importer, parse_rows("json", rows))
+
+        assert report["inserted"] == 1 and report["failed"] == 3
+        assert [error["row"] for error in report["errors"]] == [1, 2, 4]
+        assert report["errors"][0]["error"].startswith("price")
+        assert categories.insert_many.call_count == 1
+
+    async def test_unknown_category_without_creation(self):
+        """Test create_categories=False rejects rows for missing categories"""
+        importer, products, categories = self.importer()
+        rows = stream(b'{"name": "A", "description": "", "price": 1, "category": "Postres"}')
+
+        report, _ = await self.run(importer, parse_rows("json", rows), create_categories=False)
+
+        assert report["failed"] == 1 and report["inserted"] == 0
+        categories.insert_many.assert_not_called()
+        products.bulk_write.assert_not_called()
+
+    async def test_suspicious_rows_are_rejected(self):
+        """Test rows are checked with the request scanner's patterns since imports skip it"""
+        importer, products, _ = self.importer(categories=[{"_id": ObjectId(), "name": "Pizzas", "display_order": 0}])
+        rows = stream(
+            b'{"name": "A", "description": "<script>alert(1)</script>", "price": 1, "category": "Pizzas"}\n'
+            b'{"name": "B", "description": "sin condimento=extra", "price": 1, "category": "Pizzas"}\n'
+        )
+
+        report, _ = await self.run(importer, parse_rows("json", rows))
+
+        assert report["inserted"] == 1
+        assert report["errors"] == [{"row": 1, "error": "Row contains suspicious content"}]
+        assert len(products.bulk_write.call_args[0][0]) == 1
+
+    async def test_unknown_restaurant(self):
+        """Test a missing tenant raises RestaurantNotFound rather than a ValueError"""
+        importer, products, _ = self.importer()
+
+        with patch("services.restaurants.restaurant_cache") as cache:
+            cache.get = AsyncMock(return_value=None)
+            with pytest.raises(RestaurantNotFound):
+                await importer.run("nope", parse_rows("json", stream(b"[]")))
+        assert not issubclass(RestaurantNotFound, ValueError)
@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from db.profiler import QueryProfiler, query_shape, summarize_plan
+
+def started(command_name, command, request_id=1):
+    return SimpleNamespace(
+        command_name=command_name, command=command,
+        connection_id=("localhost", 27017), request_id=request_id
+    )
+
+def finished(command_name, duration_ms, request_id=1):
+    return SimpleNamespace(
+        command_name=command_name, duration_micros=int(duration_ms * 1000),
+        connection_id=("localhost", 27017), request_id=request_id
+    )
+
+def run_command(profiler, command_name, command, duration_ms=1.0, request_id=1):
+    profiler.started(started(command_name, command, request_id))
+    profiler.succeeded(finished(command_name, duration_ms, request_id))
+
+class TestQueryShape:
+    """Test suite for query shape normalisation"""
+    
+    def test_literals_are_replaced(self):
+        """Test values are stripped but operators and nesting kept"""
+        shape = query_shape({
+            "restaurant_slug": "duo-previa",
+            "created_at": {"$gte": 1, "$lte": 2},
+            "status": {"$in": ["pending", "confirmed"]},
+            "$or": [{"name": "x"}, {"sku": "y"}]
+        })
+        
+        assert shape == {
+            "restaurant_slug": "?",
+            "created_at": {"$gte": "?", "$lte": "?"},
+            "status": {"$in": ["?"]},
+            "$or": [{"name": "?"}, {"sku": "?"}]
+        }
+    
+    def test_summarize_plan(self):
+        """Test the winning plan is reduced to its stage chain"""
+        explain = {"queryPlanner": {"winningPlan": {
+            "stage": "FETCH",
+            "inputStage": {"stage": "IXSCAN", "indexName": "restaurant_slug_1"}
+        }}}
+        
+        assert summarize_plan(explain) == "FETCH <- IXSCAN(restaurant_slug_1)"
+
+class TestQueryProfiler:
+    """Test suite for the MongoDB command listener"""
+    
+    def test_latency_per_collection_and_command(self):
+        """Test commands are aggregated per (collection, command)"""
+        profiler = QueryProfiler(slow_ms=1000)
+        run_command(profiler, "find", {"find": "products", "filter": {}}, 2.0)
+        run_command(profiler, "find", {"find": "products", "filter": {}}, 4.0)
+        run_command(profiler, "insert", {"insert": "orders", "documents": []}, 1.0)
+        run_command(profiler, "ping", {"ping": 1})
+        
+        operations = {(op["collection"], op["command"]): op for op in profiler.stats()["operations"]}
+        assert operations[("products", "find")]["count"] == 2
+        assert operations[("products", "find")]["avg_ms"] == 3.0
+        assert operations[("orders", "insert")]["count"] == 1
+        assert len(operations) == 2
+    
+    def test_queries_counted_per_request(self):
+        """Test commands are attributed to the request in context"""
+        profiler = QueryProfiler(slow_ms=1000, request_budget=10)
+        queries = profiler.begin_request("corr-1")
+        run_command(profiler, "find", {"find": "restaurants", "filter": {"slug": "x"}})
+        run_command(profiler, "insert", {"insert": "orders", "documents": []}, request_id=2)
+        
+        assert queries.total == 2
+        assert not profiler.end_request(queries, "POST", "/api/{slug}/orders")
+    
+    def test_repeated_operations_are_flagged(self):
+        """Test N+1 patterns flag the request"""
+        profiler = QueryProfiler(slow_ms=1000, request_budget=10, repeat_threshold=5)
+        queries = profiler.begin_request("corr-2")
+        for i in range(6):
+            run_command(profiler, "find", {"find": "categories", "filter": {"_id": i}}, request_id=i)
+        
+        assert profiler.end_request(queries, "GET", "/api/{slug}/products")
+        flagged = profiler.stats()["flagged_requests"][0]
+        assert flagged["correlation_id"] == "corr-2"
+        assert flagged["by_operation"] == {"find categories": 6}
+    
+    async def test_slow_query_captures_shape_and_plan(self):
+        """Test slow queries record their shape and get explained once per shape"""
+        profiler = QueryProfiler(slow_ms=50)
+        database = AsyncMock()
+        database.command.return_value = {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+        profiler.attach(database, asyncio.get_running_loop())
+        
+        command = {"find": "orders", "filter": {"customer.phone": "555"}, "lsid": {"id": 1}, "$db": "test"}
+        run_command(profiler, "find", command, 120.0)
+        run_command(profiler, "find", {**command, "filter": {"customer.phone": "777"}}, 90.0, request_id=2)
+        await asyncio.sleep(0.01)
+        
+        slow = profiler.stats()["slow_queries"]
+        assert len(slow) == 2
+        assert slow[0]["shape"] == {"filter": {"customer.phone": "?"}}
+        assert slow[0]["plan"] == "COLLSCAN"
+        database.command.assert_awaited_once_with(
+            "explain", {"find": "orders", "filter": {"customer.phone": "555"}}, verbosity="queryPlanner"
+        )
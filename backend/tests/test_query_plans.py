@@ -0,0 +1,412 @@
+"""
+Query-plan regression suite.
+
+Every service method that reads or writes MongoDB must appear in SCENARIOS
+(or FULL_SCANS, with a reason). The static check runs everywhere; the plan
+checks need a disposable mongod: set MONGODB_TEST_URL, e.g.
+
+    MONGODB_TEST_URL=mongodb://localhost:27017 pytest tests/test_query_plans.py
+"""
+import os
+import ast
+import copy
+import pytest
+from functools import partial
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Awaitable, Callable, NamedTuple, Tuple
+from pymongo import MongoClient, monitoring
+from db.indexes import INDEX_MANIFEST
+from db.profiler import EXPLAINABLE_COMMANDS, _NON_EXPLAIN_FIELDS
+
+SERVICES_DIR = Path(__file__).resolve().parent.parent / "services"
+SERVICE_MODULES = ("products", "product_import", "orders", "categories", "auth", "restaurants", "api_keys")
+QUERY_METHODS = frozenset({
+    "find", "find_one", "aggregate", "count_documents", "distinct",
+    "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "find_one_and_update", "find_one_and_delete", "find_one_and_replace"
+})
+
+TEST_DB_NAME = "duo_previa_query_plans"
+RESTAURANTS = 10
+CATEGORIES_PER_RESTAURANT = 6
+PRODUCTS_PER_CATEGORY = 20
+PRODUCTS_PER_RESTAURANT = CATEGORIES_PER_RESTAURANT * PRODUCTS_PER_CATEGORY
+ORDERS_PER_RESTAURANT = 500
+USERS_PER_RESTAURANT = 3
+API_KEYS_PER_RESTAURANT = 3
+PASSWORD = "secret123"
+
+INDEX_STAGES = frozenset({
+    "IXSCAN", "IDHACK", "COUNT_SCAN", "DISTINCT_SCAN",
+    "EXPRESS_IXSCAN", "EXPRESS_CLUSTERED_IXSCAN", "EXPRESS_UPDATE", "EXPRESS_DELETE"
+})
+
+# Queries that read a whole collection on purpose
+FULL_SCANS = {
+    "api_keys.APIKeyService.refresh_index": "loads every active key into the in-memory index",
+}
+
+def service_query_methods():
+    """module.Class.method for every method that issues a query"""
+    found = set()
+    for module in SERVICE_MODULES:
+        tree = ast.parse((SERVICES_DIR / f"{module}.py").read_text(encoding="utf-8"))
+        for cls in (node for node in tree.body if isinstance(node, ast.ClassDef)):
+            for method in cls.body:
+                if not isinstance(method, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    continue
+                if any(
+                    isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                    and node.func.attr in QUERY_METHODS
+                    for node in ast.walk(method)
+                ):
+                    found.add(f"{module}.{cls.name}.{method.name}")
+    return found
+
+# ---- scenarios ----
+
+class Scenario(NamedTuple):
+    name: str
+    covers: Tuple[str, ...]
+    run: Callable[[SimpleNamespace], Awaitable]
+    max_keys: int  # per command, for both keys and documents examined
+
+def _product_update():
+    from models import ProductUpdate
+    return ProductUpdate(price=999.0)
+
+def _category_update():
+    from models import CategoryUpdate
+    return CategoryUpdate(display_order=99)
+
+def _product_patch(ctx):
+    from models import ProductPatch
+    return [ProductPatch(product_id=ctx.product_id, is_available=True)]
+
+def _price_adjustment(ctx):
+    from models import CategoryPriceAdjustment
+    return [CategoryPriceAdjustment(category_id=ctx.category_id, percent=10)]
+
+def _category_order(ctx):
+    from models import CategoryOrder
+    return [CategoryOrder(category_id=ctx.category_id, display_order=0)]
+
+def _restaurant_update():
+    from models import RestaurantUpdate
+    return RestaurantUpdate(phone="+54 351 000 0000")
+
+def _restaurant_create():
+    from models import RestaurantCreate
+    return RestaurantCreate(
+        name="Nuevo", slug="nuevo-plan", email="nuevo-plan@example.com", phone="+54 351 000 0001",
+        address="Calle 1", admin_username="admin", admin_password=PASSWORD
+    )
+
+async def _incremental_epoch_refresh(ctx):
+    from services.auth import TokenEpochTable
+    table = TokenEpochTable()
+    table.last_refresh = datetime.utcnow()
+    await table.refresh(ctx.auth.users_collection)
+
+async def _verify_token(ctx):
+    from services.auth import invalidate_principal
+    invalidate_principal("user-0", ctx.slug)
+    await ctx.auth.verify_token(ctx.auth.create_access_token({"sub": "user-0", "restaurant_slug": ctx.slug}))
+
+async def _refresh_token(ctx):
+    token = ctx.auth.create_refresh_token({"sub": "user-1", "restaurant_slug": ctx.slug, "epoch": 0})
+    await ctx.auth.refresh_access_token(token)
+
+def _second_page(listing, **params):
+    """Scenario for the page after the first: only the keyset query is checked"""
+    async def run(ctx):
+        page = await listing(ctx)(limit=20, **params)
+        ctx.recorder.commands.clear()
+        await listing(ctx)(limit=20, cursor=page.next_cursor, **params)
+    return run
+
+SCENARIOS = [
+    # products
+    Scenario("menu", ("products.ProductService.get_products_by_restaurant",),
+             lambda ctx: ctx.products.get_products_by_restaurant(ctx.slug), PRODUCTS_PER_RESTAURANT + 1),
+    Scenario("menu by category", ("products.ProductService.get_products_by_restaurant",),
+             lambda ctx: ctx.products.get_products_by_restaurant(ctx.slug, category_id=ctx.category_id),
+             PRODUCTS_PER_CATEGORY + 1),
+    Scenario("popular products", ("products.ProductService.get_products_by_restaurant",),
+             lambda ctx: ctx.products.get_products_by_restaurant(ctx.slug, popular_only=True),
+             PRODUCTS_PER_RESTAURANT + 1),
+    Scenario("menu page 2", ("products.ProductService.get_products_by_restaurant",),
+             _second_page(lambda ctx: partial(ctx.products.get_products_by_restaurant, ctx.slug)), 22),
+    Scenario("product search", ("products.ProductService._search", "products.ProductSearch.index_for"),
+             lambda ctx: ctx.products.get_products_by_restaurant(ctx.slug, search="product 00"),
+             PRODUCTS_PER_RESTAURANT + 1),
+    Scenario("product by id", ("products.ProductService.get_product_by_id",),
+             lambda ctx: ctx.products.get_product_by_id(ctx.product_id, ctx.slug), 1),
+    Scenario("update product", ("products.ProductService.update_product",),
+             lambda ctx: ctx.products.update_product(ctx.product_id, _product_update(), ctx.slug), 1),
+    Scenario("delete product", ("products.ProductService.delete_product",),
+             lambda ctx: ctx.products.delete_product(ctx.deletable_product_id, ctx.slug), 1),
+    # One kind of change per scenario: explain takes a single update statement
+    Scenario("bulk product patch", ("products.ProductService.bulk_update",),
+             lambda ctx: ctx.products.bulk_update(ctx.slug, _product_patch(ctx), []), 1),
+    Scenario("bulk price adjustment", ("products.ProductService.bulk_update",),
+             lambda ctx: ctx.products.bulk_update(ctx.slug, [], _price_adjustment(ctx)), PRODUCTS_PER_CATEGORY + 1),
+    Scenario("import categories", ("product_import.ProductImporter._load_categories",),
+             lambda ctx: ctx.importer._load_categories(ctx.slug), CATEGORIES_PER_RESTAURANT + 1),
+    # orders
+    Scenario("order list", ("orders.OrderService.get_orders_by_restaurant",),
+             lambda ctx: ctx.orders.get_orders_by_restaurant(ctx.slug), 51),
+    Scenario("order list by status", ("orders.OrderService.get_orders_by_restaurant",),
+             lambda ctx: ctx.orders.get_orders_by_restaurant(ctx.slug, status_filter="pending"), 51),
+    Scenario("order list page 2", ("orders.OrderService.get_orders_by_restaurant",),
+             _second_page(lambda ctx: partial(ctx.orders.get_orders_by_restaurant, ctx.slug)), 22),
+    Scenario("order list by status page 2", ("orders.OrderService.get_orders_by_restaurant",),
+             _second_page(lambda ctx: partial(ctx.orders.get_orders_by_restaurant, ctx.slug), status_filter="pending"), 22),
+    Scenario("order by id", ("orders.OrderService.get_order_by_id",),
+             lambda ctx: ctx.orders.get_order_by_id(ctx.order_id, ctx.slug), 1),
+    Scenario("order status", ("orders.OrderService.update_order_status",),
+             lambda ctx: ctx.orders.update_order_status(ctx.order_id, "confirmed", ctx.slug), 1),
+    Scenario("dashboard", ("orders.OrderService.get_dashboard_analytics",),
+             lambda ctx: ctx.orders.get_dashboard_analytics(ctx.slug), ORDERS_PER_RESTAURANT + 1),
+    # categories
+    Scenario("categories", ("categories.CategoryService.get_categories_by_restaurant",),
+             lambda ctx: ctx.categories.get_categories_by_restaurant(ctx.slug), CATEGORIES_PER_RESTAURANT + 1),
+    Scenario("update category", ("categories.CategoryService.update_category",),
+             lambda ctx: ctx.categories.update_category(ctx.category_id, _category_update()), 1),
+    Scenario("reorder categories", ("categories.CategoryService.tenant_category_ids",),
+             lambda ctx: ctx.categories.reorder_categories(ctx.slug, _category_order(ctx)), 1),
+    Scenario("delete category", ("categories.CategoryService.delete_category",),
+             lambda ctx: ctx.categories.delete_category(ctx.deletable_category_id), 1),
+    # auth
+    Scenario("login", ("auth.AuthService.authenticate_user",),
+             lambda ctx: ctx.auth.authenticate_user("user-0", PASSWORD, ctx.slug), 2),
+    Scenario("rehash", ("auth.AuthService._store_rehashed_password",),
+             lambda ctx: ctx.auth._store_rehashed_password(ctx.user_id, ctx.password_hash), 1),
+    Scenario("create user", ("auth.AuthService.create_user",),
+             lambda ctx: ctx.auth.create_user("user-new", PASSWORD, ctx.slug, role="staff"), 2),
+    Scenario("revoke tokens", ("auth.AuthService._revoke_tokens",),
+             lambda ctx: ctx.auth.update_user_role("user-2", ctx.slug, "staff"), 2),
+    Scenario("refresh token", ("auth.AuthService._refresh_access_token",), _refresh_token, 2),
+    Scenario("verify token", ("auth.AuthService.verify_token",), _verify_token, 2),
+    Scenario("epoch refresh", ("auth.TokenEpochTable.refresh",), _incremental_epoch_refresh, USERS_PER_RESTAURANT),
+    # restaurants
+    Scenario("create restaurant", ("restaurants.RestaurantService.create_restaurant",),
+             lambda ctx: ctx.restaurants.create_restaurant(_restaurant_create()), 2),
+    Scenario("restaurant by slug", ("restaurants.RestaurantCache._load",),
+             lambda ctx: ctx.restaurant_cache._load(ctx.slug), 2),
+    Scenario("restaurant cache warm-up", ("restaurants.RestaurantCache.warm_up",),
+             lambda ctx: ctx.restaurant_cache.warm_up(), RESTAURANTS + 1),
+    Scenario("update restaurant", ("restaurants.RestaurantService.update_restaurant",),
+             lambda ctx: ctx.restaurants.update_restaurant(ctx.slug, _restaurant_update()), 2),
+    Scenario("all restaurants", ("restaurants.RestaurantService.get_all_restaurants",),
+             lambda ctx: ctx.restaurants.get_all_restaurants(), RESTAURANTS + 2),
+    Scenario("restaurants page 2", ("restaurants.RestaurantService.get_all_restaurants",),
+             _second_page(lambda ctx: ctx.restaurants.get_all_restaurants), RESTAURANTS + 2),
+    # api keys
+    Scenario("api keys", ("api_keys.APIKeyService.get_api_keys_by_restaurant",),
+             lambda ctx: ctx.api_keys.get_api_keys_by_restaurant(ctx.slug), API_KEYS_PER_RESTAURANT + 1),
+    Scenario("revoke api key", ("api_keys.APIKeyService.revoke_api_key",),
+             lambda ctx: ctx.api_keys.revoke_api_key(ctx.slug, "prefix-0-0"), 2),
+]
+
+class TestQueryCoverage:
+    """Test suite for scenario coverage of service queries (no database needed)"""
+
+    def test_every_service_query_has_a_scenario(self):
+        """Test a new query cannot land without a plan check"""
+        covered = {name for scenario in SCENARIOS for name in scenario.covers} | set(FULL_SCANS)
+        missing = service_query_methods() - covered
+        assert not missing, f"Add a query-plan scenario for: {sorted(missing)}"
+
+    def test_scenarios_reference_existing_methods(self):
+        """Test scenarios are removed together with the methods they cover"""
+        covered = {name for scenario in SCENARIOS for name in scenario.covers} | set(FULL_SCANS)
+        assert covered <= service_query_methods()
+
+# ---- plan inspection ----
+
+def _stages(node, found=None):
+    """Every (stage, node) in a plan tree"""
+    found = [] if found is None else found
+    if isinstance(node, dict):
+        if "stage" in node:
+            found.append((node["stage"], node))
+        for value in node.values():
+            _stages(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            _stages(value, found)
+    return found
+
+def _winning_plan(explain):
+    planner = explain.get("queryPlanner")
+    stats = explain.get("executionStats", {})
+    for stage in explain.get("stages", []):
+        if "$cursor" in stage:
+            planner = stage["$cursor"].get("queryPlanner")
+            stats = stage["$cursor"].get("executionStats", {})
+            break
+    return (planner or {}).get("winningPlan", {}), stats
+
+def _blocking_sorts(plan):
+    """SORT stages over scanned documents; sorting $group output is fine"""
+    return [
+        node for stage, node in _stages(plan)
+        if stage == "SORT" and not any(inner == "GROUP" for inner, _ in _stages(node.get("inputStage", {})))
+    ]
+
+class CommandRecorder(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name in EXPLAINABLE_COMMANDS and event.database_name == TEST_DB_NAME:
+            self.commands.append((event.command_name, copy.deepcopy(dict(event.command))))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+@pytest.fixture(scope="module")
+def seeded_db():
+    url = os.getenv("MONGODB_TEST_URL")
+    if not url:
+        pytest.skip("MONGODB_TEST_URL not set")
+    client = MongoClient(url, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except Exception as e:
+        pytest.skip(f"mongod not reachable: {e}")
+
+    from services.auth import pwd_context
+
+    client.drop_database(TEST_DB_NAME)
+    db = client[TEST_DB_NAME]
+    for collection, models in INDEX_MANIFEST.items():
+        db[collection].create_indexes(models)
+
+    now = datetime.utcnow()
+    password_hash = pwd_context.hash(PASSWORD)
+    seed = {}
+    for r in range(RESTAURANTS):
+        slug = f"rest-{r}"
+        db.restaurants.insert_one({
+            "name": f"Restaurant {r}", "slug": slug, "description": None, "logo": "",
+            "email": f"rest-{r}@example.com", "phone": "+54 351 000 0000", "address": "Calle 1",
+            "city": "Córdoba", "country": "Argentina", "settings": {}, "is_active": True,
+            "created_at": now - timedelta(days=r), "updated_at": now - timedelta(days=r)
+        })
+        category_ids = db.categories.insert_many([
+            {"restaurant_slug": slug, "name": f"Category {c}", "icon": "", "description": None,
+             "display_order": c, "is_active": True, "created_at": now, "updated_at": now}
+            for c in range(CATEGORIES_PER_RESTAURANT)
+        ]).inserted_ids
+        product_ids = db.products.insert_many([
+            {"restaurant_slug": slug, "category_id": category_ids[p % CATEGORIES_PER_RESTAURANT],
+             "name": f"Product {p:03d}", "description": "", "price": 100.0 + p, "image": "",
+             "is_available": True, "is_popular": p % 10 == 0, "sizes": [], "toppings": [],
+             "created_at": now, "updated_at": now}
+            for p in range(PRODUCTS_PER_RESTAURANT)
+        ]).inserted_ids
+        order_ids = db.orders.insert_many([
+            {"order_number": f"{slug}-{o:05d}", "restaurant_slug": slug,
+             "customer": {"name": "Cliente", "phone": f"351{o:07d}"},
+             "items": [{"product_id": str(product_ids[o % PRODUCTS_PER_RESTAURANT]), "product_name": f"Product {o % 7}",
+                        "quantity": 1 + o % 3, "unit_price": 100.0, "total_price": 100.0 * (1 + o % 3)}],
+             "subtotal": 100.0, "delivery_fee": 0.0, "total": 100.0,
+             "status": ("pending", "confirmed", "preparing", "delivered", "cancelled")[o % 5],
+             "payment_method": "cash", "is_delivery": False, "estimated_delivery_time": None,
+             "actual_delivery_time": None, "notes": None,
+             "created_at": now - timedelta(hours=o * 1.5), "updated_at": now - timedelta(hours=o * 1.5)}
+            for o in range(ORDERS_PER_RESTAURANT)
+        ]).inserted_ids
+        user_ids = db.users.insert_many([
+            {"username": f"user-{u}", "password_hash": password_hash, "role": "admin",
+             "restaurant_slug": slug, "is_active": True, "token_epoch": 0,
+             "created_at": now - timedelta(days=30), "updated_at": now - timedelta(days=30)}
+            for u in range(USERS_PER_RESTAURANT)
+        ]).inserted_ids
+        db.api_keys.insert_many([
+            {"name": f"key {k}", "key_prefix": f"prefix-{r}-{k}", "key_hash": f"hash-{r}-{k}",
+             "restaurant_slug": slug, "permissions": ["read:menu"], "is_active": True,
+             "created_at": now - timedelta(days=k), "updated_at": now - timedelta(days=k)}
+            for k in range(API_KEYS_PER_RESTAURANT)
+        ])
+        if r == 0:
+            seed = {
+                "slug": slug,
+                "category_id": str(category_ids[0]),
+                "deletable_category_id": str(category_ids[-1]),
+                "product_id": str(product_ids[0]),
+                "deletable_product_id": str(product_ids[-1]),
+                "order_id": str(order_ids[0]),
+                "user_id": user_ids[0],
+                "password_hash": password_hash
+            }
+
+    yield client, db, seed
+    client.drop_database(TEST_DB_NAME)
+    client.close()
+
+@pytest.fixture
+async def plan_context(seeded_db):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from db.mongo import database
+    from services.products import ProductService
+    from services.product_import import ProductImporter
+    from services.orders import OrderService
+    from services.categories import CategoryService
+    from services.auth import AuthService
+    from services.restaurants import RestaurantService, RestaurantCache
+    from services.api_keys import APIKeyService
+
+    _, db, seed = seeded_db
+    recorder = CommandRecorder()
+    client = AsyncIOMotorClient(os.environ["MONGODB_TEST_URL"], event_listeners=[recorder])
+    previous = database.database
+    database.database = client[TEST_DB_NAME]
+    try:
+        yield SimpleNamespace(
+            db=db,
+            recorder=recorder,
+            products=ProductService(),
+            importer=ProductImporter(),
+            orders=OrderService(),
+            categories=CategoryService(),
+            auth=AuthService(),
+            restaurants=RestaurantService(),
+            restaurant_cache=RestaurantCache(),
+            api_keys=APIKeyService(),
+            **seed
+        )
+    finally:
+        database.database = previous
+        client.close()
+
+@pytest.mark.integration
+class TestQueryPlans:
+    """Test suite for the winning plans of every service query"""
+
+    @pytest.mark.parametrize("scenario", SCENARIOS, ids=[scenario.name for scenario in SCENARIOS])
+    async def test_query_uses_index(self, plan_context, scenario):
+        """Test each query is an index scan, sorts from the index and stays within its key budget"""
+        await scenario.run(plan_context)
+        commands = plan_context.recorder.commands
+        assert commands, f"{scenario.name} issued no explainable command"
+
+        for command_name, command in commands:
+            explain_command = {key: value for key, value in command.items() if key not in _NON_EXPLAIN_FIELDS}
+            explain = plan_context.db.command("explain", explain_command, verbosity="executionStats")
+            plan, stats = _winning_plan(explain)
+            stages = {stage for stage, _ in _stages(plan)}
+            description = f"{scenario.name}: {command_name} {command.get(command_name)} -> {sorted(stages)}"
+
+            assert "COLLSCAN" not in stages, description
+            assert stages & INDEX_STAGES, description
+            assert not _blocking_sorts(plan), description
+            assert stats.get("totalKeysExamined", 0) <= scenario.max_keys, description
+            assert stats.get("totalDocsExamined", 0) <= scenario.max_keys, description
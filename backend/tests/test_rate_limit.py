@@ -0,0 +1,182 @@
+import time
+import multiprocessing
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from pymongo.errors import AutoReconnect
+from middleware.rate_limit import (
+    InMemoryGCRAStore, SharedMemoryGCRAStore, MongoGCRAStore, RateLimit,
+    default_policies, get_tenant_slug
+)
+
+class TestGCRA:
+    """Test suite for the GCRA store"""
+    
+    def test_burst_then_steady_rate(self):
+        """Test a full burst is allowed, then one call per emission interval"""
+        store = InMemoryGCRAStore()
+        limit = RateLimit(calls=3, period=3.0)
+        
+        assert [store.hit("ip", limit, 100.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert store.hit("ip", limit, 100.0) == pytest.approx(1.0)
+        assert store.hit("ip", limit, 101.0) == 0.0
+        assert store.hit("ip", limit, 101.0) > 0
+    
+    def test_refund_returns_one_request(self):
+        """Test a refunded request can be made again, and refunds never bank credit"""
+        store = InMemoryGCRAStore()
+        limit = RateLimit(calls=2, period=2.0)
+        
+        store.hit("ip", limit, 100.0)
+        store.hit("ip", limit, 100.0)
+        store.refund("ip", limit, 100.0)
+        assert store.hit("ip", limit, 100.0) == 0.0
+        assert store.hit("ip", limit, 100.0) > 0
+        
+        store.refund("ip", limit, 100.0)
+        store.refund("ip", limit, 100.0)
+        store.refund("ip", limit, 100.0)
+        assert [store.hit("ip", limit, 100.0) for _ in range(3)][-1] > 0
+    
+    def test_idle_keys_are_evicted(self):
+        """Test drained keys are dropped and state stays one float per key"""
+        store = InMemoryGCRAStore()
+        limit = RateLimit(calls=10, period=10.0)
+        store.hit("a", limit, 0.0)
+        store.hit("b", limit, 5.0)
+        
+        assert store.evict_idle(5.5) == 1
+        assert len(store) == 1
+
+class TestRateLimitPolicies:
+    """Test suite for route-group policies"""
+    
+    def test_policy_matching(self):
+        """Test first matching route group wins"""
+        policies = default_policies(100, 3600)
+        
+        def match(method, path):
+            return next(p.name for p in policies if p.matches(method, path))
+        
+        assert match("POST", "/auth/login") == "auth"
+        assert match("POST", "/api/duo-previa/orders") == "order_create"
+        assert match("GET", "/api/duo-previa/products") == "public_menu"
+        assert match("PUT", "/api/duo-previa/products/1") == "api_write"
+        assert match("GET", "/superadmin/restaurants") == "admin"
+        assert match("GET", "/health") == "default"
+    
+    def test_tenant_slug(self):
+        """Test tenant slug extraction from tenant routes"""
+        assert get_tenant_slug("/api/duo-previa/orders") == "duo-previa"
+        assert get_tenant_slug("/api/restaurants/duo-previa") == "duo-previa"
+        assert get_tenant_slug("/auth/login") is None
+
+class TestSharedMemoryGCRAStore:
+    """Test suite for the cross-worker shared memory store"""
+    
+    @pytest.fixture
+    def shm_path(self, tmp_path):
+        return str(tmp_path / "ratelimit.bin")
+    
+    def test_state_is_shared_between_instances(self, shm_path):
+        """Test two workers mapping the same file share one limit"""
+        worker_a = SharedMemoryGCRAStore(shm_path, stripes=4, slots_per_stripe=16)
+        worker_b = SharedMemoryGCRAStore(shm_path, stripes=4, slots_per_stripe=16)
+        limit = RateLimit(calls=2, period=60.0)
+        
+        assert worker_a.hit("ip:1", limit, 100.0) == 0.0
+        assert worker_b.hit("ip:1", limit, 100.0) == 0.0
+        assert worker_a.hit("ip:1", limit, 100.0) > 0
+        assert worker_b.hit("ip:2", limit, 100.0) == 0.0
+        assert len(worker_a) == 2
+        
+        worker_a.close()
+        worker_b.close()
+    
+    def test_refund_is_shared(self, shm_path):
+        """Test a refund from one worker is visible to the others"""
+        worker_a = SharedMemoryGCRAStore(shm_path, stripes=4, slots_per_stripe=16)
+        worker_b = SharedMemoryGCRAStore(shm_path, stripes=4, slots_per_stripe=16)
+        limit = RateLimit(calls=1, period=60.0)
+        
+        assert worker_a.hit("ip:1", limit, 100.0) == 0.0
+        worker_b.refund("ip:1", limit, 100.0)
+        worker_b.refund("ip:unknown", limit, 100.0)
+        assert worker_a.hit("ip:1", limit, 100.0) == 0.0
+        assert worker_b.hit("ip:1", limit, 100.0) > 0
+        assert len(worker_a) == 1
+        
+        worker_a.close()
+        worker_b.close()
+    
+    def test_limit_holds_across_processes(self, shm_path):
+        """Test concurrent worker processes never exceed the limit together"""
+        limit_calls = 50
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            allowed = pool.starmap(_hammer, [(shm_path, limit_calls)] * 4)
+        
+        assert sum(allowed) == limit_calls
+    
+    def test_full_probe_window_reuses_oldest_slot(self, shm_path):
+        """Test the table stays bounded when a stripe's probe window is full"""
+        store = SharedMemoryGCRAStore(shm_path, stripes=1, slots_per_stripe=4, max_probe=4)
+        limit = RateLimit(calls=1, period=60.0)
+        
+        for i in range(10):
+            assert store.hit(f"ip:{i}", limit, 100.0 + i) == 0.0
+        assert len(store) == 4
+        store.close()
+
+    def test_locked_stripe_lets_request_through(self, shm_path):
+        """Test a stripe held by another process is waited on for lock_timeout only"""
+        store = SharedMemoryGCRAStore(shm_path, stripes=1, slots_per_stripe=16, lock_timeout=0.01)
+        limit = RateLimit(calls=1, period=60.0)
+        context = multiprocessing.get_context("fork")
+        locked, release = context.Event(), context.Event()
+        holder = context.Process(target=_hold_stripe, args=(shm_path, locked, release))
+        holder.start()
+        try:
+            assert locked.wait(5)
+            with patch("middleware.rate_limit.logger"):
+                assert store.hit("ip:1", limit, 100.0) == 0.0
+                assert store.hit("ip:1", limit, 100.0) == 0.0
+            assert store.lock_timeouts == 2
+        finally:
+            release.set()
+            holder.join()
+        
+        assert store.hit("ip:1", limit, 100.0) == 0.0
+        assert store.hit("ip:1", limit, 100.0) > 0
+        store.close()
+
+class TestMongoGCRAStore:
+    """Test suite for the multi-host Mongo store"""
+    
+    @pytest.mark.asyncio
+    async def test_mongo_errors_allow_the_request(self):
+        """Test a Mongo outage does not turn every request into a 500"""
+        store = MongoGCRAStore()
+        store._collection = MagicMock()
+        store._collection.find_one_and_update = AsyncMock(side_effect=AutoReconnect("down"))
+        store._collection.update_one = AsyncMock(side_effect=AutoReconnect("down"))
+        limit = RateLimit(calls=1, period=60.0)
+        
+        with patch("middleware.rate_limit.logger") as logger:
+            assert await store.hit("ip:1", limit, 100.0) == 0.0
+            await store.refund("ip:1", limit, 100.0)
+        
+        assert logger.error.call_count == 2
+
+def _hold_stripe(path: str, locked, release):
+    store = SharedMemoryGCRAStore(path, stripes=1, slots_per_stripe=16)
+    store._lock(0)
+    locked.set()
+    release.wait(5)
+    store._unlock(0)
+    store.close()
+
+def _hammer(path: str, calls: int) -> int:
+    store = SharedMemoryGCRAStore(path, stripes=4, slots_per_stripe=16)
+    limit = RateLimit(calls=calls, period=3600.0)
+    allowed = sum(1 for _ in range(100) if store.hit("ip:shared", limit, time.time()) == 0.0)
+    store.close()
+    return allowed
@@ -0,0 +1,145 @@
+import asyncio
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+from services.restaurants import RestaurantCache
+
+def restaurant_doc(slug="duo-previa", delivery_fee=500.0):
+    return {
+        "_id": ObjectId(), "name": "Duo", "slug": slug, "description": None, "logo": "",
+        "phone": "351", "address": "Calle 1", "city": "Córdoba",
+        "settings": {"delivery_fee": delivery_fee}, "is_active": True, "created_at": datetime(2024, 1, 1)
+    }
+
+class TestRestaurantCache:
+    """Test suite for the per-process restaurant cache"""
+
+    @pytest.fixture
+    def collection(self):
+        collection = MagicMock()
+        collection.find_one = AsyncMock(return_value=restaurant_doc())
+        with patch("services.restaurants.get_collection", return_value=collection):
+            yield collection
+
+    async def test_hit_skips_the_database(self, collection):
+        """Test a slug is queried once and then served from memory"""
+        cache = RestaurantCache()
+
+        first = await cache.get("duo-previa")
+        second = await cache.get("duo-previa")
+
+        assert first is second and first.settings.delivery_fee == 500.0
+        assert collection.find_one.await_count == 1
+
+    async def test_unknown_slug_is_negatively_cached(self, collection):
+        """Test unknown slugs are remembered for the (short) negative TTL only"""
+        collection.find_one.return_value = None
+        cache = RestaurantCache(negative_ttl=0)
+
+        assert await cache.get("nope") is None
+        assert await cache.get("nope") is None
+        assert collection.find_one.await_count == 2
+
+        cache = RestaurantCache(negative_ttl=60)
+        await cache.get("nope")
+        await cache.get("nope")
+        assert collection.find_one.await_count == 3
+
+    async def test_probing_unknown_slugs_keeps_restaurants_cached(self, collection):
+        """Test negative entries cannot evict real restaurants"""
+        cache = RestaurantCache(maxsize=2, negative_maxsize=4, negative_ttl=60)
+        await cache.get("duo-previa")
+        collection.find_one.return_value = None
+
+        for i in range(50):
+            assert await cache.get(f"random-{i}") is None
+
+        assert (await cache.get("duo-previa")).slug == "duo-previa"
+        assert collection.find_one.await_count == 51
+        assert cache.stats()["negative"]["size"] == 4
+
+    async def test_concurrent_misses_share_one_query(self, collection):
+        """Test a burst of cold requests for one slug issues one query"""
+        cache = RestaurantCache()
+
+        results = await asyncio.gather(*(cache.get("duo-previa") for _ in range(10)))
+
+        assert all(result is results[0] for result in results)
+        assert collection.find_one.await_count == 1
+
+    async def test_errors_are_not_cached(self, collection):
+        """Test a database error propagates and the next call retries"""
+        collection.find_one.side_effect = [Exception("down"), restaurant_doc()]
+        cache = RestaurantCache()
+
+        with pytest.raises(Exception):
+            await cache.get("duo-previa")
+        assert (await cache.get("duo-previa")).slug == "duo-previa"
+
+    async def test_update_invalidates_entry(self, collection):
+        """Test update_restaurant drops the cached restaurant"""
+        from services.restaurants import RestaurantService
+        from models import RestaurantUpdate
+
+        cache = RestaurantCache()
+        collection.update_one = AsyncMock(return_value=MagicMock(modified_count=1))
+        with patch("services.restaurants.restaurant_cache", cache):
+            service = RestaurantService()
+            await service.get_by_slug("duo-previa")
+            collection.find_one.return_value = restaurant_doc(delivery_fee=800.0)
+            await service.update_restaurant("duo-previa", RestaurantUpdate(name="Duo 2"))
+            restaurant = await service.get_by_slug("duo-previa")
+
+        assert restaurant.settings.delivery_fee == 800.0
+        assert collection.find_one.await_count == 2
+
+    async def test_sparse_lookup_from_cache(self, collection):
+        """Test ?fields= lookups are trimmed from the cached restaurant"""
+        from services.restaurants import RestaurantService
+
+        with patch("services.restaurants.restaurant_cache", RestaurantCache()):
+            restaurant = await RestaurantService().get_by_slug("duo-previa", frozenset({"id", "name"}))
+
+        assert set(restaurant.model_dump()) == {"id", "name"}
+
+    async def test_warm_up_loads_active_restaurants(self, collection):
+        """Test warm-up fills the cache with one query"""
+        documents = [restaurant_doc("a"), restaurant_doc("b")]
+
+        async def iterate():
+            for document in documents:
+                yield document
+
+        cursor = MagicMock()
+        cursor.sort.return_value = cursor
+        cursor.limit.return_value = iterate()
+        collection.find = MagicMock(return_value=cursor)
+        cache = RestaurantCache(maxsize=50)
+
+        assert await cache.warm_up() == 2
+        cursor.limit.assert_called_once_with(50)
+        assert (await cache.get("b")).slug == "b"
+        collection.find_one.assert_not_called()
+
+    async def test_order_creation_uses_the_cache(self, collection):
+        """Test creating an order needs no restaurant query once the slug is cached"""
+        from services.orders import OrderService
+        from models import OrderCreate
+
+        cache = RestaurantCache()
+        orders = MagicMock()
+        orders.insert_one = AsyncMock(return_value=MagicMock(inserted_id=ObjectId()))
+        order = OrderCreate(
+            customer={"name": "Ana", "phone": "3510000000"},
+            items=[{"product_id": "p1", "product_name": "Pizza", "quantity": 1, "unit_price": 10.0, "total_price": 10.0}],
+            payment_method="cash", is_delivery=True
+        )
+        with patch("services.restaurants.restaurant_cache", cache), \
+             patch("services.orders.get_collection", return_value=orders):
+            service = OrderService()
+            await service.create_order("duo-previa", order)
+            created = await service.create_order("duo-previa", order)
+
+        assert collection.find_one.await_count == 1
+        assert created.delivery_fee == 500.0
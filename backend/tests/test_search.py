@@ -0,0 +1,195 @@
+from bson import ObjectId
+from unittest.mock import MagicMock, patch
+from utils.search import SearchIndex, fold, tokenize
+from services.products import ProductSearch, SEARCH_FIELDS
+
+CATEGORY = str(ObjectId())
+
+def build_index():
+    index = SearchIndex(SEARCH_FIELDS)
+    index.add("1", {"name": "Hamburguesa Clásica", "description": "Carne, lechuga y tomate"})
+    index.add("2", {"name": "Hamburguesa Doble", "description": "Doble carne y cheddar"})
+    index.add("3", {"name": "Lomito Completo", "description": "Con jamón, queso y huevo"})
+    index.add("4", {"name": "Papas Fritas", "description": "Clásicas, con cheddar opcional"})
+    return index
+
+class AsyncCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class TestSearchIndex:
+    """Test suite for the in-memory inverted index"""
+
+    def test_fold_removes_accents_and_case(self):
+        """Test folding makes "Clásica" and "CLASICA" the same term"""
+        assert fold("Clásica") == fold("CLASICA") == "clasica"
+        assert tokenize("Jamón y Ñoquis!") == ["jamon", "y", "noquis"]
+
+    def test_accent_insensitive_match(self):
+        """Test an unaccented query finds the accented product"""
+        results = build_index().search("clasica")
+
+        assert [doc_id for doc_id, _ in results] == ["1", "4"]
+
+    def test_name_matches_rank_above_description(self):
+        """Test a name hit outranks a description-only hit"""
+        results = build_index().search("cheddar doble")
+
+        assert [doc_id for doc_id, _ in results] == ["2"]
+        results = build_index().search("clasic")
+        assert results[0][0] == "1"
+
+    def test_prefix_type_ahead(self):
+        """Test partial words match while typing"""
+        index = build_index()
+
+        assert [doc_id for doc_id, _ in index.search("ham")] == ["1", "2"]
+        assert [doc_id for doc_id, _ in index.search("hamburguesa dob")] == ["2"]
+        assert index.search("pizza") == []
+
+    def test_exact_term_beats_prefix(self):
+        """Test an exact term scores higher than a longer term it prefixes"""
+        index = SearchIndex(SEARCH_FIELDS)
+        index.add("a", {"name": "Papas Fritas Grandes", "description": ""})
+        index.add("b", {"name": "Papa", "description": ""})
+
+        assert index.search("papa")[0][0] == "b"
+
+    def test_short_prefix_keeps_every_expansion(self):
+        """Test a prefix shared by more than 64 terms still finds terms sorting after them"""
+        index = SearchIndex(SEARCH_FIELDS)
+        for i in range(100):
+            index.add(f"pa{i}", {"name": f"Pa{i:03d}", "description": f"Ma{i:03d}"})
+        index.add("pizza", {"name": "Pizza Margarita", "description": "Muzzarella y albahaca"})
+
+        assert "pizza" in [doc_id for doc_id, _ in index.search("p", limit=200)]
+        assert [doc_id for doc_id, _ in index.search("pizza m")] == ["pizza"]
+        assert [doc_id for doc_id, _ in index.search("m pizz")] == ["pizza"]
+
+    def test_candidate_check_scores_like_postings_walk(self):
+        """Test narrowing by the candidates' own terms ranks exactly like walking the postings"""
+        index = build_index()
+        for i in range(40):
+            index.add(f"c{i}", {"name": f"Combo {i}", "description": f"Con papas y cheddar {i}"})
+        queries = ["c", "con p", "cheddar c", "hamburguesa c", "p cheddar combo"]
+
+        index.TERMS_PER_DOC = 0
+        walked = [index.search(query, limit=100) for query in queries]
+        index.TERMS_PER_DOC = 10 ** 6
+        narrowed = [index.search(query, limit=100) for query in queries]
+
+        assert walked == narrowed
+        assert all(walked)
+
+    def test_remove_and_readd(self):
+        """Test updates replace the indexed terms"""
+        index = build_index()
+        index.add("1", {"name": "Hamburguesa Vegana", "description": "Medallón de lentejas"})
+
+        assert [doc_id for doc_id, _ in index.search("clasica")] == ["4"]
+        assert [doc_id for doc_id, _ in index.search("lentejas")] == ["1"]
+
+        index.remove("1")
+        assert index.search("lentejas") == []
+        assert "lentej" not in " ".join(index._terms)
+
+    def test_filter_and_limit(self):
+        """Test the attribute filter and result limit"""
+        index = build_index()
+
+        results = index.search("c", limit=10, where=lambda doc: doc["name"].startswith("Papas"))
+        assert [doc_id for doc_id, _ in results] == ["4"]
+        assert len(index.search("c", limit=2)) == 2
+        assert index.search("   ") == []
+
+class TestProductSearch:
+    """Test suite for the per-tenant product search indexes"""
+
+    def products(self):
+        return [
+            {"_id": ObjectId(), "name": "Pizza Napolitana", "description": "Tomate y ajo",
+             "category_id": ObjectId(CATEGORY), "is_popular": True},
+            {"_id": ObjectId(), "name": "Pizza Fugazza", "description": "Cebolla",
+             "category_id": ObjectId(), "is_popular": False},
+        ]
+
+    async def test_index_is_built_once_per_tenant(self):
+        """Test the tenant's index is loaded with one query and reused"""
+        search = ProductSearch(ttl=60, maxsize=10, limit=10)
+        collection = MagicMock()
+        collection.find = MagicMock(return_value=AsyncCursor(self.products()))
+
+        index = await search.index_for("duo-previa", collection)
+        again = await search.index_for("duo-previa", collection)
+
+        assert index is again
+        assert len(index) == 2
+        collection.find.assert_called_once()
+        assert collection.find.call_args[0][0] == {"restaurant_slug": "duo-previa", "is_available": True}
+
+    async def test_writes_update_loaded_index(self):
+        """Test create, update and delete keep a loaded index current"""
+        search = ProductSearch(ttl=60, maxsize=10, limit=10)
+        products = self.products()
+        collection = MagicMock()
+        collection.find = MagicMock(return_value=AsyncCursor(products))
+        index = await search.index_for("duo-previa", collection)
+        napolitana = str(products[0]["_id"])
+
+        search.add("duo-previa", "new", {"name": "Empanada Árabe", "description": "", "category_id": ObjectId(), "is_popular": False})
+        assert [doc_id for doc_id, _ in index.search("arabe")] == ["new"]
+
+        search.update("duo-previa", napolitana, {"name": "Pizza Calabresa", "price": 10})
+        assert [doc_id for doc_id, _ in index.search("calabresa")] == [napolitana]
+        assert index.document(napolitana)["is_popular"] is True
+
+        search.update("duo-previa", napolitana, {"is_available": False})
+        assert index.search("calabresa") == []
+
+        search.remove("duo-previa", "new")
+        assert index.search("arabe") == []
+
+    async def test_reenabled_product_rebuilds_index(self):
+        """Test re-enabling an unindexed product drops the index for a rebuild"""
+        search = ProductSearch(ttl=60, maxsize=10, limit=10)
+        collection = MagicMock()
+        collection.find = MagicMock(side_effect=lambda *args: AsyncCursor(self.products()))
+        await search.index_for("duo-previa", collection)
+
+        search.update("duo-previa", str(ObjectId()), {"is_available": True})
+        await search.index_for("duo-previa", collection)
+
+        assert collection.find.call_count == 2
+
+    async def test_service_ranks_and_filters(self):
+        """Test ProductService returns hits in rank order with the category filter"""
+        from services.products import ProductService
+
+        products = self.products()
+        for product in products:
+            product.update({
+                "price": 10.0, "image": "", "restaurant_slug": "duo-previa", "is_available": True,
+                "is_vegetarian": False, "is_vegan": False, "allergens": [], "preparation_time": 15,
+                "rating": 5.0, "rating_count": 0
+            })
+        collection = MagicMock()
+        collection.find = MagicMock(side_effect=[AsyncCursor(products), AsyncCursor(products[:1])])
+
+        with patch("services.products.get_collection", return_value=collection), \
+             patch("services.products.product_search", ProductSearch(ttl=60, maxsize=10, limit=10)):
+            service = ProductService()
+            page = await service.get_products_by_restaurant("duo-previa", category_id=CATEGORY, search="pizza")
+
+        assert [product.name for product in page.items] == ["Pizza Napolitana"]
+        fetch_query = collection.find.call_args_list[1][0][0]
+        assert fetch_query["_id"] == {"$in": [products[0]["_id"]]}
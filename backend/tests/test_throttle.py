@@ -0,0 +1,94 @@
+from unittest.mock import patch
+from utils.throttle import BackoffThrottle, LoginThrottle
+from middleware.security import get_client_ip
+
+class TestBackoffThrottle:
+    """Test suite for the exponential backoff throttle"""
+    
+    def test_free_attempts_then_exponential_backoff(self):
+        """Test keys are blocked after the free attempts with doubling delays"""
+        throttle = BackoffThrottle(free_attempts=2, base_delay=1.0, max_delay=10.0)
+        
+        with patch('utils.throttle.time.monotonic', return_value=100.0):
+            throttle.record_failure("key")
+            assert throttle.retry_after("key") == 0.0
+            throttle.record_failure("key")
+            assert throttle.retry_after("key") == 1.0
+            throttle.record_failure("key")
+            assert throttle.retry_after("key") == 2.0
+            for _ in range(5):
+                throttle.record_failure("key")
+            assert throttle.retry_after("key") == 10.0
+    
+    def test_idle_keys_are_evicted(self):
+        """Test idle, unblocked keys are dropped on the next update"""
+        throttle = BackoffThrottle(free_attempts=5, idle_ttl=60.0)
+        
+        with patch('utils.throttle.time.monotonic', return_value=0.0):
+            throttle.record_failure("old")
+        with patch('utils.throttle.time.monotonic', return_value=120.0):
+            throttle.record_failure("new")
+        
+        assert len(throttle) == 1
+        assert throttle.retry_after("old") == 0.0
+
+class TestLoginThrottle:
+    """Test suite for the login throttle"""
+    
+    def test_success_resets_credential_key(self):
+        """Test a successful login clears the credential backoff"""
+        throttle = LoginThrottle()
+        throttle.credentials.free_attempts = 1
+        
+        throttle.record_failure("test-restaurant", "admin", "1.2.3.4")
+        assert throttle.retry_after("test-restaurant", "admin", "1.2.3.4") > 0
+        assert throttle.stats()["rejected"] == 1
+        
+        throttle.record_success("test-restaurant", "admin")
+        assert throttle.retry_after("test-restaurant", "admin", "1.2.3.4") == 0.0
+    
+    def test_concurrent_attempts_are_reserved(self):
+        """Test in-flight attempts count against the free attempts before they fail"""
+        throttle = LoginThrottle()
+        throttle.credentials.free_attempts = 2
+        
+        assert throttle.acquire("test-restaurant", "admin", "1.2.3.4") == 0.0
+        assert throttle.acquire("test-restaurant", "admin", "1.2.3.4") == 0.0
+        assert throttle.acquire("test-restaurant", "admin", "1.2.3.4") > 0
+        
+        throttle.release("test-restaurant", "admin", "1.2.3.4")
+        throttle.record_success("test-restaurant", "admin")
+        assert throttle.acquire("test-restaurant", "admin", "1.2.3.4") == 0.0
+    
+    def test_failed_burst_is_blocked(self):
+        """Test a burst that passed the check is throttled once its failures land"""
+        throttle = LoginThrottle()
+        throttle.credentials.free_attempts = 2
+        
+        for _ in range(2):
+            assert throttle.acquire("test-restaurant", "admin", None) == 0.0
+        for _ in range(2):
+            throttle.release("test-restaurant", "admin", None)
+            throttle.record_failure("test-restaurant", "admin", None)
+        
+        assert throttle.acquire("test-restaurant", "admin", None) > 0
+
+class TestClientIp:
+    """Test suite for client IP extraction"""
+    
+    def _scope(self, forwarded_for=None):
+        headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+        return {"headers": headers, "client": ("10.0.0.9", 4321)}
+    
+    def test_forwarded_for_ignored_without_trusted_proxies(self):
+        """Test a client-supplied X-Forwarded-For does not change the address"""
+        with patch('middleware.security.TRUSTED_PROXY_COUNT', 0):
+            assert get_client_ip(self._scope("6.6.6.6")) == "10.0.0.9"
+    
+    def test_uses_hop_added_by_trusted_proxy(self):
+        """Test spoofed entries left of the trusted hops are skipped"""
+        with patch('middleware.security.TRUSTED_PROXY_COUNT', 1):
+            assert get_client_ip(self._scope("6.6.6.6, 203.0.113.7")) == "203.0.113.7"
+            assert get_client_ip(self._scope()) == "10.0.0.9"
+        with patch('middleware.security.TRUSTED_PROXY_COUNT', 2):
+            assert get_client_ip(self._scope("6.6.6.6, 203.0.113.7, 10.0.0.2")) == "203.0.113.7"
@@ -1,2 +1,4 @@
 from .converters import to_object_id, to_string_id
 from .transactions import with_transaction
+from .cache import TTLCache
+from .singleflight import SingleFlight
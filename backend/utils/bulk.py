@@ -0,0 +1,52 @@
+import logging
+from typing import List, Optional, Tuple
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from models import BulkItemResult
+
+logger = logging.getLogger(__name__)
+
+def item_results(raw_ids: List[str]) -> Tuple[List[BulkItemResult], List[Optional[ObjectId]]]:
+    """
+    One result per item plus its ObjectId; malformed or repeated ids are
+    marked invalid up front and get None, so they are never written.
+    """
+    results, object_ids, seen = [], [], set()
+    for raw_id in raw_ids:
+        result = BulkItemResult(id=raw_id, status="pending")
+        object_id = ObjectId(raw_id) if ObjectId.is_valid(raw_id) else None
+        if object_id is None:
+            result.status, result.error = "invalid", "Invalid id"
+        elif object_id in seen:
+            result.status, result.error, object_id = "invalid", "Repeated id", None
+        else:
+            seen.add(object_id)
+        results.append(result)
+        object_ids.append(object_id)
+    return results, object_ids
+
+def mark_failed(results: List[BulkItemResult], error: str = "Lookup failed") -> List[BulkItemResult]:
+    """Fail every item not already rejected (the tenant lookup itself failed)"""
+    for result in results:
+        if result.status == "pending":
+            result.status, result.error = "failed", error
+    return results
+
+async def bulk_apply(collection, operations: List, results: List[BulkItemResult]):
+    """
+    Run `operations` as one unordered bulk_write. results[i] belongs to
+    operations[i] and ends up updated, or failed with the server's message.
+    """
+    if not operations:
+        return
+    try:
+        await collection.bulk_write(operations, ordered=False)
+        failed = {}
+    except BulkWriteError as e:
+        failed = {error["index"]: error.get("errmsg", "Write failed") for error in e.details.get("writeErrors", [])}
+    except Exception as e:
+        logger.error(f"Error in bulk write on {collection.name}: {e}")
+        failed = {index: "Write failed" for index in range(len(operations))}
+    for index, result in enumerate(results):
+        result.status = "failed" if index in failed else "updated"
+        result.error = failed.get(index)
@@ -0,0 +1,45 @@
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Type
+from pydantic import BaseModel, TypeAdapter, create_model
+
+# Response field -> document field when they differ
+DOCUMENT_FIELDS = {"id": "_id"}
+
+class InvalidFields(ValueError):
+    def __init__(self, unknown: Iterable[str]):
+        self.unknown = sorted(unknown)
+        super().__init__(f"Unknown fields: {', '.join(self.unknown)}")
+
+def parse_fields(raw: Optional[str], model: Type[BaseModel]) -> Optional[FrozenSet[str]]:
+    """`?fields=name,price` -> {"id", "name", "price"}; None means the full model"""
+    if not raw:
+        return None
+    names = {name.strip() for name in raw.split(",") if name.strip()}
+    unknown = names - set(model.model_fields)
+    if unknown or not names:
+        raise InvalidFields(unknown or [raw])
+    return frozenset(names | {"id"})
+
+def projection(model: Type[BaseModel], fields: Optional[FrozenSet[str]] = None, extra: Iterable[str] = ()) -> Dict[str, int]:
+    """
+    Mongo projection for the response fields (all of the model's by
+    default), plus `extra` document fields the service needs itself, such
+    as pagination sort keys.
+    """
+    names = fields if fields is not None else model.model_fields.keys()
+    included = {DOCUMENT_FIELDS.get(name, name) for name in names} | set(extra)
+    return {name: 1 for name in sorted(included)}
+
+@lru_cache(maxsize=256)
+def sparse_model(model: Type[BaseModel], fields: Optional[FrozenSet[str]]) -> Type[BaseModel]:
+    """The response model restricted to `fields` (built once per field set)"""
+    if fields is None:
+        return model
+    return create_model(
+        f"{model.__name__}Fields",
+        **{name: (info.annotation, info) for name, info in model.model_fields.items() if name in fields}
+    )
+
+@lru_cache(maxsize=256)
+def list_adapter(model: Type[BaseModel], fields: Optional[FrozenSet[str]]) -> TypeAdapter:
+    return TypeAdapter(List[sparse_model(model, fields)])
@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class HashingQueueFull(Exception):
+    """Raised when the password hashing pool cannot accept more work"""
+
+def calibrate_bcrypt_rounds(
+    target_ms: float = 250.0,
+    min_rounds: int = 10,
+    max_rounds: int = 15,
+    samples: int = 3
+) -> Dict[str, Any]:
+    """
+    Benchmark bcrypt on this machine and pick the highest work factor whose
+    median hash time stays within the latency budget (never below min_rounds).
+    """
+    from passlib.hash import bcrypt
+
+    timings = {}
+    for rounds in range(min_rounds, max_rounds + 1):
+        handler = bcrypt.using(rounds=rounds)
+        durations = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            handler.hash("calibration-password")
+            durations.append((time.perf_counter() - start) * 1000)
+        timings[rounds] = round(statistics.median(durations), 2)
+        # Each extra round doubles the cost, no point measuring further
+        if timings[rounds] > target_ms:
+            break
+
+    within_budget = [r for r, ms in timings.items() if ms <= target_ms]
+    chosen = max(within_budget) if within_budget else min_rounds
+
+    return {
+        "rounds": chosen,
+        "target_ms": target_ms,
+        "chosen_ms": timings[chosen],
+        "timings_ms": timings
+    }
+
+class PasswordHasher:
+    """
+    Runs passlib hashing/verification on a dedicated thread pool so bcrypt
+    never blocks the event loop. bcrypt releases the GIL, so threads give
+    real parallelism. Work beyond `max_workers + max_queue` is rejected
+    immediately instead of piling up behind slow hashes.
+    """
+
+    def __init__(self, pwd_context, max_workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.pwd_context = pwd_context
+        self.max_workers = max_workers or int(
+            os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+        )
+        self.max_queue = max_queue if max_queue is not None else int(
+            os.getenv("PASSWORD_HASH_MAX_QUEUE", "32")
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.rounds: Optional[int] = None
+        self.rehashed = 0
+        if os.getenv("PASSWORD_HASH_ROUNDS"):
+            self.set_rounds(int(os.getenv("PASSWORD_HASH_ROUNDS")))
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_wait_seconds = 0.0
+
+    def set_rounds(self, rounds: int):
+        """
+        Hash new passwords with this bcrypt work factor. It is also the
+        floor: cheaper hashes are reported by verify_and_update so they get
+        rehashed on the next login, costlier ones are left alone. Pick the
+        value once per deployment with `python -m utils.hashing` so every
+        worker agrees on it.
+        """
+        self.pwd_context.update(
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds
+        )
+        self.rounds = rounds
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="password-hash"
+            )
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.max_workers)
+
+    async def _submit(self, func: Callable[..., Any], *args) -> Any:
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HashingQueueFull("Password hashing queue is saturated")
+
+        self.in_flight += 1
+        submitted = time.perf_counter()
+        started = []
+
+        def run():
+            started.append(time.perf_counter())
+            return func(*args)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, run)
+        finally:
+            finished = time.perf_counter()
+            self.in_flight -= 1
+            self.completed += 1
+            elapsed = finished - submitted
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+            if started:
+                self.total_wait_seconds += started[0] - submitted
+
+    async def hash(self, password: str) -> str:
+        """Hash a password off the event loop"""
+        return await self._submit(self.pwd_context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password off the event loop"""
+        return await self._submit(self.pwd_context.verify, plain_password, hashed_password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str):
+        """Verify and return (valid, new_hash); new_hash is set when the stored cost is below the floor"""
+        valid, new_hash = await self._submit(
+            self.pwd_context.verify_and_update, plain_password, hashed_password
+        )
+        if new_hash:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and latency metrics"""
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_latency_ms": round(self.total_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "avg_wait_ms": round(self.total_wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "max_latency_ms": round(self.max_seconds * 1000, 2),
+            "rounds": self.rounds,
+            "rehashed": self.rehashed
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate bcrypt work factor for this machine")
+    parser.add_argument("--target-ms", type=float, default=250.0, help="Latency budget per hash")
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=15)
+    args = parser.parse_args()
+
+    result = calibrate_bcrypt_rounds(args.target_ms, args.min_rounds, args.max_rounds)
+    for rounds, ms in result["timings_ms"].items():
+        print(f"rounds={rounds:<3} {ms:>9.2f} ms")
+    print(f"PASSWORD_HASH_ROUNDS={result['rounds']}  ({result['chosen_ms']} ms, target {result['target_ms']} ms)")
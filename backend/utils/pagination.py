@@ -0,0 +1,72 @@
+import base64
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from bson import ObjectId, json_util
+
+SortKey = Sequence[Tuple[str, int]]
+
+class InvalidCursor(ValueError):
+    pass
+
+# Types a sort key can hold; anything else (a dict with $-operators, a list)
+# would be spliced into the query by keyset_filter
+_CURSOR_VALUE_TYPES = (str, int, float, datetime, ObjectId)
+
+def page_size(limit: Optional[int], default: int, maximum: int) -> int:
+    """Requested page size, clamped to 1..maximum"""
+    if limit is None:
+        return default
+    return max(1, min(limit, maximum))
+
+def encode_cursor(kind: str, values: List[Any]) -> str:
+    """Opaque cursor holding the sort-key values of the last item of a page"""
+    payload = json_util.dumps({"k": kind, "v": values}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(kind: str, cursor: str, sort: SortKey) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(payload, dict) or payload.get("k") != kind \
+            or not isinstance(payload.get("v"), list) or len(payload["v"]) != len(sort):
+        raise InvalidCursor("Cursor does not belong to this listing")
+    return [_sort_value(field, value) for (field, _), value in zip(sort, payload["v"])]
+
+def _sort_value(field: str, value: Any) -> Any:
+    if field == "_id":
+        if isinstance(value, ObjectId):
+            return value
+        if isinstance(value, str) and len(value) == 24 and ObjectId.is_valid(value):
+            return ObjectId(value)
+        raise InvalidCursor("Invalid cursor id")
+    # None is a legitimate key (a document without the field)
+    if value is None or (isinstance(value, _CURSOR_VALUE_TYPES) and not isinstance(value, bool)):
+        return value
+    raise InvalidCursor("Invalid cursor value")
+
+def keyset_filter(sort: SortKey, values: List[Any]) -> Dict[str, Any]:
+    """
+    Documents strictly after `values` in `sort` order. The leading field
+    also gets a plain range bound so the planner can seek in the index
+    instead of evaluating the $or over the whole tenant.
+    """
+    def op(direction: int, inclusive: bool = False) -> str:
+        return ("$gte" if inclusive else "$gt") if direction == 1 else ("$lte" if inclusive else "$lt")
+
+    branches = []
+    for position, (field, direction) in enumerate(sort):
+        branch = {name: value for (name, _), value in zip(sort[:position], values[:position])}
+        branch[field] = {op(direction): values[position]}
+        branches.append(branch)
+
+    first_field, first_direction = sort[0]
+    return {first_field: {op(first_direction, inclusive=True): values[0]}, "$or": branches}
+
+def next_cursor(kind: str, sort: SortKey, documents: List[Dict[str, Any]], size: int) -> Optional[str]:
+    """Cursor after the page, or None when `documents` (fetched with size + 1) was the last page"""
+    if len(documents) <= size:
+        return None
+    last = documents[size - 1]
+    return encode_cursor(kind, [last.get(field) for field, _ in sort])
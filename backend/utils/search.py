@@ -0,0 +1,144 @@
+import re
+import math
+import heapq
+import bisect
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_WORD_RE = re.compile(r"\w+")
+_PREFIX_END = "\U0010ffff"
+
+def fold(text: str) -> str:
+    """Accent- and case-insensitive form: "Clásica" -> "clasica" """
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _WORD_RE.findall(fold(text)) if text else []
+
+class SearchIndex:
+    """
+    In-memory inverted index over a few weighted text fields. Every query
+    term matches as a prefix of an indexed term (type-ahead), exact terms
+    score higher than prefix matches, and a document must match all query
+    terms. A term contributes field weight * idf; ties sort by the first
+    field (the product name).
+
+    Every expansion of a prefix counts, however short. Query terms are
+    applied cheapest first, and once few candidates are left a short
+    prefix is checked against their own terms instead of walking the
+    postings of everything it expands to.
+    """
+
+    PREFIX_WEIGHT = 0.5
+    # Rough number of distinct terms per document, to compare both strategies
+    TERMS_PER_DOC = 16
+
+    def __init__(self, fields: Dict[str, float]):
+        self.fields = fields
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._terms: List[str] = []  # sorted vocabulary for prefix lookups
+        self._docs: Dict[str, Tuple[Dict[str, float], Dict[str, Any], str]] = {}
+        self._sort_field = next(iter(fields))
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+    def add(self, doc_id: str, document: Dict[str, Any]):
+        """Index (or re-index) a document; its fields are kept as attributes"""
+        self.remove(doc_id)
+        weights: Dict[str, float] = {}
+        for field, weight in self.fields.items():
+            for term in tokenize(document.get(field)):
+                weights[term] = weights.get(term, 0.0) + weight
+
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[doc_id] = weight
+        self._docs[doc_id] = (weights, dict(document), fold(document.get(self._sort_field) or ""))
+
+    def remove(self, doc_id: str) -> bool:
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return False
+        for term in entry[0]:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+        return True
+
+    def document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._docs.get(doc_id)
+        return entry[1] if entry else None
+
+    def _expand(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + _PREFIX_END, start)
+        return self._terms[start:end]
+
+    def _boost(self, candidate: str, term: str, total: int) -> float:
+        return math.log(1 + total / len(self._postings[candidate])) * (
+            1.0 if candidate == term else self.PREFIX_WEIGHT
+        )
+
+    def search(
+        self,
+        query: str,
+        limit: int = 50,
+        where: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> List[Tuple[str, float]]:
+        """Best `limit` (doc_id, score) pairs matching every query term"""
+        total = len(self._docs)
+        docs = self._docs
+        expanded = []
+        for term in dict.fromkeys(tokenize(query)):
+            expansions = self._expand(term)
+            if not expansions:
+                return []
+            visits = sum(len(self._postings[candidate]) for candidate in expansions)
+            expanded.append((visits, term, expansions))
+        if not expanded:
+            return []
+        expanded.sort(key=lambda item: item[0])
+
+        scores: Optional[Dict[str, float]] = None
+        for visits, term, expansions in expanded:
+            if scores is None or visits <= len(scores) * self.TERMS_PER_DOC:
+                term_scores: Dict[str, float] = {}
+                for candidate in expansions:
+                    boost = self._boost(candidate, term, total)
+                    for doc_id, weight in self._postings[candidate].items():
+                        score = weight * boost
+                        if score > term_scores.get(doc_id, 0.0):
+                            term_scores[doc_id] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {doc_id: score + term_scores[doc_id] for doc_id, score in scores.items() if doc_id in term_scores}
+            else:
+                # Few candidates left: look for the prefix among their own terms
+                narrowed: Dict[str, float] = {}
+                for doc_id, score in scores.items():
+                    best = 0.0
+                    for candidate, weight in docs[doc_id][0].items():
+                        if candidate.startswith(term):
+                            best = max(best, weight * self._boost(candidate, term, total))
+                    if best:
+                        narrowed[doc_id] = score + best
+                scores = narrowed
+            if not scores:
+                return []
+
+        candidates = (
+            (-score, docs[doc_id][2], doc_id) for doc_id, score in scores.items()
+            if where is None or where(docs[doc_id][1])
+        )
+        return [(doc_id, -negative) for negative, _, doc_id in heapq.nsmallest(limit, candidates)]
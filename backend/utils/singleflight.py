@@ -0,0 +1,65 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from utils.cache import TTLCache
+
+_MISSING = object()
+
+def _retrieve(task: asyncio.Task):
+    # Mark the outcome as retrieved in case every caller was cancelled
+    if not task.cancelled():
+        task.exception()
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution whose
+    result is shared by every caller. Truthy results are also kept for a
+    short grace window so near-simultaneous callers get the same answer.
+    """
+
+    def __init__(self, grace: float = 0.0, maxsize: int = 1024):
+        self.grace = grace
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._recent = TTLCache(maxsize=maxsize, ttl=grace)
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        if self.grace > 0:
+            recent = self._recent.get(key, _MISSING)
+            if recent is not _MISSING:
+                self.coalesced += 1
+                return recent
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # The work runs in its own task: cancelling the caller that
+            # started it (a client disconnect) leaves it running for the rest
+            task = asyncio.create_task(self._run(key, func))
+            task.add_done_callback(_retrieve)
+            self._inflight[key] = task
+            self.executed += 1
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            result = await func()
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+        if result and self.grace > 0:
+            self._recent.set(key, result)
+        return result
+
+    def clear(self):
+        """Forget results kept for the grace window"""
+        self._recent.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "grace": self.grace
+        }
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_request_sampled: ContextVar[bool] = ContextVar("request_sampled", default=True)
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, including the fields passed with `extra=`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False, separators=(",", ":"))
+
+class RequestSampler(logging.Filter):
+    """
+    Keeps a fraction of successful requests' INFO/DEBUG records. The decision
+    is made once per request and held in a context variable so a request's
+    records are kept or dropped together; errors, slow requests, WARNING+
+    records and records marked `audit` are always kept.
+    """
+
+    def __init__(self, rate: float = 1.0, slow_ms: float = 1000.0):
+        super().__init__()
+        self.rate = rate
+        self.slow_ms = slow_ms
+        self.kept = 0
+        self.dropped = 0
+
+    def start_request(self) -> bool:
+        sampled = self.rate >= 1.0 or random.random() < self.rate
+        _request_sampled.set(sampled)
+        return sampled
+
+    def finish_request(self, status_code: int, process_time: float) -> bool:
+        """Force-keep the rest of an errored or slow request; returns whether it is kept"""
+        if status_code >= 400 or process_time * 1000 >= self.slow_ms:
+            _request_sampled.set(True)
+            return True
+        return _request_sampled.get()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or _request_sampled.get() or getattr(record, "audit", False):
+            self.kept += 1
+            return True
+        self.dropped += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rate": self.rate, "slow_ms": self.slow_ms, "kept": self.kept, "dropped": self.dropped}
+
+class BatchingQueueHandler(logging.Handler):
+    """
+    Hands records to a background writer thread through a bounded queue, so
+    formatting and stream I/O stay off the event loop. The writer formats
+    up to `batch_size` records at a time and writes them with one call.
+    When the queue is full records are dropped (and counted) rather than
+    blocking the caller.
+    """
+
+    def __init__(
+        self,
+        stream=None,
+        queue_size: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 0.5
+    ):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Log records, then None to stop the writer
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._thread = threading.Thread(target=self._writer, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def emit(self, record: logging.LogRecord):
+        if record.args:
+            # Resolve now, the args may be mutated before the writer runs
+            record.msg = record.getMessage()
+            record.args = None
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer(self):
+        while True:
+            record = self.queue.get()
+            batch: List[logging.LogRecord] = []
+            stop = record is None
+            if not stop:
+                batch.append(record)
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        record = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if record is None:
+                        stop = True
+                        break
+                    batch.append(record)
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: List[logging.LogRecord]):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except Exception:
+            self.handleError(batch[-1])
+        self.written += len(lines)
+        self.batches += 1
+
+    def close(self):
+        """Flush pending records and stop the writer thread"""
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=5)
+        super().close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches
+        }
+
+request_sampler = RequestSampler(
+    rate=float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", "1.0")),
+    slow_ms=float(os.getenv("LOG_SLOW_REQUEST_MS", "1000"))
+)
+
+def configure_logging() -> BatchingQueueHandler:
+    """
+    Replace the root handlers with the async batching handler. LOG_FORMAT is
+    "json" (default) or "text" for the previous plain format.
+    """
+    handler = BatchingQueueHandler(
+        queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+        batch_size=int(os.getenv("LOG_BATCH_SIZE", "256")),
+        flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+    )
+    if os.getenv("LOG_FORMAT", "json") == "text":
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    else:
+        handler.setFormatter(JSONFormatter())
+    handler.addFilter(request_sampler)
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    atexit.register(handler.close)
+    return handler
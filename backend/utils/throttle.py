@@ -0,0 +1,145 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+class BackoffThrottle:
+    """
+    Failure-driven throttle with exponential backoff. Each key keeps a
+    fixed-size record (failures, blocked_until, last_seen, in_flight); keys
+    idle for longer than `idle_ttl` are evicted oldest-first on every update.
+    Attempts still being verified count against the free attempts, so a
+    concurrent burst cannot get past the backoff before its failures land.
+    """
+
+    def __init__(
+        self,
+        free_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 900.0,
+        idle_ttl: float = 3600.0,
+        max_keys: int = 100000
+    ):
+        self.free_attempts = free_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.idle_ttl = idle_ttl
+        self.max_keys = max_keys
+        self._state: "OrderedDict[Hashable, list]" = OrderedDict()
+
+    def retry_after(self, key: Hashable) -> float:
+        """Seconds the key must wait before trying again (0 if allowed)"""
+        entry = self._state.get(key)
+        if entry is None:
+            return 0.0
+        wait = max(0.0, entry[1] - time.monotonic())
+        if not wait and entry[3] >= max(1, self.free_attempts - entry[0]):
+            # Every remaining attempt is already in flight
+            wait = self.base_delay
+        return wait
+
+    def acquire(self, key: Hashable):
+        """Reserve an attempt until `release`; call after `retry_after` allowed it"""
+        now = time.monotonic()
+        self._touch(key, now)[3] += 1
+        self._evict(now)
+
+    def release(self, key: Hashable):
+        entry = self._state.get(key)
+        if entry is not None and entry[3]:
+            entry[3] -= 1
+
+    def record_failure(self, key: Hashable):
+        now = time.monotonic()
+        entry = self._touch(key, now)
+
+        entry[0] += 1
+        excess = entry[0] - self.free_attempts
+        if excess >= 0:
+            entry[1] = now + min(self.base_delay * (2 ** excess), self.max_delay)
+
+        self._evict(now)
+
+    def reset(self, key: Hashable):
+        entry = self._state.get(key)
+        if entry is None:
+            return
+        if entry[3]:
+            entry[0] = 0
+            entry[1] = 0.0
+        else:
+            del self._state[key]
+
+    def _touch(self, key: Hashable, now: float) -> list:
+        entry = self._state.get(key)
+        if entry is None:
+            entry = [0, 0.0, now, 0]
+            self._state[key] = entry
+        else:
+            self._state.move_to_end(key)
+            entry[2] = now
+        return entry
+
+    def _evict(self, now: float):
+        while self._state:
+            key, entry = next(iter(self._state.items()))
+            idle = now - entry[2] > self.idle_ttl and entry[1] <= now
+            if not idle and len(self._state) <= self.max_keys:
+                break
+            self._state.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+class LoginThrottle:
+    """Throttles login attempts per (restaurant_slug, username) and per client IP"""
+
+    def __init__(self):
+        self.credentials = BackoffThrottle(
+            free_attempts=int(os.getenv("LOGIN_FREE_ATTEMPTS", "5")),
+            max_delay=float(os.getenv("LOGIN_MAX_BACKOFF", "900"))
+        )
+        self.ips = BackoffThrottle(
+            free_attempts=int(os.getenv("LOGIN_IP_FREE_ATTEMPTS", "20")),
+            max_delay=float(os.getenv("LOGIN_MAX_BACKOFF", "900"))
+        )
+        self.rejected = 0
+
+    def retry_after(self, restaurant_slug: str, username: str, client_ip: Optional[str]) -> float:
+        """Check before doing any lookup or hashing"""
+        wait = max(
+            self.credentials.retry_after((restaurant_slug, username)),
+            self.ips.retry_after(client_ip) if client_ip else 0.0
+        )
+        if wait > 0:
+            self.rejected += 1
+        return wait
+
+    def acquire(self, restaurant_slug: str, username: str, client_ip: Optional[str]) -> float:
+        """Like `retry_after`, but reserves the attempt when allowed; `release` it once verified"""
+        wait = self.retry_after(restaurant_slug, username, client_ip)
+        if not wait:
+            self.credentials.acquire((restaurant_slug, username))
+            if client_ip:
+                self.ips.acquire(client_ip)
+        return wait
+
+    def release(self, restaurant_slug: str, username: str, client_ip: Optional[str]):
+        self.credentials.release((restaurant_slug, username))
+        if client_ip:
+            self.ips.release(client_ip)
+
+    def record_failure(self, restaurant_slug: str, username: str, client_ip: Optional[str]):
+        self.credentials.record_failure((restaurant_slug, username))
+        if client_ip:
+            self.ips.record_failure(client_ip)
+
+    def record_success(self, restaurant_slug: str, username: str):
+        self.credentials.reset((restaurant_slug, username))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_credentials": len(self.credentials),
+            "tracked_ips": len(self.ips),
+            "rejected": self.rejected
+        }